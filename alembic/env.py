@@ -8,21 +8,21 @@ from alembic import context
 # Добавляем путь до проекта, чтобы работал импорт моделей
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-# Импортируем Base и модели
-from db import Base
+# Импортируем Base и модели (все — иначе autogenerate не увидит таблицы)
+from db import Base, DATABASE_URL
 from models import (
-    # Feature_limits,
+    Feature_limits,
     User,
-    # Transactions,
-    # Categories,
-    # Accounts,
-    # Limits,
-    # Debts,
-    # Targets,
-    # RepeatOperations,
-    # OperationsRepeat,
-    # Project,
-    # Tasks,
+    Transactions,
+    Categories,
+    Accounts,
+    Limits,
+    Debts,
+    Targets,
+    RepeatOperations,
+    OperationsRepeat,
+    Project,
+    Tasks,
 )
 
 # Конфигурация Alembic
@@ -32,6 +32,9 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
+# Адрес БД берём тот же, что и приложение (переменная окружения DATABASE_URL)
+config.set_main_option("sqlalchemy.url", DATABASE_URL.replace("%", "%%"))
+
 # Устанавливаем метаданные моделей
 target_metadata = Base.metadata
 
@@ -0,0 +1,46 @@
+"""add transactions import hash
+
+Revision ID: 3b7f9c2d5e61
+Revises: 845e5adaaa38
+Create Date: 2026-10-17 22:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b7f9c2d5e61'
+down_revision: Union[str, Sequence[str], None] = '845e5adaaa38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Колонка без значения по умолчанию — добавляется без перезаписи таблицы
+    op.add_column('transactions', sa.Column('import_hash', sa.String(length=64), nullable=True))
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'uq_transactions_user_id_import_hash',
+            'transactions',
+            ['user_id', 'import_hash'],
+            unique=True,
+            postgresql_where=sa.text('import_hash IS NOT NULL'),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'uq_transactions_user_id_import_hash',
+            table_name='transactions',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_column('transactions', 'import_hash')
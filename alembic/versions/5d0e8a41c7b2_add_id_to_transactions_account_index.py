@@ -0,0 +1,61 @@
+"""add id to transactions account index
+
+Revision ID: 5d0e8a41c7b2
+Revises: 3b7f9c2d5e61
+Create Date: 2026-10-17 22:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5d0e8a41c7b2'
+down_revision: Union[str, Sequence[str], None] = '3b7f9c2d5e61'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # id в ключе индекса: окно running_balance (PARTITION BY account_id ORDER BY created_at, id)
+    # читается из индекса в нужном порядке, без сортировки. Новый индекс строится до удаления старого,
+    # чтобы /users/finance не остался без индекса
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_transactions_user_id_account_id_created_at_id',
+            'transactions',
+            ['user_id', 'account_id', 'created_at', 'id'],
+            unique=False,
+            postgresql_include=['moded', 'sum'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            'ix_transactions_user_id_account_id_created_at',
+            table_name='transactions',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_transactions_user_id_account_id_created_at',
+            'transactions',
+            ['user_id', 'account_id', 'created_at'],
+            unique=False,
+            postgresql_include=['moded', 'sum'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.drop_index(
+            'ix_transactions_user_id_account_id_created_at_id',
+            table_name='transactions',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
@@ -0,0 +1,43 @@
+"""add transactions account month index
+
+Revision ID: 845e5adaaa38
+Revises: 8c1d2b7e4a90
+Create Date: 2026-10-17 21:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '845e5adaaa38'
+down_revision: Union[str, Sequence[str], None] = '8c1d2b7e4a90'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_transactions_user_id_account_id_created_at',
+            'transactions',
+            ['user_id', 'account_id', 'created_at'],
+            unique=False,
+            postgresql_include=['moded', 'sum'],
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_transactions_user_id_account_id_created_at',
+            table_name='transactions',
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
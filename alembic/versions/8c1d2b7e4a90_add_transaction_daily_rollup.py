@@ -0,0 +1,58 @@
+"""add transaction daily rollup
+
+Revision ID: 8c1d2b7e4a90
+Revises: f2e16eeb84ff
+Create Date: 2026-10-17 21:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c1d2b7e4a90'
+down_revision: Union[str, Sequence[str], None] = 'f2e16eeb84ff'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'transaction_daily_rollup',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('account_id', sa.Integer(), nullable=False),
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('moded', sa.String(length=255), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=True),
+        sa.Column('total_sum', sa.Numeric(precision=14, scale=2), nullable=False),
+        sa.Column('tx_count', sa.Integer(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'uq_transaction_daily_rollup_key',
+        'transaction_daily_rollup',
+        ['user_id', 'day', 'account_id', 'moded', sa.text('coalesce(category_id, 0)')],
+        unique=True,
+    )
+    # Заполняем агрегат по уже существующим транзакциям
+    op.execute(
+        """
+        INSERT INTO transaction_daily_rollup
+            (user_id, day, account_id, moded, category_id, total_sum, tx_count)
+        SELECT user_id, date(created_at), account_id, moded, category_id, sum(sum), count(*)
+        FROM transactions
+        GROUP BY user_id, date(created_at), account_id, moded, category_id
+        """
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('uq_transaction_daily_rollup_key', table_name='transaction_daily_rollup')
+    op.drop_table('transaction_daily_rollup')
@@ -0,0 +1,175 @@
+"""partition transactions by month
+
+Revision ID: 9a4c6e1f2b38
+Revises: 5d0e8a41c7b2
+Create Date: 2026-10-17 23:20:00.000000
+
+"""
+from datetime import date, datetime, timezone
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4c6e1f2b38'
+down_revision: Union[str, Sequence[str], None] = '5d0e8a41c7b2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Должно совпадать с routers/partitions.py
+PARTITION_MONTHS_AHEAD = 3
+
+COLUMNS = (
+    'id, sum, currency, moded, repeat_operation, balance, category_id, account_id, user_id, '
+    'debt_id, target_id, limit_id, task_id, import_hash, created_at, updated_at'
+)
+
+
+def _add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _transactions_columns(id_default):
+    return [
+        sa.Column('id', sa.Integer(), server_default=id_default, nullable=False),
+        sa.Column('sum', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.Column('currency', postgresql.ENUM(name='currencyenum', create_type=False), nullable=False),
+        sa.Column('moded', sa.String(length=255), nullable=False),
+        sa.Column('repeat_operation', sa.Boolean(), nullable=True),
+        sa.Column('balance', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.Column('category_id', sa.Integer(), nullable=True),
+        sa.Column('account_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('debt_id', sa.Integer(), nullable=True),
+        sa.Column('target_id', sa.Integer(), nullable=True),
+        sa.Column('limit_id', sa.Integer(), nullable=True),
+        sa.Column('task_id', sa.Integer(), nullable=True),
+        sa.Column('import_hash', sa.String(length=64), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['account_id'], ['accounts.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['debt_id'], ['debts.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['target_id'], ['targets.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['limit_id'], ['limits.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ondelete='SET NULL'),
+    ]
+
+
+def _create_indexes(import_hash_columns):
+    op.create_index('ix_transactions_id', 'transactions', ['id'], unique=False)
+    op.create_index('ix_transactions_user_id_created_at', 'transactions', ['user_id', 'created_at', 'id'], unique=False)
+    op.create_index(
+        'ix_transactions_user_id_account_id_created_at_id',
+        'transactions',
+        ['user_id', 'account_id', 'created_at', 'id'],
+        unique=False,
+        postgresql_include=['moded', 'sum'],
+    )
+    op.create_index(
+        'uq_transactions_user_id_import_hash',
+        'transactions',
+        import_hash_columns,
+        unique=True,
+        postgresql_where=sa.text('import_hash IS NOT NULL'),
+    )
+
+
+def _drop_indexes():
+    for name in (
+        'ix_transactions_id',
+        'ix_transactions_user_id_created_at',
+        'ix_transactions_user_id_account_id_created_at_id',
+        'uq_transactions_user_id_import_hash',
+    ):
+        op.execute(f'DROP INDEX IF EXISTS {name}')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Таблица пересоздаётся секционированной и заполняется копированием: на время
+    # миграции запись в transactions заблокирована — запускать в окно обслуживания.
+    # Ключ секций обязан входить в первичный и уникальные ключи, поэтому PK — (id, created_at),
+    # а внешний ключ operations_repeat.transaction_id снимается (каскад удаления — в приложении)
+    op.drop_constraint('operations_repeat_transaction_id_fkey', 'operations_repeat', type_='foreignkey')
+    op.create_index('ix_operations_repeat_transaction_id', 'operations_repeat', ['transaction_id'], unique=False)
+
+    op.execute('LOCK TABLE transactions IN ACCESS EXCLUSIVE MODE')
+    op.rename_table('transactions', 'transactions_legacy')
+    op.execute('ALTER TABLE transactions_legacy RENAME CONSTRAINT transactions_pkey TO transactions_legacy_pkey')
+    _drop_indexes()
+
+    op.create_table(
+        'transactions',
+        *_transactions_columns(sa.text("nextval('transactions_id_seq'::regclass)")),
+        sa.PrimaryKeyConstraint('id', 'created_at'),
+        postgresql_partition_by='RANGE (created_at)',
+    )
+    # Последовательность id переходит к новой таблице и не удаляется вместе со старой
+    op.execute('ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id')
+
+    bind = op.get_bind()
+    first = bind.scalar(sa.text(
+        "SELECT date_trunc('month', min(created_at) AT TIME ZONE 'UTC')::date FROM transactions_legacy"
+    ))
+    current = datetime.now(timezone.utc).date().replace(day=1)
+    month = min(first, current) if first else current
+    last = _add_months(current, PARTITION_MONTHS_AHEAD)
+    while month <= last:
+        upper = _add_months(month, 1)
+        op.execute(
+            f"CREATE TABLE transactions_y{month.year:04d}m{month.month:02d} PARTITION OF transactions "
+            f"FOR VALUES FROM ('{month.isoformat()} 00:00:00+00') TO ('{upper.isoformat()} 00:00:00+00')"
+        )
+        month = upper
+    op.execute('CREATE TABLE transactions_default PARTITION OF transactions DEFAULT')
+
+    # created_at теперь NOT NULL: у старых строк без даты берём дату изменения
+    op.execute(
+        f"""
+        INSERT INTO transactions ({COLUMNS})
+        SELECT {COLUMNS.replace('created_at', 'coalesce(created_at, updated_at, now())')}
+        FROM transactions_legacy
+        """
+    )
+    # Индексы строим по заполненной таблице — так быстрее, чем поддерживать их при копировании
+    _create_indexes(['user_id', 'import_hash', 'created_at'])
+    op.drop_table('transactions_legacy')
+    op.execute('ANALYZE transactions')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.execute('LOCK TABLE transactions IN ACCESS EXCLUSIVE MODE')
+    op.rename_table('transactions', 'transactions_partitioned')
+    op.execute(
+        'ALTER TABLE transactions_partitioned RENAME CONSTRAINT transactions_pkey TO transactions_partitioned_pkey'
+    )
+    _drop_indexes()
+
+    op.create_table(
+        'transactions',
+        *_transactions_columns(sa.text("nextval('transactions_id_seq'::regclass)")),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.alter_column('transactions', 'created_at', nullable=True)
+    op.execute('ALTER SEQUENCE transactions_id_seq OWNED BY transactions.id')
+    op.execute(f'INSERT INTO transactions ({COLUMNS}) SELECT {COLUMNS} FROM transactions_partitioned')
+    _create_indexes(['user_id', 'import_hash'])
+    # Секции удаляются вместе с родительской таблицей
+    op.drop_table('transactions_partitioned')
+
+    op.drop_index('ix_operations_repeat_transaction_id', table_name='operations_repeat')
+    op.execute(
+        'DELETE FROM operations_repeat WHERE transaction_id IS NOT NULL '
+        'AND transaction_id NOT IN (SELECT id FROM transactions)'
+    )
+    op.create_foreign_key(
+        'operations_repeat_transaction_id_fkey', 'operations_repeat', 'transactions',
+        ['transaction_id'], ['id'], ondelete='CASCADE',
+    )
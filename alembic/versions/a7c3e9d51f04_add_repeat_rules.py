@@ -0,0 +1,131 @@
+"""add repeat rules
+
+Revision ID: a7c3e9d51f04
+Revises: e5b2d8f14c93
+Create Date: 2026-10-18 02:00:00.000000
+
+"""
+from datetime import datetime, time, timedelta, timezone
+from typing import Sequence, Union
+
+from alembic import op
+from dateutil.relativedelta import relativedelta
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a7c3e9d51f04'
+down_revision: Union[str, Sequence[str], None] = 'e5b2d8f14c93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Должно совпадать с routers/recurrence.py
+HORIZON_DAYS = 366
+STEPS = {
+    'day': relativedelta(days=1),
+    'week': relativedelta(weeks=1),
+    'month': relativedelta(months=1),
+    'year': relativedelta(years=1),
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'repeat_rules',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('balance', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.Column('moded', sa.String(length=255), nullable=False),
+        sa.Column('name', sa.Text(), nullable=False),
+        sa.Column('interval', sa.String(length=255), nullable=False),
+        sa.Column('anchor_date', sa.Date(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=True),
+        sa.Column('until', sa.Date(), nullable=True),
+        sa.Column('exceptions', postgresql.ARRAY(sa.Date()), server_default=sa.text("'{}'"), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=True),
+        sa.Column('account_id', sa.Integer(), nullable=False),
+        sa.Column('debt_id', sa.Integer(), nullable=True),
+        sa.Column('target_id', sa.Integer(), nullable=True),
+        sa.Column('limit_id', sa.Integer(), nullable=True),
+        sa.Column('task_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['account_id'], ['accounts.id'], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['debt_id'], ['debts.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['target_id'], ['targets.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['limit_id'], ['limits.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index('ix_repeat_rules_id', 'repeat_rules', ['id'], unique=False)
+    op.create_index('ix_repeat_rules_user_id', 'repeat_rules', ['user_id'], unique=False)
+    op.create_index('ix_repeat_rules_account_id', 'repeat_rules', ['account_id'], unique=False)
+
+    # Выполненные повторения правил остаются строками repeat_operations со ссылкой на правило.
+    # Уже созданные строки — отдельные операции (rule_id NULL) и работают как раньше
+    for table in ('repeat_operations', 'repeat_operations_archive'):
+        op.add_column(table, sa.Column('rule_id', sa.Integer(), nullable=True))
+        op.create_foreign_key(
+            f'{table}_rule_id_fkey', table, 'repeat_rules', ['rule_id'], ['id'], ondelete='SET NULL'
+        )
+    op.create_index(
+        'uq_repeat_operations_rule_id_planned_date',
+        'repeat_operations',
+        ['rule_id', 'planned_date'],
+        unique=True,
+        postgresql_where=sa.text('rule_id IS NOT NULL'),
+    )
+
+
+def _materialize_rules():
+    """Невыполненные повторения правил — обратно отдельными строками (бессрочные — на год вперёд)"""
+    bind = op.get_bind()
+    horizon = datetime.now(timezone.utc).date() + timedelta(days=HORIZON_DAYS)
+    rules = bind.execute(sa.text(
+        'SELECT id, balance, moded, name, interval, anchor_date, count, until, exceptions, user_id, '
+        'category_id, account_id, debt_id, target_id, limit_id, task_id FROM repeat_rules'
+    )).mappings().all()
+    for rule in rules:
+        done = set(bind.execute(
+            sa.text(
+                "SELECT (planned_date AT TIME ZONE 'UTC')::date FROM repeat_operations WHERE rule_id = :id "
+                "UNION SELECT (planned_date AT TIME ZONE 'UTC')::date FROM repeat_operations_archive WHERE rule_id = :id"
+            ),
+            {'id': rule['id']},
+        ).scalars())
+        skipped = set(rule['exceptions'] or []) | done
+        last = min(filter(None, [rule['until'], horizon]))
+        index = 0
+        while rule['count'] is None or index < rule['count']:
+            day = rule['anchor_date'] + STEPS[rule['interval']] * index
+            if day > last:
+                break
+            index += 1
+            if day in skipped:
+                continue
+            bind.execute(
+                sa.text(
+                    'INSERT INTO repeat_operations (balance, moded, planned_date, name, completed, user_id, '
+                    'category_id, account_id, debt_id, target_id, limit_id, task_id) '
+                    'VALUES (:balance, :moded, :planned_date, :name, false, :user_id, '
+                    ':category_id, :account_id, :debt_id, :target_id, :limit_id, :task_id)'
+                ),
+                {**rule, 'planned_date': datetime.combine(day, time.min, tzinfo=timezone.utc)},
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _materialize_rules()
+    op.drop_index('uq_repeat_operations_rule_id_planned_date', table_name='repeat_operations')
+    for table in ('repeat_operations', 'repeat_operations_archive'):
+        op.drop_constraint(f'{table}_rule_id_fkey', table, type_='foreignkey')
+        op.drop_column(table, 'rule_id')
+    op.drop_index('ix_repeat_rules_account_id', table_name='repeat_rules')
+    op.drop_index('ix_repeat_rules_user_id', table_name='repeat_rules')
+    op.drop_index('ix_repeat_rules_id', table_name='repeat_rules')
+    op.drop_table('repeat_rules')
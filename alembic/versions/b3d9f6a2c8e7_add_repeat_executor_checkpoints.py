@@ -0,0 +1,34 @@
+"""add repeat executor checkpoints
+
+Revision ID: b3d9f6a2c8e7
+Revises: a7c3e9d51f04
+Create Date: 2026-10-18 03:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b3d9f6a2c8e7'
+down_revision: Union[str, Sequence[str], None] = 'a7c3e9d51f04'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'repeat_executor_checkpoints',
+        sa.Column('timezone', sa.String(length=255), nullable=False),
+        sa.Column('processed_through', sa.Date(), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.PrimaryKeyConstraint('timezone'),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('repeat_executor_checkpoints')
@@ -0,0 +1,126 @@
+"""add archive tables
+
+Revision ID: c4e8b1d07a52
+Revises: 9a4c6e1f2b38
+Create Date: 2026-10-18 00:10:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c4e8b1d07a52'
+down_revision: Union[str, Sequence[str], None] = '9a4c6e1f2b38'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'transactions_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('sum', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.Column('currency', postgresql.ENUM(name='currencyenum', create_type=False), nullable=False),
+        sa.Column('moded', sa.String(length=255), nullable=False),
+        sa.Column('repeat_operation', sa.Boolean(), nullable=True),
+        sa.Column('balance', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.Column('category_id', sa.Integer(), nullable=True),
+        sa.Column('account_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('debt_id', sa.Integer(), nullable=True),
+        sa.Column('target_id', sa.Integer(), nullable=True),
+        sa.Column('limit_id', sa.Integer(), nullable=True),
+        sa.Column('task_id', sa.Integer(), nullable=True),
+        sa.Column('import_hash', sa.String(length=64), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['account_id'], ['accounts.id']),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['debt_id'], ['debts.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['target_id'], ['targets.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['limit_id'], ['limits.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_transactions_archive_user_id_created_at', 'transactions_archive',
+        ['user_id', 'created_at', 'id'], unique=False,
+    )
+    op.create_index(
+        'ix_transactions_archive_user_id_account_id_created_at_id', 'transactions_archive',
+        ['user_id', 'account_id', 'created_at', 'id'], unique=False,
+        postgresql_include=['moded', 'sum'],
+    )
+    op.create_index(
+        'uq_transactions_archive_user_id_import_hash', 'transactions_archive',
+        ['user_id', 'import_hash'], unique=True,
+        postgresql_where=sa.text('import_hash IS NOT NULL'),
+    )
+
+    op.create_table(
+        'repeat_operations_archive',
+        sa.Column('id', sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column('balance', sa.Numeric(precision=10, scale=2), nullable=True),
+        sa.Column('moded', sa.String(length=255), nullable=False),
+        sa.Column('planned_date', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('name', sa.Text(), nullable=False),
+        sa.Column('completed', sa.Boolean(), nullable=True),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('category_id', sa.Integer(), nullable=True),
+        sa.Column('account_id', sa.Integer(), nullable=False),
+        sa.Column('debt_id', sa.Integer(), nullable=True),
+        sa.Column('target_id', sa.Integer(), nullable=True),
+        sa.Column('limit_id', sa.Integer(), nullable=True),
+        sa.Column('task_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('updated_at', sa.DateTime(timezone=True), nullable=True),
+        sa.Column('archived_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['account_id'], ['accounts.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['debt_id'], ['debts.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['target_id'], ['targets.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['limit_id'], ['limits.id'], ondelete='SET NULL'),
+        sa.ForeignKeyConstraint(['task_id'], ['tasks.id'], ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(
+        'ix_repeat_operations_archive_user_id_planned_date', 'repeat_operations_archive',
+        ['user_id', 'planned_date'], unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Архивные строки возвращаются в рабочие таблицы, иначе они потеряются вместе с архивом
+    op.execute(
+        """
+        INSERT INTO repeat_operations (id, balance, moded, planned_date, name, completed, user_id, category_id,
+                                       account_id, debt_id, target_id, limit_id, task_id, created_at, updated_at)
+        SELECT id, balance, moded, planned_date, name, completed, user_id, category_id,
+               account_id, debt_id, target_id, limit_id, task_id, created_at, updated_at
+        FROM repeat_operations_archive
+        """
+    )
+    op.execute(
+        """
+        INSERT INTO transactions (id, sum, currency, moded, repeat_operation, balance, category_id, account_id,
+                                  user_id, debt_id, target_id, limit_id, task_id, import_hash, created_at, updated_at)
+        SELECT id, sum, currency, moded, repeat_operation, balance, category_id, account_id,
+               user_id, debt_id, target_id, limit_id, task_id, import_hash, created_at, updated_at
+        FROM transactions_archive
+        """
+    )
+    op.drop_index('ix_repeat_operations_archive_user_id_planned_date', table_name='repeat_operations_archive')
+    op.drop_table('repeat_operations_archive')
+    op.drop_index('uq_transactions_archive_user_id_import_hash', table_name='transactions_archive')
+    op.drop_index('ix_transactions_archive_user_id_account_id_created_at_id', table_name='transactions_archive')
+    op.drop_index('ix_transactions_archive_user_id_created_at', table_name='transactions_archive')
+    op.drop_table('transactions_archive')
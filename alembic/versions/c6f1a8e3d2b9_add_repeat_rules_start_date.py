@@ -0,0 +1,56 @@
+"""add repeat rules start date
+
+Revision ID: c6f1a8e3d2b9
+Revises: b3d9f6a2c8e7
+Create Date: 2026-10-18 04:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+from dateutil.relativedelta import relativedelta
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c6f1a8e3d2b9'
+down_revision: Union[str, Sequence[str], None] = 'b3d9f6a2c8e7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Должно совпадать с routers/recurrence.py
+STEPS = {
+    'day': relativedelta(days=1),
+    'week': relativedelta(weeks=1),
+    'month': relativedelta(months=1),
+    'year': relativedelta(years=1),
+}
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Правило, отделённое от серии «с этой даты»: общий anchor_date, повторения с start_date
+    op.add_column('repeat_rules', sa.Column('start_date', sa.Date(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Без start_date серия начинается с первого своего повторения; отсечение по концу месяца
+    # после этого считается от новой даты начала
+    bind = op.get_bind()
+    rules = bind.execute(sa.text(
+        'SELECT id, interval, anchor_date, count, start_date FROM repeat_rules WHERE start_date > anchor_date'
+    )).mappings().all()
+    for rule in rules:
+        index = 0
+        while rule['anchor_date'] + STEPS[rule['interval']] * index < rule['start_date']:
+            index += 1
+        bind.execute(
+            sa.text('UPDATE repeat_rules SET anchor_date = :anchor_date, count = :count WHERE id = :id'),
+            {
+                'id': rule['id'],
+                'anchor_date': rule['anchor_date'] + STEPS[rule['interval']] * index,
+                'count': None if rule['count'] is None else max(rule['count'] - index, 1),
+            },
+        )
+    op.drop_column('repeat_rules', 'start_date')
@@ -0,0 +1,34 @@
+"""add transactions debt paid
+
+Revision ID: d8a4b2e6f1c3
+Revises: c6f1a8e3d2b9
+Create Date: 2026-10-18 05:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8a4b2e6f1c3'
+down_revision: Union[str, Sequence[str], None] = 'c6f1a8e3d2b9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in ('transactions', 'transactions_archive'):
+        op.add_column(table, sa.Column('debt_paid', sa.Numeric(precision=10, scale=2), nullable=True))
+        # Сколько погасили старые транзакции, уже не узнать: считаем, что всю сумму (как отменялись раньше)
+        op.execute(
+            f"UPDATE {table} SET debt_paid = sum WHERE debt_id IS NOT NULL AND moded = 'income'"
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in ('transactions', 'transactions_archive'):
+        op.drop_column(table, 'debt_paid')
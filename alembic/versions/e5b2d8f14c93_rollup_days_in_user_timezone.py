@@ -0,0 +1,52 @@
+"""rollup days in user timezone
+
+Revision ID: e5b2d8f14c93
+Revises: c4e8b1d07a52
+Create Date: 2026-10-18 01:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e5b2d8f14c93'
+down_revision: Union[str, Sequence[str], None] = 'c4e8b1d07a52'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _rebuild_rollup(day_expression: str):
+    op.execute('DELETE FROM transaction_daily_rollup')
+    op.execute(
+        f"""
+        INSERT INTO transaction_daily_rollup
+            (user_id, day, account_id, moded, category_id, total_sum, tx_count)
+        SELECT t.user_id, {day_expression}, t.account_id, t.moded, t.category_id, sum(t.sum), count(*)
+        FROM (
+            SELECT user_id, account_id, moded, category_id, sum, created_at FROM transactions
+            UNION ALL
+            SELECT user_id, account_id, moded, category_id, sum, created_at FROM transactions_archive
+        ) t
+        JOIN users ON users.id = t.user_id
+        GROUP BY t.user_id, {day_expression}, t.account_id, t.moded, t.category_id
+        """
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Часовой пояс теперь участвует в запросах: неизвестные PostgreSQL имена сбрасываем (= UTC)
+    op.execute(
+        'UPDATE users SET timezone = NULL '
+        'WHERE timezone IS NOT NULL AND timezone NOT IN (SELECT name FROM pg_timezone_names)'
+    )
+    # День агрегата — дата операции в поясе пользователя (см. routers/rollup.py)
+    _rebuild_rollup("date(timezone(coalesce(users.timezone, 'UTC'), t.created_at))")
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _rebuild_rollup('date(t.created_at)')
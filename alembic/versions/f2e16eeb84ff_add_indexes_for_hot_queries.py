@@ -0,0 +1,60 @@
+"""add indexes for hot queries
+
+Revision ID: f2e16eeb84ff
+Revises: f8e27766f79c
+Create Date: 2026-10-17 20:40:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f2e16eeb84ff'
+down_revision: Union[str, Sequence[str], None] = 'f8e27766f79c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# (имя, таблица, колонки, условие частичного индекса)
+INDEXES = [
+    ('ix_transactions_user_id_created_at', 'transactions', ['user_id', 'created_at', 'id'], None),
+    ('ix_repeat_operations_user_id_completed_planned_date', 'repeat_operations', ['user_id', 'completed', 'planned_date'], None),
+    ('ix_repeat_operations_account_id_planned_date', 'repeat_operations', ['account_id', 'planned_date'], None),
+    ('ix_repeat_operations_planned_date_pending', 'repeat_operations', ['planned_date'], 'completed = false'),
+    ('ix_limits_user_id_category_id', 'limits', ['user_id', 'category_id'], None),
+    ('ix_project_user_id_created_at', 'project', ['user_id', 'created_at'], None),
+    ('ix_tasks_project_id_completed_date_end', 'tasks', ['project_id', 'completed', 'date_end'], None),
+    ('ix_tasks_date_end', 'tasks', ['date_end'], None),
+    ('ix_users_payment_expires_at_active', 'users', ['payment_expires_at'], 'payment_is_active = true'),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CONCURRENTLY не блокирует запись в таблицы, но не работает внутри транзакции
+    with op.get_context().autocommit_block():
+        for name, table, columns, where in INDEXES:
+            op.create_index(
+                name,
+                table,
+                columns,
+                unique=False,
+                postgresql_where=sa.text(where) if where else None,
+                postgresql_concurrently=True,
+                if_not_exists=True,
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, _, _ in reversed(INDEXES):
+            op.drop_index(
+                name,
+                table_name=table,
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
@@ -3,12 +3,19 @@ from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import jwt, JWTError
 from pydantic import BaseModel
 from datetime import datetime, timedelta
-from db import SessionLocal
+from collections import OrderedDict
+from db import get_db
 from models import User
+from prometheus_client import Counter
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import Optional, Dict, Any, List
 from models import CategoriTypeEnum,  LanguageTypeEnum # Импортируйте вашу модель пользователя
 import logging
+import os
+import threading
+import time
 # Настройка логгирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -35,13 +42,81 @@ class TokenPayload(BaseModel):
     role:CategoriTypeEnum
     language: LanguageTypeEnum
 
-# Зависимость для получения сессии базы данных
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+
+# Кэш контекста пользователя (id, роль, язык) для guard_role
+USER_AUTH_CACHE_MAXSIZE = int(os.getenv("USER_AUTH_CACHE_MAXSIZE", "10000"))
+USER_AUTH_CACHE_TTL = float(os.getenv("USER_AUTH_CACHE_TTL", "60"))  # сек
+
+USER_AUTH_CACHE_HITS = Counter("auth_user_cache_hits_total", "Попадания в кэш пользователей guard_role")
+USER_AUTH_CACHE_MISSES = Counter("auth_user_cache_misses_total", "Промахи кэша пользователей guard_role")
+
+
+class UserAuthCache:
+    """
+    LRU-кэш с TTL для TokenPayload по user_id.
+    Общий для потоков процесса (планировщик тоже инвалидирует записи), поэтому под блокировкой.
+    """
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data: "OrderedDict[int, tuple[float, TokenPayload]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[TokenPayload]:
+        with self._lock:
+            item = self._data.get(user_id)
+            if item is None:
+                return None
+            expires_at, payload = item
+            if expires_at < time.monotonic():
+                del self._data[user_id]
+                return None
+            self._data.move_to_end(user_id)
+            return payload
+
+    def set(self, user_id: int, payload: TokenPayload) -> None:
+        with self._lock:
+            self._data[user_id] = (time.monotonic() + self.ttl, payload)
+            self._data.move_to_end(user_id)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._data.pop(user_id, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+user_auth_cache = UserAuthCache(USER_AUTH_CACHE_MAXSIZE, USER_AUTH_CACHE_TTL)
+
+
+def invalidate_user_auth(user_id: int) -> None:
+    """Сбросить кэш guard_role после изменения строки пользователя"""
+    user_auth_cache.invalidate(user_id)
+
+
+# Удалённый пользователь не должен проходить guard_role до истечения TTL.
+# Сбрасываем кэш после commit: до него параллельный запрос ещё видит строку и вернул бы её в кэш
+@event.listens_for(Session, "after_flush")
+def _collect_deleted_users(session, flush_context):
+    deleted = [obj.id for obj in session.deleted if isinstance(obj, User)]
+    if deleted:
+        session.info.setdefault("deleted_user_ids", set()).update(deleted)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_deleted_users(session):
+    for user_id in session.info.pop("deleted_user_ids", ()):
+        invalidate_user_auth(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_deleted_users(session):
+    session.info.pop("deleted_user_ids", None)
 
 def create_access_token(data: TokenPayload) -> str:
     try:
@@ -99,7 +174,7 @@ def guard_role(required_roles: Optional[List[str]] = None,
                ):
     async def dependency(
         credentials: HTTPAuthorizationCredentials = Depends(security),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
         ) -> TokenPayload:
         token = credentials.credentials
         logger.info(f"Token: {token}")
@@ -111,17 +186,23 @@ def guard_role(required_roles: Optional[List[str]] = None,
 
 
             user = TokenPayload(**payload)
-             # Получение пользователя из БД
-            user_in_db:User = db.query(User).filter(User.id == user.user_id).first()
-            if not user_in_db:
-                raise HTTPException(status_code=401, detail="User not found")
-
-            
-            user_actual = TokenPayload(
-                user_id=user_in_db.id,
-                role=user_in_db.role,
-                language=user_in_db.language
-            )
+            user_actual = user_auth_cache.get(user.user_id)
+            if user_actual is not None:
+                USER_AUTH_CACHE_HITS.inc()
+            else:
+                USER_AUTH_CACHE_MISSES.inc()
+                 # Получение пользователя из БД
+                user_in_db:User = await db.get(User, user.user_id)
+                if not user_in_db:
+                    raise HTTPException(status_code=401, detail="User not found")
+
+                
+                user_actual = TokenPayload(
+                    user_id=user_in_db.id,
+                    role=user_in_db.role,
+                    language=user_in_db.language
+                )
+                user_auth_cache.set(user_actual.user_id, user_actual)
             
             logger.info(f"User from DB: {user_actual}")
           
@@ -57,4 +57,23 @@ class TransactionsTypeEnum(str, Enum):
 class AccountsUnderEnum(str, Enum):
     goals = 'goals' # Цели
     limits = 'limits' # Правила
-    debts = 'debts' # Долги
\ No newline at end of file
+    debts = 'debts' # Долги
+
+class StatementFormatEnum(str, Enum):
+    csv = 'csv'
+    ofx = 'ofx'
+
+class ExportFormatEnum(str, Enum):
+    csv = 'csv'
+    ndjson = 'ndjson'
+
+class AnalyticsBucketEnum(str, Enum):
+    day = 'day'
+    week = 'week'
+    month = 'month'
+    year = 'year'
+
+class AnalyticsGroupByEnum(str, Enum):
+    category = 'category'
+    account = 'account'
+    moded = 'moded'
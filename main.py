@@ -2,17 +2,20 @@ from fastapi import FastAPI
 import db
 from db import Base, engine
 from models import User, Transactions
-from routers import users, transactions, categories,accounts,  debts, limits, targets, operationsrepeat, project, tasks, ai, balance_forecast, piy
+from routers import users, transactions, categories,accounts,  debts, limits, targets, operationsrepeat, project, tasks, ai, balance_forecast, piy, analytics
 from routers.limits import reset_limits_logic  # импортируем функцию сброса
-from routers.operationsrepeat import repeat_operation  # импортируем функцию повторения операций
-from routers.users import remove_payment #Сброс подписки у юзера
+from routers.operationsrepeat import repeat_operation_logic  # импортируем функцию повторения операций
+from routers.users import remove_payment_logic #Сброс подписки у юзера
+from routers.partitions import ensure_transaction_partitions  # помесячные секции transactions
+from routers.archive import archive_old_rows  # перенос старых строк в архив
 from auth import auth
 from fastapi.openapi.utils import get_openapi
 from fastapi.middleware.cors import CORSMiddleware
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.triggers.cron import CronTrigger
-from db import SessionLocal
+from db import SessionLocal, JobAsyncSessionLocal
 import asyncio  # Добавь в импорты
+from datetime import datetime
 from prometheus_fastapi_instrumentator import Instrumentator
 # Создание таблиц в базе данных
 Base.metadata.create_all(bind=engine)
@@ -35,7 +38,7 @@ def scheduled_reset_limits():
 def scheduled_remove_payment():
     db = SessionLocal()
     try:
-        result = remove_payment(db)
+        result = remove_payment_logic(db)
         if result:
             print("Сброс подписки выполнен!")
         else:
@@ -45,19 +48,42 @@ def scheduled_remove_payment():
     finally:
         db.close()  
         
-          
-async def scheduled_repeat_operation():
+
+
+def scheduled_transaction_partitions():
     db = SessionLocal()
     try:
-        result = await repeat_operation(db)
-        if result:
-            print("Операции для повтора выполнены!")
-        else:
-            print("Операции для повтора не найдены.")
+        created = ensure_transaction_partitions(db)
+        if created:
+            print(f"Созданы секции транзакций: {', '.join(created)}")
+    except Exception as e:
+        db.rollback()
+        print(f"Ошибка создания секций транзакций в планировщике: {e}")
+    finally:
+        db.close()
+
+
+
+def scheduled_archive():
+    db = SessionLocal()
+    try:
+        result = archive_old_rows(db)
+        print(f"Архивация выполнена: транзакций {result['transactions']}, операций {result['repeat_operations']}")
     except Exception as e:
-        print(f"Ошибка повторения операций в планировщике: {e}")
+        db.rollback()
+        print(f"Ошибка архивации в планировщике: {e}")
     finally:
         db.close()
+          
+async def scheduled_repeat_operation():
+    # Задача выполняется в отдельном event loop, поэтому сессия без общего пула
+    async with JobAsyncSessionLocal() as db:
+        try:
+            result = await repeat_operation_logic(db)
+            print(f"Операции для повтора: выполнено {result['processed']}, "
+                  f"с ошибками {result['failed']} за {result['duration']} с")
+        except Exception as e:
+            print(f"Ошибка повторения операций в планировщике: {e}")
 
 def run_repeat_operation():
     asyncio.run(scheduled_repeat_operation())
@@ -148,6 +174,7 @@ app.include_router(tasks.router, prefix="/api")
 app.include_router(ai.router, prefix="/api")
 app.include_router(balance_forecast.router, prefix="/api")
 app.include_router(piy.router, prefix="/api")
+app.include_router(analytics.router, prefix="/api")
 
 
 
@@ -157,8 +184,16 @@ def start_scheduler():
     # Добавляем задачу, которая выполняется раз в минуту
 
     scheduler.add_job(scheduled_reset_limits, CronTrigger.from_crontab("0 * * * *"))
-    # scheduler.add_job(run_repeat_operation, CronTrigger.from_crontab("0 * * * *"))
+    # Операции на повтор: «сегодня» у пользователей разных поясов начинается в разное время
+    # (в том числе в :30 и :45), пропущенные запуски догоняются по отметкам — и сразу при старте
+    scheduler.add_job(run_repeat_operation, CronTrigger.from_crontab("*/15 * * * *"),
+                      next_run_time=datetime.now())
     scheduler.add_job(scheduled_remove_payment, CronTrigger.from_crontab("* * * * *"))
+    # Секции transactions на ближайшие месяцы: раз в сутки и сразу при старте
+    scheduler.add_job(scheduled_transaction_partitions, CronTrigger.from_crontab("30 3 * * *"),
+                      next_run_time=datetime.now())
+    # Перенос старых транзакций и выполненных операций в архив — ночью, пачками
+    scheduler.add_job(scheduled_archive, CronTrigger.from_crontab("0 4 * * *"))
 
 
 
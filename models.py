@@ -1,10 +1,11 @@
 from enum import Enum
 from sqlalchemy import (
-    Column, Integer, Numeric, String, DateTime, Boolean, Text,
-    ForeignKey
+    Column, Integer, Numeric, String, Date, DateTime, Boolean, Text,
+    DDL, ForeignKey, Index, event, text
 )
 from sqlalchemy.sql import func
-from sqlalchemy.orm import relationship
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import query_expression, relationship
 from sqlalchemy.types import Enum as SQLAlchemyEnum
 from db import Base
 from enums import CategoriTypeEnum, CurrencyEnum, LanguageTypeEnum, OperationReapitType, RepeatInterval, CurrencyEnum, TransactionsTypeEnum, AccountsUnderEnum
@@ -32,6 +33,11 @@ class Feature_limits(Base):
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        # Поиск истёкших подписок планировщиком
+        Index("ix_users_payment_expires_at_active", "payment_expires_at",
+              postgresql_where=text("payment_is_active = true")),
+    )
     id = Column(Integer, primary_key=True, index=True)
     apple_id = Column(String(50), unique=True, nullable=True)
     tg_id = Column(String(255), unique=True, nullable=True)
@@ -75,8 +81,22 @@ class User(Base):
 
 class Transactions(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        # Список транзакций пользователя по дате (id — для стабильного порядка)
+        Index("ix_transactions_user_id_created_at", "user_id", "created_at", "id"),
+        # Итоги по счёту за период (/users/finance) и running_balance (окно по счёту в порядке created_at, id):
+        # покрывающий, читается без обращения к таблице
+        Index("ix_transactions_user_id_account_id_created_at_id", "user_id", "account_id", "created_at", "id",
+              postgresql_include=["moded", "sum"]),
+        # Дедупликация импорта выписок: одна и та же строка выписки не загружается дважды
+        # created_at в ключе — уникальный индекс секционированной таблицы обязан включать ключ секций
+        Index("uq_transactions_user_id_import_hash", "user_id", "import_hash", "created_at", unique=True,
+              postgresql_where=text("import_hash IS NOT NULL")),
+        # Помесячные секции по created_at (routers/partitions.py)
+        {"postgresql_partition_by": "RANGE (created_at)"},
+    )
 
-    id = Column(Integer, primary_key=True, index=True)
+    id = Column(Integer, primary_key=True, autoincrement=True, index=True)
     sum = Column(Numeric(10, 2))
     currency = Column(SQLAlchemyEnum(CurrencyEnum), nullable=False)
     moded = Column(String(255), nullable=False)
@@ -95,6 +115,8 @@ class Transactions(Base):
 
     debt_id = Column(Integer, ForeignKey('debts.id', ondelete='SET NULL'), nullable=True)
     debt = relationship("Debts", back_populates="transactions")
+    # Сколько транзакция реально погасила долга (погашение обрезается на нуле) — столько и возвращаем при отмене
+    debt_paid = Column(Numeric(10, 2), nullable=True)
     
     target_id = Column(Integer, ForeignKey('targets.id', ondelete='SET NULL'), nullable=True)
     target = relationship("Targets", back_populates="transactions")
@@ -104,7 +126,12 @@ class Transactions(Base):
     
      # Внешний ключ для связи с Tasks
     task_id = Column(Integer, ForeignKey('tasks.id', ondelete='SET NULL'), nullable=True)
-    operations_repeat = relationship("OperationsRepeat", back_populates="transaction", passive_deletes=True)
+    operations_repeat = relationship(
+        "OperationsRepeat",
+        back_populates="transaction",
+        primaryjoin="foreign(OperationsRepeat.transaction_id) == Transactions.id",
+        passive_deletes=True,
+    )
     # Связь один-к-одному (Transaction -> Task)
     task = relationship(
         "Tasks", 
@@ -112,10 +139,96 @@ class Transactions(Base):
         uselist=False
     )
     
-    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    # Баланс счёта после операции, считается при чтении (routers/transactions.py, running_balance_subquery);
+    # в отличие от balance не устаревает при удалении и вставке операций задним числом
+    running_balance = query_expression()
+
+    # sha256 содержимого строки выписки (routers/statement_import.py), у ручных операций — NULL
+    import_hash = Column(String(64), nullable=True)
+
+    # Ключ секций, поэтому входит в первичный ключ таблицы; для ORM идентичность — только id
+    created_at = Column(DateTime(timezone=True), primary_key=True, server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __mapper_args__ = {"primary_key": [id]}
+
+
+# Секция по умолчанию — чтобы вставка не падала, пока помесячная секция не создана
+# (для баз, созданных через create_all; в миграциях создаётся явно)
+event.listen(
+    Transactions.__table__,
+    "after_create",
+    DDL("CREATE TABLE IF NOT EXISTS transactions_default PARTITION OF transactions DEFAULT"),
+)
+
+
+
+class TransactionsArchive(Base):
+    """
+    Транзакции старше горизонта архивации (routers/archive.py). Колонки — как у transactions,
+    id сохраняется; в transaction_daily_rollup архивные строки остаются учтены
+    """
+    __tablename__ = "transactions_archive"
+    __table_args__ = (
+        Index("ix_transactions_archive_user_id_created_at", "user_id", "created_at", "id"),
+        Index("ix_transactions_archive_user_id_account_id_created_at_id", "user_id", "account_id", "created_at", "id",
+              postgresql_include=["moded", "sum"]),
+        # Повторный импорт старой выписки не должен вернуть уже заархивированные строки
+        Index("uq_transactions_archive_user_id_import_hash", "user_id", "import_hash", unique=True,
+              postgresql_where=text("import_hash IS NOT NULL")),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    sum = Column(Numeric(10, 2))
+    currency = Column(SQLAlchemyEnum(CurrencyEnum), nullable=False)
+    moded = Column(String(255), nullable=False)
+    repeat_operation = Column(Boolean, default=False)
+    balance = Column(Numeric(10, 2))
+    category_id = Column(Integer, ForeignKey('categories.id', ondelete="SET NULL"), nullable=True)
+    account_id = Column(Integer, ForeignKey('accounts.id'), nullable=False)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='SET NULL'), nullable=False)
+    debt_id = Column(Integer, ForeignKey('debts.id', ondelete='SET NULL'), nullable=True)
+    debt_paid = Column(Numeric(10, 2), nullable=True)
+    target_id = Column(Integer, ForeignKey('targets.id', ondelete='SET NULL'), nullable=True)
+    limit_id = Column(Integer, ForeignKey('limits.id', ondelete='SET NULL'), nullable=True)
+    task_id = Column(Integer, ForeignKey('tasks.id', ondelete='SET NULL'), nullable=True)
+    import_hash = Column(String(64), nullable=True)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    updated_at = Column(DateTime(timezone=True))
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class TransactionDailyRollup(Base):
+    """
+    Суммы транзакций по дням в разрезе счёта, типа и категории.
+    Обновляется вместе с транзакциями (routers/rollup.py), пересобирается scripts/rebuild_rollup.py
+    """
+    __tablename__ = "transaction_daily_rollup"
+
+    id = Column(Integer, primary_key=True)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    account_id = Column(Integer, nullable=False)
+    day = Column(Date, nullable=False)
+    moded = Column(String(255), nullable=False)
+    # Без внешнего ключа: при удалении категории строки переносит delete_user_category
+    category_id = Column(Integer, nullable=True)
+    total_sum = Column(Numeric(14, 2), nullable=False, default=0)
+    tx_count = Column(Integer, nullable=False, default=0)
+
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
 
 
+# Ключ агрегата; category_id может быть NULL, поэтому в индексе coalesce
+Index(
+    "uq_transaction_daily_rollup_key",
+    TransactionDailyRollup.user_id,
+    TransactionDailyRollup.day,
+    TransactionDailyRollup.account_id,
+    TransactionDailyRollup.moded,
+    func.coalesce(TransactionDailyRollup.category_id, 0),
+    unique=True,
+)
+
 
 class Categories(Base):
     __tablename__ = "categories"
@@ -137,7 +250,7 @@ class Categories(Base):
     )
 
     user_id = Column(Integer, ForeignKey('users.id', ondelete="SET NULL"), nullable=True)
-    user = relationship("User", back_populates="user_categories", lazy="joined")
+    user = relationship("User", back_populates="user_categories")
 
     limit = relationship("Limits", back_populates="category", uselist=False)
 
@@ -168,7 +281,7 @@ class Accounts(Base):
     tasks = relationship("Tasks", back_populates="account", cascade="all, delete-orphan")
 
     user_id = Column(Integer, ForeignKey('users.id', ondelete="SET NULL"), nullable=True)
-    user = relationship("User", back_populates="user_accounts", lazy="joined")
+    user = relationship("User", back_populates="user_accounts")
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
@@ -177,6 +290,9 @@ class Accounts(Base):
     
 class Limits(Base):
     __tablename__ = "limits"
+    __table_args__ = (
+        Index("ix_limits_user_id_category_id", "user_id", "category_id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     balance = Column(Numeric(10, 2), nullable=False)
     date_update = Column(String(255), nullable=False)
@@ -286,6 +402,18 @@ class Targets(Base):
 
 class RepeatOperations(Base):
     __tablename__ = "repeat_operations"
+    __table_args__ = (
+        # Список операций пользователя: фильтр по completed, сортировка по planned_date
+        Index("ix_repeat_operations_user_id_completed_planned_date", "user_id", "completed", "planned_date"),
+        # Прогноз баланса по счёту
+        Index("ix_repeat_operations_account_id_planned_date", "account_id", "planned_date"),
+        # Невыполненные операции на дату — для планировщика
+        Index("ix_repeat_operations_planned_date_pending", "planned_date",
+              postgresql_where=text("completed = false")),
+        # Повторение правила сохраняется строкой не больше одного раза
+        Index("uq_repeat_operations_rule_id_planned_date", "rule_id", "planned_date", unique=True,
+              postgresql_where=text("rule_id IS NOT NULL")),
+    )
     id = Column(Integer, primary_key=True, index=True)  
     balance = Column(Numeric(10, 2))
     moded = Column(String(255), nullable=False)
@@ -319,10 +447,68 @@ class RepeatOperations(Base):
     task_id = Column(Integer, ForeignKey('tasks.id', ondelete='SET NULL'), nullable=True)
     task = relationship("Tasks", back_populates="repeat_operations", passive_deletes=True)  # без uselist=False
     
+    # Правило, повторением которого является строка (NULL — отдельная операция)
+    rule_id = Column(Integer, ForeignKey('repeat_rules.id', ondelete='SET NULL'), nullable=True)
+    rule = relationship("RepeatRules", back_populates="operations")
+
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
        
 
+class RepeatRules(Base):
+    """
+    Правило повтора: одна строка на всю серию вместо строки на каждое повторение.
+    Повторения разворачиваются по запросу за нужный период (routers/recurrence.py);
+    строкой в repeat_operations повторение становится, только когда его выполнили.
+    """
+    __tablename__ = "repeat_rules"
+    __table_args__ = (
+        Index("ix_repeat_rules_user_id", "user_id"),
+        Index("ix_repeat_rules_account_id", "account_id"),
+    )
+    id = Column(Integer, primary_key=True, index=True)
+    balance = Column(Numeric(10, 2))
+    moded = Column(String(255), nullable=False)
+    name = Column(Text, nullable=False)
+    interval = Column(String(255), nullable=False)  # day, week, month, year
+    anchor_date = Column(Date, nullable=False)  # Дата первого повторения
+    count = Column(Integer, nullable=True)  # Сколько повторений (NULL — без ограничения)
+    until = Column(Date, nullable=True)  # Дата последнего повторения (NULL — бессрочно)
+    start_date = Column(Date, nullable=True)  # Повторения раньше этой даты — не этого правила (после разделения серии)
+    exceptions = Column(ARRAY(Date), nullable=False, server_default=text("'{}'"))  # Пропущенные даты
+
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='CASCADE'), nullable=False)
+    category_id = Column(Integer, ForeignKey('categories.id', ondelete="SET NULL"), nullable=True)
+    category = relationship("Categories")
+    account_id = Column(Integer, ForeignKey('accounts.id', ondelete='CASCADE'), nullable=False)
+    account = relationship("Accounts")
+    debt_id = Column(Integer, ForeignKey('debts.id', ondelete='SET NULL'), nullable=True)
+    debt = relationship("Debts")
+    target_id = Column(Integer, ForeignKey('targets.id', ondelete='SET NULL'), nullable=True)
+    target = relationship("Targets")
+    limit_id = Column(Integer, ForeignKey('limits.id', ondelete='SET NULL'), nullable=True)
+    limit = relationship("Limits")
+    task_id = Column(Integer, ForeignKey('tasks.id', ondelete='SET NULL'), nullable=True)
+    task = relationship("Tasks")
+
+    operations = relationship("RepeatOperations", back_populates="rule", passive_deletes=True)
+
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
+class RepeatExecutorCheckpoint(Base):
+    """
+    Отметка планировщика операций на повтор по часовому поясу: дни до processed_through
+    включительно уже обработаны. После простоя следующий запуск продолжает с processed_through + 1
+    """
+    __tablename__ = "repeat_executor_checkpoints"
+
+    timezone = Column(String(255), primary_key=True)  # IANA-имя пояса пользователей ('UTC' — без пояса)
+    processed_through = Column(Date, nullable=False)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+
 class OperationsRepeat(Base):
     __tablename__ = "operations_repeat"
     id = Column(Integer, primary_key=True, index=True)
@@ -332,13 +518,18 @@ class OperationsRepeat(Base):
     user_id = Column(Integer, ForeignKey('users.id', ondelete="CASCADE"), nullable=False)
     user = relationship("User", back_populates="user_operations_repeat") 
 
-    # Связь с Transactions (необязательная)
+    # Связь с Transactions (необязательная). Без внешнего ключа: ключ секционированной
+    # transactions — (id, created_at), строки удаляются вместе с транзакцией в delete_transaction
     transaction_id = Column(
         Integer, 
-        ForeignKey('transactions.id', ondelete="CASCADE"), 
-        nullable=True  # Изменили на True, чтобы связь была необязательной
+        nullable=True,  # Изменили на True, чтобы связь была необязательной
+        index=True
+    )
+    transaction = relationship(
+        "Transactions",
+        back_populates="operations_repeat",
+        primaryjoin="foreign(OperationsRepeat.transaction_id) == Transactions.id",
     )
-    transaction = relationship("Transactions", back_populates="operations_repeat")
     
     # Связь с Debts (необязательная)
     debt_id = Column(
@@ -365,8 +556,36 @@ class OperationsRepeat(Base):
 
 
 
+class RepeatOperationsArchive(Base):
+    """Выполненные операции на повторе старше горизонта архивации (routers/archive.py)"""
+    __tablename__ = "repeat_operations_archive"
+    __table_args__ = (
+        Index("ix_repeat_operations_archive_user_id_planned_date", "user_id", "planned_date"),
+    )
+    id = Column(Integer, primary_key=True, autoincrement=False)
+    balance = Column(Numeric(10, 2))
+    moded = Column(String(255), nullable=False)
+    planned_date = Column(DateTime(timezone=True), nullable=False)
+    name = Column(Text, nullable=False)
+    completed = Column(Boolean, default=False)
+    user_id = Column(Integer, ForeignKey('users.id', ondelete='SET NULL'), nullable=False)
+    category_id = Column(Integer, ForeignKey('categories.id', ondelete="SET NULL"), nullable=True)
+    account_id = Column(Integer, ForeignKey('accounts.id', ondelete='SET NULL'), nullable=False)
+    debt_id = Column(Integer, ForeignKey('debts.id', ondelete='SET NULL'), nullable=True)
+    target_id = Column(Integer, ForeignKey('targets.id', ondelete='SET NULL'), nullable=True)
+    limit_id = Column(Integer, ForeignKey('limits.id', ondelete='SET NULL'), nullable=True)
+    task_id = Column(Integer, ForeignKey('tasks.id', ondelete='SET NULL'), nullable=True)
+    created_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True))
+    rule_id = Column(Integer, ForeignKey('repeat_rules.id', ondelete='SET NULL'), nullable=True)
+    archived_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
 class Project(Base):
     __tablename__ = "project"
+    __table_args__ = (
+        Index("ix_project_user_id_created_at", "user_id", "created_at"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     name = Column(Text, nullable=False)
     color = Column(String(255), nullable=False)
@@ -386,6 +605,11 @@ class Project(Base):
 
 class Tasks(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # Задачи проекта и ближайшие задачи по дедлайну
+        Index("ix_tasks_project_id_completed_date_end", "project_id", "completed", "date_end"),
+        Index("ix_tasks_date_end", "date_end"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     name = Column(Text, nullable=False)
     date_end = Column(DateTime(timezone=True), nullable=False)
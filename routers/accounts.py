@@ -1,8 +1,9 @@
 from fastapi import APIRouter, HTTPException, status, Depends, Query, Response
 from typing import List
 from models import Accounts, TransactionsTypeEnum, User, Categories  # Добавляем импорт модели Transaction
-from db import SessionLocal
-from sqlalchemy.orm import Session
+from db import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import load_only
 from pydantic import BaseModel, validator
 from datetime import datetime
@@ -24,35 +25,28 @@ router = APIRouter(
     tags=["accounts"],  # Группировка в Swagger UI
 )
 
-# Зависимость для получения сессии базы данных
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-        
 # Получить все аккаунты пользователя
 @router.get("/",
             summary="Получить аккаунты пользователя (user/admin)",
             response_model=List[AccountResponse],
             status_code=status.HTTP_200_OK)
-def get_accounts(
+async def get_accounts(
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     archive:bool =  Query( description="Архив", example=False),
     
     ):
     try:
         logger.info(f"Получение аккаунтов для user_id: {current_user}")
         user_id = current_user.user_id
-        accounts = db.query(Accounts)
+        query = select(Accounts)
         if user_id is not None:
             # Если указан user_id
-            accounts = accounts.filter(Accounts.user_id == user_id)
+            query = query.where(Accounts.user_id == user_id)
         # .filter(Accounts.user_id == user_id).all()
         # if date_from:
-            accounts = accounts.filter(Accounts.archive == archive)
+            query = query.where(Accounts.archive == archive)
+        accounts = (await db.execute(query)).scalars().all()
         
         if not accounts:
             raise HTTPException(status_code=404, detail="No accounts found")
@@ -69,12 +63,12 @@ def get_accounts(
             summary="Создание нового счета (user/admin)",
             response_model=AccountResponse, 
             status_code=status.HTTP_201_CREATED)
-def create_account(
+async def create_account(
     account: AccountCreate, 
     current_user: TokenPayload = Depends(guard_role(
         ["admin", "user"], 
         limit_key="account_management",)),
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_db)):
     logger.info(f"Создание аккаунта для user_id: {current_user}")
     new_account = Accounts(
         name=account.name,
@@ -84,8 +78,8 @@ def create_account(
         user_id=current_user.user_id,  # Подразумеваем, что это передается в запросе
     )
     db.add(new_account)
-    db.commit()
-    db.refresh(new_account)
+    await db.commit()
+    await db.refresh(new_account)
     return new_account
 
 # Редактирование аккаунта
@@ -93,7 +87,7 @@ def create_account(
             summary="Редактирование аккаунта (user/admin)",
             # response_model=AccountResponse,
             )
-def update_account(
+async def update_account(
     account_id: int, 
     update_data: AccountUpdate,
     current_user: TokenPayload = Depends(guard_role(
@@ -101,7 +95,7 @@ def update_account(
         
         
         )), 
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_db)):
     """
     Обновляет данные счета.
     - Можно обновлять отдельные поля (name, currency, balance, archive)
@@ -109,7 +103,7 @@ def update_account(
     """
     try:
         logger.info(f"Обновляем счет для user_id: {current_user.role} {current_user.user_id}")
-        account:Accounts = db.query(Accounts).filter(Accounts.id == account_id).first()
+        account:Accounts = await db.get(Accounts, account_id)
         if not account:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -131,13 +125,13 @@ def update_account(
         if update_data.archive is not None:
             account.archive = update_data.archive
         
-        db.commit()
-        db.refresh(account)
+        await db.commit()
+        await db.refresh(account)
         
         return account
     
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при обновлении счета: {str(e)}"
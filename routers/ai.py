@@ -1,9 +1,9 @@
 from datetime import datetime
 import logging
 from typing import Optional
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from auth.auth import TokenPayload, guard_role
-from db import SessionLocal
+from db import get_db
 from fastapi import APIRouter, Body, HTTPException, status, Depends, Query
 import httpx
 import json
@@ -21,12 +21,6 @@ router = APIRouter(
     tags=["ai"],
 )
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 # Pydantic модель для тела запроса
 class PromptRequest(BaseModel):
     prompt: str
@@ -35,7 +29,7 @@ class PromptRequest(BaseModel):
     
 @router.post("/finance", summary="Финансовая консультация прогноз (admin/user)")
 async def finance_ask(  
-            db: Session = Depends(get_db),
+            db: AsyncSession = Depends(get_db),
             
             current_user: TokenPayload = Depends(guard_role(["admin", "user" ], limit_key="open_ai_balance")),
             account_id: int = Query(None, description="id счета", example=1),
@@ -49,7 +43,7 @@ async def finance_ask(
                         role="user",     # если модель требует отдельное поле role
                         language="ru"    # или другое значение по умолчанию
                 )
-        operations = get_operations(db, user_current_data, account_id, date_from, date_to)
+        operations = await get_operations(db, user_current_data, account_id, date_from, date_to)
 
 # Ты профессиональный финансовый консультант. На основе предоставленных будущих финансовых операций (доходы и расходы с датами и остатками на счёте), проанализируй моё финансовое состояние и сделай прогноз.
 #  Формат данных:
@@ -94,7 +88,7 @@ async def finance_ask(
                     response = await client.post(url, headers=headers, json=json_body)
                     response.raise_for_status()
                     data = response.json()
-                    subtract_open_ai_balance(db, current_user.user_id)
+                    await db.run_sync(subtract_open_ai_balance, current_user.user_id)
                     json_str = data.get("response", "")
                     if not json_str:
                         logger.error("Пустой ответ в поле 'response'")
@@ -120,7 +114,7 @@ async def finance_ask(
 async def ask_task(
     current_user: TokenPayload = Depends(guard_role(["admin", "user" ], limit_key="open_ai_tasks")),
     prompt: PromptRequest = Body(..., description="Текст запроса для AI"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     url = "http://147.45.171.136/task"
     headers = {"Content-Type": "application/json"}
@@ -134,7 +128,7 @@ async def ask_task(
             async with httpx.AsyncClient(timeout=timeout) as client:
                 response = await client.post(url, headers=headers, json=json_body)
                 response.raise_for_status()
-                subtract_open_ai_tasks(db, current_user.user_id)
+                await db.run_sync(subtract_open_ai_tasks, current_user.user_id)
                 data = response.json()
                 json_str = data.get("response", "")
                 if not json_str:
@@ -0,0 +1,209 @@
+from datetime import date
+from typing import Optional
+from dateutil.relativedelta import relativedelta
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import Date, DateTime, String, and_, cast, func, literal, literal_column, null, select, true
+from sqlalchemy.dialects.postgresql import aggregate_order_by
+from sqlalchemy.ext.asyncio import AsyncSession
+from auth.auth import TokenPayload, guard_role
+from db import get_db
+from enums import AnalyticsBucketEnum, AnalyticsGroupByEnum, TransactionsTypeEnum
+from models import Accounts, Categories, TransactionDailyRollup, User
+from routers.piy import UNCATEGORIZED_COLOR
+from routers.timezones import user_today
+from schemas import AnalyticsSeriesResponse
+import logging
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+router = APIRouter(
+    prefix="/analytics",
+    tags=["analytics"],
+)
+
+# Шаг generate_series для корзины
+BUCKET_STEPS = {
+    AnalyticsBucketEnum.day: "1 day",
+    AnalyticsBucketEnum.week: "1 week",
+    AnalyticsBucketEnum.month: "1 month",
+    AnalyticsBucketEnum.year: "1 year",
+}
+# Сколько корзин показывать, если date_from не передан
+DEFAULT_BUCKETS = {
+    AnalyticsBucketEnum.day: 31,
+    AnalyticsBucketEnum.week: 12,
+    AnalyticsBucketEnum.month: 12,
+    AnalyticsBucketEnum.year: 5,
+}
+# Примерная длина корзины в днях — для ограничения размера ответа
+BUCKET_DAYS = {
+    AnalyticsBucketEnum.day: 1,
+    AnalyticsBucketEnum.week: 7,
+    AnalyticsBucketEnum.month: 28,
+    AnalyticsBucketEnum.year: 365,
+}
+MAX_BUCKETS = 1000
+
+
+def bucket_of(bucket: AnalyticsBucketEnum, value):
+    """Начало корзины для даты. Единица — литералом, чтобы выражение в SELECT и GROUP BY совпадало"""
+    return cast(func.date_trunc(literal_column(f"'{bucket.value}'"), cast(value, DateTime)), Date)
+
+
+def default_date_from(bucket: AnalyticsBucketEnum, date_to: date) -> date:
+    """Начало самой ранней из DEFAULT_BUCKETS последних корзин — чтобы первая корзина была полной"""
+    count = DEFAULT_BUCKETS[bucket] - 1
+    if bucket == AnalyticsBucketEnum.day:
+        return date_to - relativedelta(days=count)
+    if bucket == AnalyticsBucketEnum.week:
+        start = date_to - relativedelta(weeks=count)
+        return start - relativedelta(days=start.weekday())
+    if bucket == AnalyticsBucketEnum.month:
+        return (date_to - relativedelta(months=count)).replace(day=1)
+    return (date_to - relativedelta(years=count)).replace(month=1, day=1)
+
+
+def series_queries(user_id: int, bucket: AnalyticsBucketEnum, date_from: date, date_to: date,
+                   group_by: Optional[AnalyticsGroupByEnum] = None, moded=None, account_id=None):
+    """
+    Запросы (корзины, ряды) по transaction_daily_rollup.
+    Ряд — одна строка: ключ группы и массив сумм по всем корзинам периода,
+    пустые корзины заполнены нулями (generate_series x ключи LEFT JOIN суммы).
+    """
+    rollup = TransactionDailyRollup
+    step = literal_column(f"interval '{BUCKET_STEPS[bucket]}'")
+    buckets = select(
+        cast(
+            func.generate_series(
+                cast(bucket_of(bucket, literal(date_from, Date)), DateTime),
+                cast(literal(date_to, Date), DateTime),
+                step,
+            ),
+            Date,
+        ).label("bucket")
+    ).subquery("buckets")
+
+    keys_by_group = {
+        AnalyticsGroupByEnum.category: rollup.category_id,
+        AnalyticsGroupByEnum.account: rollup.account_id,
+        AnalyticsGroupByEnum.moded: rollup.moded,
+    }
+    key = cast(keys_by_group[group_by], String) if group_by else null()
+
+    filters = [rollup.user_id == user_id, rollup.day >= date_from, rollup.day <= date_to]
+    if moded:
+        filters.append(rollup.moded == moded)
+    if account_id:
+        filters.append(rollup.account_id == account_id)
+    # Корзину каждой строки считаем в подзапросе, а группируем по его колонкам
+    rows = select(
+        bucket_of(bucket, rollup.day).label("bucket"),
+        key.label("key"),
+        rollup.total_sum.label("value"),
+    ).where(*filters).subquery("rows")
+    sums = (
+        select(rows.c.bucket, rows.c.key, func.sum(rows.c.value).label("value"))
+        .group_by(rows.c.bucket, rows.c.key)
+        .subquery("sums")
+    )
+    if group_by:
+        keys = select(sums.c.key).distinct().subquery("keys")
+    else:
+        # Без группировки ряд один, даже если за период операций не было
+        keys = select(null().label("key")).subquery("keys")
+
+    value = func.coalesce(sums.c.value, 0)
+    series = (
+        select(
+            keys.c.key,
+            func.array_agg(aggregate_order_by(value, buckets.c.bucket)).label("values"),
+            func.sum(value).label("total"),
+        )
+        .select_from(buckets)
+        .join(keys, true())
+        .outerjoin(sums, and_(sums.c.bucket == buckets.c.bucket, sums.c.key.is_not_distinct_from(keys.c.key)))
+        .group_by(keys.c.key)
+        .subquery("series")
+    )
+
+    if group_by == AnalyticsGroupByEnum.category:
+        names = select(
+            series,
+            func.coalesce(Categories.name, "Без категории").label("name"),
+            func.coalesce(Categories.color, UNCATEGORIZED_COLOR).label("color"),
+        ).outerjoin(Categories, cast(Categories.id, String) == series.c.key)
+    elif group_by == AnalyticsGroupByEnum.account:
+        names = select(series, Accounts.name.label("name"), null().label("color")).outerjoin(
+            Accounts, cast(Accounts.id, String) == series.c.key
+        )
+    else:
+        names = select(series, func.coalesce(series.c.key, "total").label("name"), null().label("color"))
+    return (
+        select(buckets.c.bucket).order_by(buckets.c.bucket),
+        names.order_by(series.c.total.desc(), series.c.key),
+    )
+
+
+@router.get("/series",
+            response_model=AnalyticsSeriesResponse,
+            summary="Суммы операций по дням/неделям/месяцам/годам для графиков")
+async def get_series(
+    db: AsyncSession = Depends(get_db),
+    current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
+    bucket: AnalyticsBucketEnum = Query(AnalyticsBucketEnum.day, description="Размер корзины day/week/month/year"),
+    group_by: Optional[AnalyticsGroupByEnum] = Query(None, description="Разбить на ряды по category/account/moded"),
+    date_from: Optional[date] = Query(None, description="Начальная дата (в формате YYYY-MM-DD)", example="2025-01-01"),
+    date_to: Optional[date] = Query(None, description="Конечная дата включительно (в формате YYYY-MM-DD)", example="2025-12-31"),
+    moded: TransactionsTypeEnum = Query(None, description="Тип операции income/expense", example="expense"),
+    account_id: int = Query(None, description="id счета", example=1),
+):
+    """
+    Временной ряд сумм операций, посчитанный в БД по суточным агрегатам.
+
+    Параметры:
+    - bucket: размер корзины (неделя начинается с понедельника)
+    - group_by: отдельный ряд на каждую категорию, счёт или тип операции
+    - date_from / date_to: период (дни — по часовому поясу пользователя);
+      по умолчанию — последние 31 день / 12 недель / 12 месяцев / 5 лет
+    - moded, account_id: фильтры
+
+    Возвращает:
+    - buckets: начала корзин периода, без пропусков
+    - series: ряды; values[i] — сумма за buckets[i] (0, если операций не было), total — сумма ряда
+    """
+    logger.info(f"Аналитика ({bucket.value}, {group_by}) для user_id: {current_user.user_id}")
+    user = await db.get(User, current_user.user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+
+    date_to = date_to or user_today(user.timezone)
+    date_from = date_from or default_date_from(bucket, date_to)
+    if date_from > date_to:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="date_from позже date_to")
+    if (date_to - date_from).days / BUCKET_DAYS[bucket] > MAX_BUCKETS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Слишком длинный период: больше {MAX_BUCKETS} корзин, увеличьте bucket"
+        )
+
+    buckets_query, series_query = series_queries(user.id, bucket, date_from, date_to, group_by, moded, account_id)
+    buckets = (await db.execute(buckets_query)).scalars().all()
+    rows = (await db.execute(series_query)).all()
+    return {
+        "bucket": bucket.value,
+        "date_from": date_from,
+        "date_to": date_to,
+        "buckets": buckets,
+        "series": [
+            {
+                "key": row.key,
+                "name": row.name,
+                "color": row.color,
+                "values": [float(value) for value in row.values],
+                "total": float(row.total),
+            }
+            for row in rows
+        ],
+    }
@@ -0,0 +1,125 @@
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+from sqlalchemy import delete, insert, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session, aliased
+from models import RepeatOperations, RepeatOperationsArchive, Transactions, TransactionsArchive
+from routers.partitions import drop_empty_partitions_before, month_start
+import logging
+# Настройка логгирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Холодный архив: транзакции старше горизонта и давно выполненные операции на повторе
+# переносятся пачками в transactions_archive / repeat_operations_archive.
+# transaction_daily_rollup при переносе не меняется — агрегат описывает всю историю,
+# вместе с архивом. Ручки чтения подключают архив, только если запрошенный период
+# задевает архивные строки пользователя (transactions_source / repeat_operations_source).
+
+# Горизонты архивации и размер пачки, сутки / строки
+ARCHIVE_TRANSACTIONS_AFTER_DAYS = int(os.getenv("ARCHIVE_TRANSACTIONS_AFTER_DAYS", "730"))
+ARCHIVE_REPEAT_OPERATIONS_AFTER_DAYS = int(os.getenv("ARCHIVE_REPEAT_OPERATIONS_AFTER_DAYS", "365"))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", "5000"))
+
+
+def move_batch(db: Session, model, archive_model, condition, order_by, batch_size: int) -> int:
+    """
+    Перенести одну пачку строк model, подходящих под condition, в archive_model
+    одним запросом (DELETE ... RETURNING -> INSERT). Строки, заблокированные
+    другими транзакциями, пропускаются до следующего прохода. Без commit.
+    """
+    table = model.__table__
+    columns = [column.name for column in table.c]
+    batch = (
+        select(table.c.id)
+        .where(condition)
+        .order_by(order_by)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    )
+    # condition повторяется в самом DELETE — чтобы по transactions отсекались лишние секции
+    moved = delete(table).where(table.c.id.in_(batch), condition).returning(*table.c).cte("moved")
+    result = db.execute(
+        insert(archive_model.__table__).from_select(columns, select(*[moved.c[name] for name in columns]))
+    )
+    return result.rowcount
+
+
+def archive_rows(db: Session, model, archive_model, condition, order_by,
+                 batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """Переносить пачками, пока есть что переносить; каждая пачка — своя транзакция"""
+    total = 0
+    while True:
+        moved = move_batch(db, model, archive_model, condition, order_by, batch_size)
+        db.commit()
+        total += moved
+        if moved < batch_size:
+            return total
+
+
+def archive_old_rows(db: Session, now: Optional[datetime] = None) -> dict:
+    """
+    Задача планировщика: перенести в архив транзакции старше ARCHIVE_TRANSACTIONS_AFTER_DAYS
+    и выполненные операции на повторе старше ARCHIVE_REPEAT_OPERATIONS_AFTER_DAYS,
+    затем удалить опустевшие помесячные секции transactions.
+    """
+    now = now or datetime.now(timezone.utc)
+    transactions_cutoff = now - timedelta(days=ARCHIVE_TRANSACTIONS_AFTER_DAYS)
+    operations_cutoff = now - timedelta(days=ARCHIVE_REPEAT_OPERATIONS_AFTER_DAYS)
+
+    transactions = archive_rows(
+        db, Transactions, TransactionsArchive,
+        Transactions.created_at < transactions_cutoff,
+        Transactions.created_at,
+    )
+    operations = archive_rows(
+        db, RepeatOperations, RepeatOperationsArchive,
+        (RepeatOperations.completed == True) & (RepeatOperations.planned_date < operations_cutoff),
+        RepeatOperations.planned_date,
+    )
+    dropped = drop_empty_partitions_before(db, month_start(transactions_cutoff.date()))
+    db.commit()
+    logger.info(
+        f"Архивация: транзакций {transactions}, операций на повторе {operations}, "
+        f"удалено пустых секций {len(dropped)}"
+    )
+    return {"transactions": transactions, "repeat_operations": operations, "dropped_partitions": dropped}
+
+
+def with_archive(model, archive_model):
+    """ORM-сущность model поверх UNION ALL горячей и архивной таблиц"""
+    table = model.__table__
+    columns = [column.name for column in table.c]
+    hot = select(*table.c)
+    cold = select(*[archive_model.__table__.c[name] for name in columns])
+    return aliased(model, union_all(hot, cold).subquery(table.name))
+
+
+async def archive_reaches(db: AsyncSession, archive_model, date_column, user_id: int,
+                          date_from=None, date_to=None) -> bool:
+    """Есть ли у пользователя архивные строки в периоде — одна проба по индексу (user_id, дата)"""
+    column = getattr(archive_model, date_column)
+    query = select(archive_model.id).where(archive_model.user_id == user_id)
+    if date_from:
+        query = query.where(column >= date_from)
+    if date_to:
+        query = query.where(column <= date_to)
+    return bool(await db.scalar(select(query.exists())))
+
+
+async def transactions_source(db: AsyncSession, user_id: int, date_from=None, date_to=None):
+    """Transactions или, если период задевает архив, Transactions вместе с transactions_archive"""
+    if await archive_reaches(db, TransactionsArchive, "created_at", user_id, date_from, date_to):
+        return with_archive(Transactions, TransactionsArchive)
+    return Transactions
+
+
+async def repeat_operations_source(db: AsyncSession, user_id: int, date_from=None, date_to=None,
+                                   completed: Optional[bool] = None):
+    """То же для операций на повторе; в архиве только выполненные"""
+    if completed is not False and await archive_reaches(
+        db, RepeatOperationsArchive, "planned_date", user_id, date_from, date_to
+    ):
+        return with_archive(RepeatOperations, RepeatOperationsArchive)
+    return RepeatOperations
@@ -5,9 +5,11 @@ from typing import Optional
 from fastapi import APIRouter, Body, HTTPException, status, Depends, Query
 import logging
 from auth.auth import guard_role, TokenPayload
-from db import SessionLocal
-from sqlalchemy.orm import Session
+from db import get_db
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from models import Accounts, Debts, RepeatOperations, Targets
+from routers.recurrence import account_occurrences
 import calendar
 from typing import List, Dict
 
@@ -22,12 +24,6 @@ router = APIRouter(
     tags=["balance_forecast"],
 )
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
 
 
@@ -137,8 +133,8 @@ def build_forecast(data) -> List[Dict]:
 @router.get("/operations", 
              summary="Собрать операции прогноза баланса",
              status_code=status.HTTP_201_CREATED)
-def get_operations(
-    db: Session = Depends(get_db),
+async def get_operations(
+    db: AsyncSession = Depends(get_db),
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
     account_id: int = Query(None, description="id счета", example=1),
     date_from: Optional[datetime] = Query(None, description="Начальная дата для фильтрации (planned_date >= date_from)", example="2025-05-01"),
@@ -146,7 +142,7 @@ def get_operations(
 ):
     user_id = current_user.user_id
         # Получаем  баланс счета
-    accaunt = db.query(Accounts).filter(Accounts.id == account_id, Accounts.user_id == user_id).first()
+    accaunt = await db.scalar(select(Accounts).where(Accounts.id == account_id, Accounts.user_id == user_id))
     if not accaunt:
         logger.error(f"Счет не найден: {str(account_id)}")
         raise HTTPException(
@@ -157,7 +153,7 @@ def get_operations(
     
       
     # Получаем транзакции 
-    query = db.query(RepeatOperations).filter(
+    query = select(RepeatOperations).where(
         RepeatOperations.account_id == account_id,
         RepeatOperations.user_id == user_id
         # RepeatOperations.debt_id == None,
@@ -165,36 +161,38 @@ def get_operations(
         
     )
     if date_from:
-        query = query.filter(RepeatOperations.planned_date >= date_from)
+        query = query.where(RepeatOperations.planned_date >= date_from)
     if date_to:
-        query = query.filter(RepeatOperations.planned_date <= date_to)
-    operations = query.all()
+        query = query.where(RepeatOperations.planned_date <= date_to)
+    operations = (await db.execute(query)).scalars().all()
+    # Повторения правил строк не имеют — разворачиваем их за период прогноза
+    operations += await account_occurrences(db, user_id, account_id, date_from, date_to)
     
-    def get_debts():
-            query = db.query(Debts).filter(
+    async def get_debts():
+            query = select(Debts).where(
                 Debts.account_id == account_id,
                 Debts.user_id == user_id,
             )
             if date_from:
-                query = query.filter(Debts.date_end >= date_from)
+                query = query.where(Debts.date_end >= date_from)
             if date_to:
-                query = query.filter(Debts.date_end <= date_to)
-            return query.all()
+                query = query.where(Debts.date_end <= date_to)
+            return (await db.execute(query)).scalars().all()
 
 
-    def get_targets():
-        query = db.query(Targets).filter(
+    async def get_targets():
+        query = select(Targets).where(
             Targets.account_id == account_id,
             Targets.user_id == user_id,
         )
         if date_from:
-            query = query.filter(Targets.date_end >= date_from)
+            query = query.where(Targets.date_end >= date_from)
         if date_to:
-            query = query.filter(Targets.date_end <= date_to)
-        return query.all() 
+            query = query.where(Targets.date_end <= date_to)
+        return (await db.execute(query)).scalars().all() 
     
-    debts_list = get_debts()
-    targets_list = get_targets()
+    debts_list = await get_debts()
+    targets_list = await get_targets()
     # "moded": "income",
     # "name": "string",
     #  "balance": 100000,
@@ -219,8 +217,8 @@ def get_operations(
 
 
 @router.get("/generate", summary="Собрать прогноз баланса")
-def generate_balance_forecast(
-    db: Session = Depends(get_db),
+async def generate_balance_forecast(
+    db: AsyncSession = Depends(get_db),
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
     account_id: int = Query(None, description="id счета", example=1),
     date_from: Optional[datetime] = Query(None, description="Начальная дата для фильтрации (planned_date >= date_from)", example="2025-05-01"),
@@ -235,12 +233,12 @@ def generate_balance_forecast(
        
     
         # Получаем  баланс счета
-        accaunt = db.query(Accounts).filter(Accounts.id == account_id, Accounts.user_id == user_id).first()
+        accaunt = await db.scalar(select(Accounts).where(Accounts.id == account_id, Accounts.user_id == user_id))
         print(accaunt)
         initial_balance = accaunt.balance  # баланс на 1 июня 2025
 
-        def get_operations(moded_type,):
-            query = db.query(RepeatOperations).filter(
+        async def get_operations(moded_type,):
+            query = select(RepeatOperations).where(
                 RepeatOperations.account_id == account_id,
                 RepeatOperations.user_id == user_id,
                 RepeatOperations.moded == moded_type
@@ -249,36 +247,37 @@ def generate_balance_forecast(
 
             )
             if date_from:
-                query = query.filter(RepeatOperations.planned_date >= date_from)
+                query = query.where(RepeatOperations.planned_date >= date_from)
             if date_to:
-                query = query.filter(RepeatOperations.planned_date <= date_to)
-            return query.all()
-        def get_debts():
-            query = db.query(Debts).filter(
+                query = query.where(RepeatOperations.planned_date <= date_to)
+            operations = (await db.execute(query)).scalars().all()
+            return operations + await account_occurrences(db, user_id, account_id, date_from, date_to, moded_type)
+        async def get_debts():
+            query = select(Debts).where(
                 Debts.account_id == account_id,
                 Debts.user_id == user_id,
             )
             if date_from:
-                query = query.filter(Debts.date_end >= date_from)
+                query = query.where(Debts.date_end >= date_from)
             if date_to:
-                query = query.filter(Debts.date_end <= date_to)
-            return query.all()
+                query = query.where(Debts.date_end <= date_to)
+            return (await db.execute(query)).scalars().all()
 
 
-        def get_targets():
-            query = db.query(Targets).filter(
+        async def get_targets():
+            query = select(Targets).where(
                 Targets.account_id == account_id,
                 Targets.user_id == user_id,
             )
             if date_from:
-                query = query.filter(Targets.date_end >= date_from)
+                query = query.where(Targets.date_end >= date_from)
             if date_to:
-                query = query.filter(Targets.date_end <= date_to)
-            return query.all()        
+                query = query.where(Targets.date_end <= date_to)
+            return (await db.execute(query)).scalars().all()        
         #     date_end
         # Получаем списки операций
-        incomes_list = get_operations("income")
-        expenses_list = get_operations("expense")
+        incomes_list = await get_operations("income")
+        expenses_list = await get_operations("expense")
         # debts_list = get_debts()
         # targets_list = get_targets()
 
@@ -2,9 +2,11 @@ from fastapi import APIRouter, HTTPException, status, Depends, Query, Response
 from typing import List
 
 
-from models import TransactionsTypeEnum,Limits, User, Categories  # Добавляем импорт модели Transaction
-from db import SessionLocal
-from sqlalchemy.orm import Session
+from models import TransactionsTypeEnum,Limits, User, Categories, Transactions  # Добавляем импорт модели Transaction
+from db import get_db
+from routers.rollup import move_category_to_uncategorized
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import load_only
 from pydantic import BaseModel, validator
 from datetime import datetime
@@ -26,20 +28,12 @@ router = APIRouter(
     tags=["categories"],  # Группировка в Swagger UI
 )
 
-# Зависимость для получения сессии базы данных
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 
-def get_category_by_user_id(category_id, db):
+async def get_category_by_user_id(category_id, db):
     """
     Получение категории по id
     """
-    return db.query(Categories).filter(Categories.id == category_id).first()
+    return await db.get(Categories, category_id)
 
 
 @router.get("/all", 
@@ -59,12 +53,12 @@ async def get_all_categories(
         None,
         description="Если задано, то фильтрует категории по имени."
     ),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     
 ):
     try:
         logger.info(f"Получение категорий для user_id: {current_user}")
-        query = db.query(Categories)
+        query = select(Categories)
         logger.info(query)
         user_id = current_user.user_id
         
@@ -72,17 +66,17 @@ async def get_all_categories(
         if user_id is not None:
             # Если указан user_id
             if include_base:
-                query = query.filter(
+                query = query.where(
                     (Categories.user_id == user_id) | 
                     (Categories.type == 'admin')
                 )
             else:
-                query = query.filter(Categories.user_id == user_id)
+                query = query.where(Categories.user_id == user_id)
                 
         if name_filter:
-            query = query.filter(Categories.name.ilike(f"%{name_filter}%"))  # Фильтрация по имени
+            query = query.where(Categories.name.ilike(f"%{name_filter}%"))  # Фильтрация по имени
             
-        categories = query.options(
+        query = query.options(
             load_only(
                 Categories.id,
                 Categories.name,
@@ -90,11 +84,13 @@ async def get_all_categories(
                 Categories.color,
                 Categories.svg,
                 Categories.type,
+                Categories.moded,
                 Categories.user_id,
                 Categories.created_at,
                 Categories.updated_at
             )
-        ).order_by(Categories.name).all()
+        ).order_by(Categories.name)
+        categories = (await db.execute(query)).scalars().all()
         
         return categories
     except Exception as e:
@@ -107,7 +103,7 @@ async def get_all_categories(
 async def add_category(
     category: CreateCategori,
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Добавляет новую категорию.
@@ -125,7 +121,7 @@ async def add_category(
             user_id=current_user.user_id,
             moded=TransactionsTypeEnum(category.moded),
         )
-        user = db.query(User).filter(User.id == current_user.user_id).first()
+        user = await db.get(User, current_user.user_id)
         if not user:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
@@ -134,8 +130,8 @@ async def add_category(
             
         # Сохраняем категорию
         db.add(new_category)
-        db.commit()
-        db.refresh(new_category)
+        await db.commit()
+        await db.refresh(new_category)
 
         # Формируем ответ
         response_data = {
@@ -151,7 +147,7 @@ async def add_category(
         # Перевыбрасываем уже обработанные HTTP исключения
         raise
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при создании категории: {str(e)}"
@@ -164,7 +160,7 @@ async def update_category(
     category_id: int,
     update_data: UpdateCategoryRequest,
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Обновляет данные категории.
@@ -174,7 +170,7 @@ async def update_category(
     try:
         logger.info(f"Обновляем категории для user_id: {current_user.role} {current_user.user_id}")
         # Получаем категорию из БД
-        category = db.query(Categories).filter(Categories.id == category_id).first()
+        category = await db.get(Categories, category_id)
         
         if not category:
             raise HTTPException(
@@ -202,13 +198,13 @@ async def update_category(
         if update_data.moded is not None:
             category.moded = update_data.moded
         
-        db.commit()
-        db.refresh(category)
+        await db.commit()
+        await db.refresh(category)
         
         return category
         
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при обновлении категории: {str(e)}"
@@ -222,7 +218,7 @@ async def update_category(
 async def delete_user_category(
     category_id: int,
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Требования:
@@ -231,11 +227,12 @@ async def delete_user_category(
     try:
         logger.info(f"Удалить категорию для user_id: {current_user.role} {current_user.user_id}")
         
-        category = db.query(Categories)\
-                   .filter(
+        category = await db.scalar(
+                   select(Categories)
+                   .where(
                        Categories.id == category_id,
                        Categories.user_id == current_user.user_id
-                   ).first()
+                   ))
 
         if not category:
             raise HTTPException(
@@ -245,20 +242,22 @@ async def delete_user_category(
 
         # db.delete(category)
         # db.commit()
-        if category.limit:
-            print(f"Limit ID: {category.limit.id}")
-            limit = db.query(Limits).filter(Limits.id == category.limit.id).first()
-            db.delete(limit)
-            db.commit()     
+        limit = await db.scalar(select(Limits).where(Limits.category_id == category.id))
+        if limit:
+            print(f"Limit ID: {limit.id}")
+            await db.delete(limit)
+            await db.commit()     
         else:
             print("У категории нет лимита")
         # return 20/0
-        db.delete(category)
-        db.commit()
+        # Транзакции категории (и архивные) остаются без категории — переносим их в агрегате
+        await move_category_to_uncategorized(db, category.id)
+        await db.delete(category)
+        await db.commit()
         return Response(status_code=status.HTTP_204_NO_CONTENT)
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при удалении категории: {str(e)}"
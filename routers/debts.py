@@ -1,12 +1,15 @@
 from datetime import datetime
 from typing import List
 from fastapi import APIRouter, HTTPException, status, Depends, Query, Response
-from db import SessionLocal
+from db import get_db
 from auth.auth import login, guard_role, TokenPayload
-from sqlalchemy.orm import Session, joinedload
-from models import Debts, Transactions
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from models import Debts, OperationsRepeat, Transactions
+from routers.rollup import remove_from_rollup
+from routers.transactions import transaction_response_options
 from schemas import DebtsResponse, DebtsCreate, DebtsUpdate
-from sqlalchemy import func
+from sqlalchemy import delete, func, select
 import logging
 # Настройка логгирования
 logging.basicConfig(level=logging.INFO)
@@ -18,34 +21,43 @@ router = APIRouter(
     tags=["debts"],  # Группировка в Swagger UI
 )
 
-# Зависимость для получения сессии базы данных
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Связи, которые нужны для сериализации DebtsResponse
+debt_response_options = (
+    selectinload(Debts.account),
+    selectinload(Debts.transactions).options(*transaction_response_options),
+)
 
 
-def get_debts_by_user_id(debts_id, user_id, db):
+async def get_debts_by_user_id(debts_id, user_id, db):
     """
     Получение долгов по user_id
     """
-    return db.query(Debts).filter(Debts.id == debts_id, Debts.user_id == user_id).first()
+    return await db.scalar(select(Debts).where(Debts.id == debts_id, Debts.user_id == user_id))
+
+
+async def get_debt_for_response(debt_id, db):
+    """
+    Перечитывает долг вместе со связями для ответа
+    """
+    return await db.scalar(
+        select(Debts)
+        .where(Debts.id == debt_id)
+        .options(*debt_response_options)
+    )
   
 @router.get("/",
             summary="Получить долги",
             response_model=List[DebtsResponse])
-def get_debts(
+async def get_debts(
         current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
         
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
         ):
     try:
         logger.info(f"Получение долгов для user_id: {current_user.user_id}")
         
         # Загружаем долги с подсчётом суммы транзакций
-        debts = db.query(
+        query = select(
             Debts,
             func.coalesce(func.sum(Transactions.sum), 0).label("transactions_sum")
         ).join(
@@ -53,14 +65,13 @@ def get_debts(
             Transactions.debt_id == Debts.id,
             isouter=True
         ).options(
-            joinedload(Debts.transactions),
-            joinedload(Debts.account)
+            *debt_response_options
         ).group_by(Debts.id)
         
         if current_user.role != "admin":
-            debts = debts.filter(Debts.user_id == current_user.user_id)
+            query = query.where(Debts.user_id == current_user.user_id)
         
-        debts = debts.all()
+        debts = (await db.execute(query)).all()
         
         if not debts:
             raise HTTPException(status_code=404, detail="Долги не найдены")
@@ -87,11 +98,11 @@ def get_debts(
             summary="Создать новый долг",
             response_model=DebtsResponse,
             status_code=status.HTTP_201_CREATED)
-def create_debt(
+async def create_debt(
         debt_data: DebtsCreate,
         current_user: TokenPayload = Depends(guard_role(["admin", "user"], 
         limit_key="debts")),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
         ):
     try:
         logger.info(f"Создание долга для user_id: {current_user.user_id}")
@@ -112,12 +123,11 @@ def create_debt(
         )
         
         db.add(new_debt)
-        db.commit()
-        db.refresh(new_debt)
+        await db.commit()
         
-        return new_debt
+        return await get_debt_for_response(new_debt.id, db)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при создании долга: {str(e)}"
@@ -126,17 +136,17 @@ def create_debt(
 @router.put("/{debt_id}",
            summary="Обновить информацию о долге",
            response_model=DebtsResponse)
-def update_debt(
+async def update_debt(
         debt_id: int,
         debt_data: DebtsUpdate,
         current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
         ):
     try:
         logger.info(f"Обновление долга {debt_id} для user_id: {current_user.user_id}")
         
         # Получаем долг из базы данных
-        debt = db.query(Debts).filter(Debts.id == debt_id).first()
+        debt = await db.get(Debts, debt_id)
         
         if not debt:
             raise HTTPException(
@@ -169,12 +179,11 @@ def update_debt(
         
         debt.updated_at = datetime.utcnow()
         
-        db.commit()
-        db.refresh(debt)
+        await db.commit()
         
-        return debt
+        return await get_debt_for_response(debt.id, db)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при обновлении долга: {str(e)}"
@@ -183,16 +192,16 @@ def update_debt(
 @router.delete("/{debt_id}",
               summary="Удалить долг",
               status_code=status.HTTP_204_NO_CONTENT)
-def delete_debt(
+async def delete_debt(
         debt_id: int,
         current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-        db: Session = Depends(get_db)
+        db: AsyncSession = Depends(get_db)
         ):
     try:
         logger.info(f"Удаление долга {debt_id} для user_id: {current_user.user_id}")
         
         # Получаем долг из базы данных
-        debt = db.query(Debts).filter(Debts.id == debt_id).first()
+        debt = await db.get(Debts, debt_id)
         
         if not debt:
             raise HTTPException(
@@ -207,12 +216,20 @@ def delete_debt(
                 detail="Недостаточно прав для удаления этого долга"
             )
         
-        db.delete(debt)
-        db.commit()
+        # Транзакции долга удаляет каскад ORM (Debts.transactions) в обход delete_transaction,
+        # поэтому агрегат по дням и operations_repeat (внешнего ключа на транзакции нет) чистим сами
+        transaction_ids = (await db.scalars(
+            select(Transactions.id).where(Transactions.debt_id == debt.id)
+        )).all()
+        if transaction_ids:
+            await remove_from_rollup(db, transaction_ids)
+            await db.execute(delete(OperationsRepeat).where(OperationsRepeat.transaction_id.in_(transaction_ids)))
+        await db.delete(debt)
+        await db.commit()
         
         return Response(status_code=status.HTTP_204_NO_CONTENT)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при удалении долга: {str(e)}"
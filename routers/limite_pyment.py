@@ -1,15 +1,9 @@
 from fastapi import APIRouter, HTTPException, status, Depends, Query
-from db import SessionLocal
 from sqlalchemy.orm import Session
 from models import Accounts, Debts, Feature_limits, Limits, Targets
 from sqlalchemy.exc import SQLAlchemyError
-# Зависимость для получения сессии базы данных
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Помощники здесь синхронные: их вызывает планировщик,
+# а роутеры — через AsyncSession.run_sync
 
 
 def get_limits(db: Session, user_id: int, limit_key: str = None):
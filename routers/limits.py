@@ -1,13 +1,16 @@
 from typing import List
 from fastapi import APIRouter, HTTPException, status, Depends, Query, Response
-from db import SessionLocal
+from db import get_db
 from models import Limits, User  # Добавляем импорт модели Transaction
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from datetime import datetime
+from datetime import datetime, timezone
 from auth.auth import login, guard_role, TokenPayload
 from dateutil.relativedelta import relativedelta
 import logging
 
+from routers.timezones import user_today
 from schemas import CreateLimit, LimitOut, LimitUpdate
 # Настройка логгирования
 logging.basicConfig(level=logging.INFO)
@@ -20,52 +23,45 @@ router = APIRouter(
 )
 
 
-# Зависимость для получения сессии базы данных
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
-def get_limit_by_user_id(limit_id, user_id, db):
+async def get_limit_by_user_id(limit_id, user_id, db):
     """
     Получение лимитов по user_id
     """
-    return db.query(Limits).filter(Limits.id == limit_id, Limits.user_id == user_id).first()
+    return await db.scalar(select(Limits).where(Limits.id == limit_id, Limits.user_id == user_id))
 
 @router.get("/", 
             summary="Получить лимиты", 
             response_model=List[LimitOut],
             status_code=status.HTTP_200_OK            
             )
-def get_limits(
+async def get_limits(
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    limits = db.query(Limits)
+    query = select(Limits)
     logger.info(f"Получение лимитов для user_id: {current_user.user_id}")
-    if limits is not None:
-        limits = limits.filter(Limits.user_id == current_user.user_id)
+    if query is not None:
+        query = query.where(Limits.user_id == current_user.user_id)
     else:
          raise HTTPException(status_code=404, detail="No limits found")
+    limits = (await db.execute(query)).scalars().all()
     return limits  
 
 
 @router.post("/create", summary="Создать лимит", status_code=status.HTTP_201_CREATED)
-def create_limits(
+async def create_limits(
     limit: CreateLimit,
     current_user: TokenPayload = Depends(guard_role(["admin", "user"], 
         limit_key="limits")),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         logger.info(f"Добавление категории для user_id: {current_user.user_id}")
         # 🔍 Проверка на существование лимита с такой категорией у пользователя
-        existing_limit = db.query(Limits).filter_by(
+        existing_limit = await db.scalar(select(Limits).filter_by(
             user_id=current_user.user_id,
             category_id=limit.category_id
-        ).first()
+        ))
 
         if existing_limit:
             raise HTTPException(
@@ -79,8 +75,8 @@ def create_limits(
             category_id=limit.category_id,
         )
         db.add(new_limit)
-        db.commit()
-        db.refresh(new_limit)
+        await db.commit()
+        await db.refresh(new_limit)
         return new_limit
     except Exception as e:
         logger.error(str(e))
@@ -94,9 +90,9 @@ def create_limits(
 @router.delete("/", 
                summary="Удалить лимит",
                status_code=status.HTTP_204_NO_CONTENT)
-def delete_limits(
+async def delete_limits(
     limit_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])), 
 ):
     try:
@@ -104,7 +100,7 @@ def delete_limits(
         logger.info(f"Удаление лимита {limit_id} для user_id: {user_id}")
 
         # Получаем долг из базы данных
-        limit = db.query(Limits).filter(Limits.id == limit_id).first()
+        limit = await db.get(Limits, limit_id)
         
         if not limit:
             raise HTTPException(
@@ -119,27 +115,28 @@ def delete_limits(
                 detail="Недостаточно прав для удаления этого долга"
             )
         
-        db.delete(limit)
-        db.commit()
+        await db.delete(limit)
+        await db.commit()
         
         return Response(status_code=status.HTTP_204_NO_CONTENT)
     
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при удалении долга: {str(e)}"
         )
 
 def reset_limits_logic(db: Session):
-    today = datetime.utcnow().date()
-    limits = db.query(Limits).all()
+    now = datetime.now(timezone.utc)
+    # Дата сброса сравнивается с «сегодня» в часовом поясе владельца лимита
+    limits = db.query(Limits, User.timezone).outerjoin(User, User.id == Limits.user_id).all()
     if not limits:
         return False
 
-    for limit in limits:
+    for limit, user_timezone in limits:
         date_update_obj = datetime.strptime(limit.date_update, "%Y-%m-%d").date()
-        if date_update_obj == today:
+        if date_update_obj == user_today(user_timezone, now):
             limit.current_spent = 0
             limit.updated_at = datetime.utcnow()
             new_date = date_update_obj + relativedelta(months=1)
@@ -150,14 +147,15 @@ def reset_limits_logic(db: Session):
 
 
 @router.put("/reset_all_limits", summary="Сбросить лимиты")
-def reset_all_limits(db: Session = Depends(get_db)):
+async def reset_all_limits(db: AsyncSession = Depends(get_db)):
     try:
-        result = reset_limits_logic(db)
+        # Логика общая с планировщиком, поэтому выполняем её в синхронной обёртке сессии
+        result = await db.run_sync(reset_limits_logic)
         if not result:
             raise HTTPException(status_code=404, detail="Лимиты не найдены")
         return {"message": "Лимиты сброшены (по дате обновления)"}
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Ошибка при сбросе лимитов: {str(e)}")
 
 
@@ -165,15 +163,15 @@ def reset_all_limits(db: Session = Depends(get_db)):
             response_model=LimitOut,
             status_code=status.HTTP_200_OK 
             )
-def edite_limits(
+async def edite_limits(
     limit_id: int,
     update_data:LimitUpdate,
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_db)):
     try:
         user_id = 1
         logger.info(f"Обновляем счет для user_id: {user_id}")
          # Получаем долг из базы данных
-        limit = db.query(Limits).filter(Limits.id == limit_id).first()
+        limit = await db.get(Limits, limit_id)
         
         if not limit:
             raise HTTPException(
@@ -194,12 +192,12 @@ def edite_limits(
             limit.date_update = update_data.date_update
         limit.updated_at = datetime.utcnow()
         
-        db.commit()
-        db.refresh(limit)    
+        await db.commit()
+        await db.refresh(limit)    
         return limit
     
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при обновлении лимита: {str(e)}"
@@ -1,26 +1,41 @@
 
 
 # Настройка логгирования
-from datetime import datetime, date, timedelta
+from collections import defaultdict
+from datetime import datetime, date, timedelta, timezone
+import heapq
+from itertools import islice
 import logging
+import os
+import time
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from requests import Session
-from sqlalchemy import func
+from sqlalchemy import case, delete, func, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 from auth.auth import TokenPayload, guard_role
-from db import SessionLocal
+from db import get_db
 from enums import OperationReapitType
-from models import Debts, OperationsRepeat, RepeatOperations, Targets, Transactions, User
+from models import (
+    Accounts, Debts, OperationsRepeat, RepeatExecutorCheckpoint, RepeatOperations, RepeatOperationsArchive, RepeatRules,
+    Targets, Transactions, User,
+)
+from routers.archive import repeat_operations_source
 from routers.categories import get_category_by_user_id
 from routers.debts import get_debts_by_user_id
 from routers.limits import get_limit_by_user_id
+from routers.recurrence import (
+    as_utc, expand_rules, is_rule_date, make_occurrence, materialize_occurrences, materialized_dates,
+    occurrence_row, planned_datetime, rule_dates, rule_last_date, rule_response_options, rules_query, window_dates,
+)
 from routers.tasks import get_task_by_user_id
-from routers.transactions import create_transaction
-from schemas import CreateOperationsRepeat, CreateRepeatOperation, CreateTransaction, OperationsResponse, OperationsWithLimitsResponse, RepeatOperationListOut, RepeatOperationOut
+from routers.timezones import is_valid_timezone, user_timezone_sql, user_today
+from routers.transactions import BATCH_MAX_ITEMS, apply_transactions_batch
+from schemas import CreateOperationsRepeat, CreateRepeatOperation, CreateTransaction, OperationsResponse, OperationsWithLimitsResponse, RepeatOperationListOut, RepeatOperationOut, RepeatSeriesOut, UpdateRepeatSeries, CompleteRepeatOperations, RepeatCompleteBatchResponse
 from fastapi.encoders import jsonable_encoder
 import json
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import selectinload
 from dateutil.relativedelta import relativedelta
 
 logging.basicConfig(level=logging.INFO)
@@ -32,13 +47,20 @@ router = APIRouter(
     tags=["operationsrepeat"],  # Группировка в Swagger UI
 )
 
-# Зависимость для получения сессии базы данных
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Связи, которые нужны для сериализации RepeatOperationOut
+def repeat_operation_load_options(source=RepeatOperations):
+    """Связи для RepeatOperationOut; source — RepeatOperations или её алиас вместе с архивом"""
+    return (
+        selectinload(source.category),
+        selectinload(source.account),
+        selectinload(source.debt),
+        selectinload(source.target).selectinload(Targets.account),
+        selectinload(source.limit),
+        selectinload(source.task),
+    )
+
+
+repeat_operation_response_options = repeat_operation_load_options()
 def loggger_json(data):
     """
     Функция для логирования данных в формате JSON.
@@ -53,14 +75,87 @@ def loggger_json(data):
 
 
 
+def operation_transaction(operation, posted_on: Optional[date] = None) -> CreateTransaction:
+    """
+    Данные транзакции для выполнения операции на повторе (строки или повторения правила).
+    posted_on — день проведения по часам пользователя (полночь); без него транзакция — текущим временем
+    """
+    return CreateTransaction(
+        sum=operation.balance,
+        moded=operation.moded,
+        repeat_operation=False,  # Указываем, что это повторная операция
+        account_id=operation.account_id,
+        category_id=operation.category_id if operation.category_id else None,
+        debt_id=operation.debt_id if operation.debt_id else None,
+        target_id=operation.target_id if operation.target_id else None,
+        limit_id=operation.limit_id if operation.limit_id else None,
+        task_id=operation.task_id if operation.task_id else None,
+        date_operation=datetime.combine(posted_on, datetime.min.time()) if posted_on else None,
+    )
+
+
+async def check_operation_refs(db: AsyncSession, user_id: int, moded: str, account_id: Optional[int] = None,
+                               category_id: Optional[int] = None, debt_id: Optional[int] = None,
+                               target_id: Optional[int] = None, limit_id: Optional[int] = None,
+                               task_id: Optional[int] = None):
+    """Проверить, что связанные записи операции на повтор существуют и принадлежат пользователю"""
+    if account_id:
+        account = await db.scalar(select(Accounts).where(Accounts.id == account_id, Accounts.user_id == user_id))
+        if not account:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Указанной счет не найден"
+            )
+    if debt_id:
+        debt = await get_debts_by_user_id(debt_id, user_id, db)
+        if debt is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Долг не найден"
+            )
+    if category_id:
+        category = await get_category_by_user_id(category_id, db)
+        if category is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Категория не найдена"
+            )
+        if category.moded != moded:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Категория не соответствует типу операции"
+            )
+    if target_id:
+        target: Targets = await db.scalar(select(Targets).where(Targets.id == target_id, Targets.user_id == user_id))
+        if not target:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Цель не найдена"
+            )
+    if limit_id:
+        limit = await get_limit_by_user_id(limit_id, user_id, db)
+        if limit is None:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Лимит не найден"
+            )
+    if task_id:
+        task = await get_task_by_user_id(task_id, db)
+        if not task:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Задача не найдена"
+            )
+
+
 # Создание операции на повтор
 @router.post("/", 
              response_model=List[RepeatOperationOut],
              status_code=status.HTTP_201_CREATED)
-def create_repeat_operation(
+async def create_repeat_operation(
     operation: CreateRepeatOperation,
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     """
         Функция для опреаций на повторе, примеры:
@@ -80,6 +175,10 @@ def create_repeat_operation(
         - "target_id": 0,
         - "limit_id": 0,
         - "task_id": 0,    
+        - "until": "2026-06-09" — дата окончания (count=null и без until — бессрочно)
+
+        Серия сохраняется одним правилом; в ответе её повторения с id = null и rule_id.
+        Выполнить повторение — PUT /complete?rule_id=..&planned_date=..
             
            
             
@@ -87,168 +186,206 @@ def create_repeat_operation(
    
     """
     logger.info(operation.date_start)
-    user:User = db.query(User).filter(User.id == current_user.user_id).first()
+    user:User = await db.get(User, current_user.user_id)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Указанный пользователь не найден"
         )
         
-    # Проверка долга
-            # Получаем долг из базы данных
-    # Проверка долга, если debt_id задан
-    if operation.debt_id:
-        debt = get_debts_by_user_id(operation.debt_id, current_user.user_id, db)
-        if debt is None:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Долг не найден"
-            )
-    if operation.category_id:
-        category = get_category_by_user_id(operation.category_id, db)
-        if category is None:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Категория не найдена"
-            )
-        if category.moded != operation.moded:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Категория не соответствует типу операции"
-            )
-    if operation.target_id:
-        target: Targets = db.query(Targets).filter(Targets.id == operation.target_id, Targets.user_id == current_user.user_id).first()
-        if not target:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Цель не найдена"
-            )
-    if operation.limit_id:
-        limit = get_limit_by_user_id(operation.limit_id, current_user.user_id, db)
-        if limit is None:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Лимит не найден"
-            )  
-            
-    if operation.task_id:
-        # Проверка задачи, если task_id задан
-        task = get_task_by_user_id(operation.task_id, db)
-        if not task:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Задача не найдена"
-            )  
-            
-    created_operations = []
-    
-    current_date = datetime.strptime(operation.date_start, "%Y-%m-%d").date()
-    # Начальная дата — сейчас
-    # current_date = datetime.utcnow() 
-    for i in range(operation.count):
-        # Определяем дату следующей операции
-        if operation.interval == "day":
-            next_date = current_date + timedelta(days=i)
-        elif operation.interval == "week":
-            next_date = current_date + timedelta(weeks=i)
-        elif operation.interval == "month":
-            next_date = current_date + relativedelta(months=i)
-        elif operation.interval == "year":
-            next_date = current_date + relativedelta(years=i)
-        else:
-            raise HTTPException(status_code=400, detail="Недопустимый интервал повторения")
-    
-        new_op = RepeatOperations(
-            balance=operation.balance,
-            moded=operation.moded,
-            name =operation.name,
-            category_id=operation.category_id if operation.category_id else None,
-            account_id=operation.account_id if operation.account_id else None,
-            debt_id=operation.debt_id if operation.debt_id else None,
-            target_id=operation.target_id if operation.target_id else None,
-            limit_id=operation.limit_id if operation.limit_id else None,
-            task_id=operation.task_id if operation.task_id else None,
-            user_id=current_user.user_id,
-            planned_date=next_date  # Предполагается, что есть поле `planned_date` в модели
-        )
-        
-        
-        
-        db.add(new_op)
-        
-        created_operations.append(new_op)
-        
-    
+    await check_operation_refs(
+        db, current_user.user_id, operation.moded,
+        category_id=operation.category_id, debt_id=operation.debt_id, target_id=operation.target_id,
+        limit_id=operation.limit_id, task_id=operation.task_id,
+    )
+
     try:
-        loggger_json(created_operations)
-        db.commit()
-        
-        return created_operations
-    #     db.add(new_op)
-    #     db.commit()
-        
-    #     return new_op
+        anchor_date = datetime.strptime(operation.date_start, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректная дата начала date_start")
+    if operation.until and operation.until < anchor_date:
+        raise HTTPException(status_code=400, detail="until раньше даты начала")
+
+    # Серия хранится одним правилом, повторения разворачиваются при чтении
+    rule = RepeatRules(
+        balance=operation.balance,
+        moded=operation.moded,
+        name=operation.name,
+        interval=operation.interval.value,
+        anchor_date=anchor_date,
+        count=operation.count,
+        until=operation.until,
+        category_id=operation.category_id if operation.category_id else None,
+        account_id=operation.account_id if operation.account_id else None,
+        debt_id=operation.debt_id if operation.debt_id else None,
+        target_id=operation.target_id if operation.target_id else None,
+        limit_id=operation.limit_id if operation.limit_id else None,
+        task_id=operation.task_id if operation.task_id else None,
+        user_id=current_user.user_id,
+    )
+    # until — дата последнего повторения с учётом count: по нему правила отбираются в запросах
+    rule.until = rule_last_date(rule)
+    db.add(rule)
+
+    try:
+        await db.commit()
     except Exception as e:
-        db.rollback()
-        db.refresh(new_op)
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Ошибка при создании операции: {str(e)}")
 
+    # Отвечаем повторениями серии (бессрочной — на REPEAT_HORIZON_DAYS вперёд)
+    rule = await db.scalar(select(RepeatRules).where(RepeatRules.id == rule.id).options(*rule_response_options))
+    return [make_occurrence(rule, day) for day in rule_dates(rule)]
+
 @router.put('/complete', 
             summary="Завершить операцию на повторе",        
             status_code=status.HTTP_200_OK)
 async def complete_operation(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
     id: int = Query(None, description="id операции", example=1),
+    rule_id: int = Query(None, description="id правила — для повторения, у которого ещё нет id", example=1),
+    planned_date: date = Query(None, description="Дата повторения правила (в формате YYYY-MM-DD)", example="2025-06-09"),
 ):
     user_id = current_user.user_id
-    operation = db.query(RepeatOperations).filter(RepeatOperations.user_id == user_id,
-        RepeatOperations.id == id).first()
-    
-    if operation.completed:
+    try:
+        # Строка повторения, выполнение и отметка — одной транзакцией БД: сбой не оставит
+        # созданную, но не выполненную строку
+        if id is None and rule_id and planned_date:
+            # Повторение правила становится строкой, только когда его выполняют. Параллельное
+            # выполнение того же повторения не упадёт на уникальном индексе (ON CONFLICT),
+            # а строку оба читают под блокировкой — второй увидит её уже выполненной
+            occurrences = await materialize_occurrences(db, user_id, [(rule_id, planned_date)])
+            if (rule_id, planned_date) not in occurrences:
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Операция не найдена")
+            operation = occurrences[(rule_id, planned_date)]
+            if operation is None:
+                # Выполнено раньше и уже в архиве
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Операция уже выполнена.")
+        else:
+            operation = await db.scalar(
+                select(RepeatOperations)
+                .where(RepeatOperations.user_id == user_id, RepeatOperations.id == id)
+                .with_for_update()
+            )
+        if not operation:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Операция не найдена")
+
+        if operation.completed:
             logger.info(f"Операция {operation.id} уже выполнена.")
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Операция уже выполнена."
             )
-    transaction_data  = CreateTransaction(
-                user_id=operation.user_id,
-                sum=operation.balance,
-                moded=operation.moded,
-                repeat_operation=False,  # Указываем, что это повторная операция
-                account_id=operation.account_id,
-                category_id=operation.category_id if operation.category_id else None,
-                debt_id=operation.debt_id if operation.debt_id else None,
-                target_id=operation.target_id if operation.target_id else None,
-                limit_id=operation.limit_id if operation.limit_id else None,
-                task_id=operation.task_id if operation.task_id else None,
-                transaction_data = None
-                
-            )
-    loggger_json(transaction_data)
-    # Вызываем функцию создания транзакции
-    new_transaction = await create_transaction(
-            transaction_data=transaction_data,
-            current_user=current_user,
-            db=db
+        completed_ids, errors = await execute_operations_chunk(db, [operation])
+        if operation.id in errors:
+            error_status, error = errors[operation.id]
+            raise HTTPException(status_code=error_status, detail=error)
+        await db.commit()
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при выполнении операции: {str(e)}"
         )
-    logger.info(f"Создана новая транзакция ID: {new_transaction.id}")
-    new_transaction_dict = jsonable_encoder(new_transaction)
-    new_transaction_json = json.dumps(new_transaction_dict, ensure_ascii=False, indent=2)
-    logger.info(f"создаем новую транзакцию на основе текущей операции:\n{new_transaction_json}")           
-    operation.completed = True
-    operation.updated_at = datetime.utcnow()
-    db.commit()
-    db.refresh(operation)   
+    logger.info(f"Операция {operation.id} выполнена")
+    await db.refresh(operation)
     return operation
 
 
+@router.put('/complete/batch',
+            response_model=RepeatCompleteBatchResponse,
+            summary="Завершить несколько операций на повторе",
+            status_code=status.HTTP_200_OK)
+async def complete_operations_batch(
+    data: CompleteRepeatOperations,
+    current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
+    db: AsyncSession = Depends(get_db),
+):
+    """
+    Выполнить несколько операций одной транзакцией БД:
+    - ids: id операций из списка
+    - occurrences: повторения правил без id — [{"rule_id": 1, "planned_date": "2025-06-09"}]
+
+    Транзакции создаются одной вставкой, баланс каждого счёта меняется один раз,
+    операции отмечаются выполненными одним UPDATE.
+    Элементы с ошибками (не найдена, уже выполнена, не прошла проверки транзакции)
+    пропускаются — для них в results возвращается status_code и error.
+    """
+    user_id = current_user.user_id
+    logger.info(f"Пакетное выполнение {len(data.ids)} операций и {len(data.occurrences)} повторений для user_id: {user_id}")
+    if len(data.ids) + len(data.occurrences) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Не больше {BATCH_MAX_ITEMS} операций за запрос"
+        )
+    try:
+        operations = {}
+        if data.ids:
+            operations = {
+                operation.id: operation
+                for operation in (await db.execute(
+                    select(RepeatOperations)
+                    .where(RepeatOperations.user_id == user_id, RepeatOperations.id.in_(set(data.ids)))
+                    .order_by(RepeatOperations.id)
+                    .with_for_update()
+                )).scalars().all()
+            }
+        occurrences = await materialize_occurrences(
+            db, user_id, [(item.rule_id, item.planned_date) for item in data.occurrences]
+        )
+
+        # (элемент ответа, строка операции); missing — не найдена
+        missing = object()
+        items = [({"id": id}, operations.get(id, missing)) for id in dict.fromkeys(data.ids)]
+        items += [
+            ({"rule_id": rule_id, "planned_date": day}, occurrences.get((rule_id, day), missing))
+            for rule_id, day in dict.fromkeys((item.rule_id, item.planned_date) for item in data.occurrences)
+        ]
+        pending = {}
+        for _, operation in items:
+            if operation is not missing and operation is not None and not operation.completed:
+                pending[operation.id] = operation
+        completed_ids, errors = await execute_operations_chunk(db, list(pending.values()))
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при выполнении операций: {str(e)}"
+        )
+
+    completed_ids = set(completed_ids)
+    results = []
+    for result, operation in items:
+        if operation is missing:
+            result.update(status_code=status.HTTP_404_NOT_FOUND, error="Операция не найдена")
+        elif operation is None or operation.id not in pending:
+            # Выполнена раньше (в том числе уже в архиве) — как в PUT /complete
+            if operation is not None:
+                result["id"] = operation.id
+            result.update(status_code=status.HTTP_404_NOT_FOUND, error="Операция уже выполнена.")
+        else:
+            result["id"] = operation.id
+            if operation.id in completed_ids:
+                result["status_code"] = status.HTTP_200_OK
+            else:
+                result["status_code"], result["error"] = errors[operation.id]
+        results.append(result)
+    completed = sum(1 for result in results if result["status_code"] == status.HTTP_200_OK)
+    logger.info(f"Выполнено операций: {completed}, с ошибками: {len(results) - completed}")
+    return {"completed": completed, "failed": len(results) - completed, "results": results}
+
+
 @router.get("/", 
             summary="Получить операции на повторе",
             response_model=RepeatOperationListOut,        
             status_code=status.HTTP_200_OK)
-def get_operations_repeat(
-    db: Session = Depends(get_db),
+async def get_operations_repeat(
+    db: AsyncSession = Depends(get_db),
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])), 
     limit: int = Query(100, gt=0, le=1000, description="Лимит количества записей (1-1000)"),
     offset: int = Query(0, ge=0, description="Смещение (количество записей для пропуска)"), 
@@ -257,21 +394,42 @@ def get_operations_repeat(
     completed: Optional[bool] = Query(None, description="Фильтр по выполненным операциям (True/False)", example=True)
 ):
     try:
+        # Выполненные операции за давний период могут лежать в архиве
+        source = await repeat_operations_source(db, current_user.user_id, date_from, date_to, completed)
         # Сначала формируем базовый запрос
-        query = db.query(RepeatOperations)
+        query = select(source)
         if current_user:
-            query = query.filter(RepeatOperations.user_id == current_user.user_id)
+            query = query.where(source.user_id == current_user.user_id)
         # Фильтрация по датам, если переданы
         if date_from:
-            query = query.filter(RepeatOperations.planned_date >= date_from)
+            query = query.where(source.planned_date >= date_from)
         if date_to:
-            query = query.filter(RepeatOperations.planned_date <= date_to)
-        query = query.filter(RepeatOperations.completed == completed)
+            query = query.where(source.planned_date <= date_to)
+        query = query.where(source.completed == completed)
         # Сортировка по planned_date по возрастанию
-        query = query.order_by(RepeatOperations.planned_date.asc())    
+        query = query.order_by(source.planned_date.asc(), source.id.asc())    
         # Выполняем запрос и получаем результат
-        total = query.count()
-        reapits = query.offset(offset).limit(limit).all()  
+        total = await db.scalar(select(func.count()).select_from(query.subquery()))
+        occurrences = []
+        if completed is False:
+            # У невыполненных повторений правил строк нет — разворачиваем правила за период
+            first, last = window_dates(date_from, date_to)
+            rules = (await db.execute(
+                rules_query(current_user.user_id, first, last).options(*rule_response_options)
+            )).scalars().all()
+            occurrences = await expand_rules(db, rules, current_user.user_id, first, last)
+        if occurrences:
+            # Страница — из первых offset + limit строк и повторений, слитых по дате
+            rows = (await db.execute(
+                query.options(*repeat_operation_load_options(source)).limit(offset + limit)
+            )).scalars().all()
+            merged = heapq.merge(rows, occurrences, key=lambda operation: operation.planned_date)
+            reapits = list(islice(merged, offset, offset + limit))
+            total += len(occurrences)
+        else:
+            reapits = (await db.execute(
+                query.options(*repeat_operation_load_options(source)).offset(offset).limit(limit)
+            )).scalars().all()  
         logger.info(f"Найдено {len(reapits)} операций")
         
         return {
@@ -287,112 +445,240 @@ def get_operations_repeat(
         
   
 
-async def  repeat_operation_logic(db: Session):
-      # Получаем текущую дату+время без секунд и микросекунд
-    now = datetime.utcnow().replace(second=0, microsecond=0)
-    
-    # Определяем границы дня (начало и конец)
-    start_of_day = now.replace(hour=0, minute=0)
-    end_of_day = start_of_day + timedelta(days=1)
-    logger.info(start_of_day)
-    logger.info(end_of_day)
-    # Сначала формируем базовый запрос
-   # Формируем запрос для поиска операций с repeat_date = сегодня
-    operations = db.query(RepeatOperations).filter(
-        RepeatOperations.planned_date >= start_of_day,
-        RepeatOperations.planned_date < end_of_day
-    ).all()
-    
-    if not operations:
-        logger.info("Нет операций для повторения на сегодня")
-        return False
-    
-    # Логируем найденные операции
-    operations_dict = jsonable_encoder(operations)
-    operations_json = json.dumps(operations_dict, ensure_ascii=False, indent=2)
-    logger.info(f"Найденные операции для повторения:\n{operations_json}")
-    
-    if operations:
-        for operation in operations:
-            if operation.completed:
-                logger.info(f"Операция {operation.id} уже выполнена, пропускаем.")
-                continue
-            # Логируем информацию о каждой операции
-            logger.info(f"Обработка операции: {operation.id},  дата: {operation.planned_date}")
-            operation_dict = jsonable_encoder(operation)
-            operation_dict_json = json.dumps(operation_dict, ensure_ascii=False, indent=2)
-            logger.info(f"Данные по новой операции:\n{operation_dict_json}")            
-           
-            current_user = TokenPayload(
-                    user_id=operation.user_id,
-                    roles=["user"],  # или operation.user.roles если есть такое поле
-                    role="user",     # если модель требует отдельное поле role
-                    language="ru"    # или другое значение по умолчанию
+# Сколько операций executor проводит за одну транзакцию БД
+REPEAT_CHUNK_SIZE = int(os.getenv("REPEAT_CHUNK_SIZE", "500"))
+# На сколько дней назад смотреть при первом запуске для пояса (пока нет отметки)
+REPEAT_CATCHUP_DAYS = int(os.getenv("REPEAT_CATCHUP_DAYS", "31"))
+
+
+def due_operations_query(tz: str, date_from: date, date_to: date):
+    """
+    Невыполненные операции пользователей пояса tz с датой в [date_from, date_to].
+    planned_date — календарная дата (полночь UTC), поэтому для одного пояса это
+    один диапазон по частичному индексу невыполненных операций
+    """
+    return (
+        select(RepeatOperations)
+        .join(User, User.id == RepeatOperations.user_id)
+        .where(
+            RepeatOperations.completed == False,
+            RepeatOperations.planned_date >= planned_datetime(date_from),
+            RepeatOperations.planned_date < planned_datetime(date_to + timedelta(days=1)),
+            user_timezone_sql() == tz,
+        )
+    )
+
+
+async def materialize_rule_occurrences(db: AsyncSession, tz: str, date_from: date, date_to: date) -> int:
+    """
+    Повторения правил пользователей пояса tz за [date_from, date_to] — строками repeat_operations
+    (без commit), вставками по REPEAT_CHUNK_SIZE строк. Уже ставшие строками повторения
+    пропускаются. Возвращает число новых строк.
+    """
+    rules = (await db.execute(
+        select(RepeatRules)
+        .join(User, User.id == RepeatRules.user_id)
+        .where(
+            user_timezone_sql() == tz,
+            RepeatRules.anchor_date <= date_to,
+            RepeatRules.until.is_(None) | (RepeatRules.until >= date_from),
+        )
+    )).scalars().all()
+    done = await materialized_dates(db, None, [rule.id for rule in rules], date_from, date_to)
+    rows = [
+        occurrence_row(rule, day)
+        for rule in rules
+        for day in rule_dates(rule, date_from, date_to)
+        if (rule.id, day) not in done
+    ]
+    inserted = 0
+    for start in range(0, len(rows), REPEAT_CHUNK_SIZE):
+        result = await db.execute(
+            insert(RepeatOperations)
+            .values(rows[start:start + REPEAT_CHUNK_SIZE])
+            # Повторение, уже ставшее строкой параллельно, не дублируем
+            .on_conflict_do_nothing(
+                index_elements=[RepeatOperations.rule_id, RepeatOperations.planned_date],
+                index_where=RepeatOperations.rule_id.isnot(None),
             )
-            logger.info(f"Текущий пользователь: {current_user.user_id}")
-            # создаем новую транзакцию на основе текущей операции
-            transaction_data  = Transactions(
-                user_id=operation.user_id,
-                sum=operation.balance,
-                moded=operation.moded,
-                repeat_operation=False,  # Указываем, что это повторная операция
-                account_id=operation.account_id,
-                category_id=operation.category_id if operation.category_id else None,
-                debt_id=operation.debt_id if operation.debt_id else None,
-                target_id=operation.target_id if operation.target_id else None,
-                limit_id=operation.limit_id if operation.limit_id else None,
-                task_id=operation.task_id if operation.task_id else None,
+            .returning(RepeatOperations.id)
+        )
+        inserted += len(result.all())
+    return inserted
+
+
+def catch_up_day(operation: RepeatOperations, today: Optional[date]) -> Optional[date]:
+    """Планируемый день операции, если он прошёл к today (операцию догоняют), иначе None"""
+    if today is None:
+        return None
+    planned_day = as_utc(operation.planned_date).date()
+    return planned_day if planned_day < today else None
+
+
+async def execute_operations_chunk(db: AsyncSession, operations: List[RepeatOperations],
+                                   today: Optional[date] = None) -> tuple[list, dict]:
+    """
+    Провести пачку операций (без commit): транзакции создаются пакетно по каждому пользователю —
+    одна вставка и одно изменение баланса на счёт, — выполненные отмечаются одним UPDATE.
+    С today (дата по часам пользователей пачки) пропущенные операции прошлых дней проводятся
+    их планируемой датой, а не временем запуска.
+    Возвращает (id проведённых, {id: (код, текст) ошибки}); операции с ошибками остаются невыполненными.
+    """
+    by_user = defaultdict(list)
+    for operation in operations:
+        by_user[operation.user_id].append(operation)
+
+    completed_ids = []
+    errors = {}
+    for user_id, user_operations in by_user.items():
+        results = await apply_transactions_batch(
+            db, user_id, [operation_transaction(operation, catch_up_day(operation, today)) for operation in user_operations]
+        )
+        for result in results:
+            operation = user_operations[result["index"]]
+            if result["status_code"] == status.HTTP_201_CREATED:
+                completed_ids.append(operation.id)
+            else:
+                errors[operation.id] = (result["status_code"], result["error"])
+                logger.warning(f"Операция {operation.id} не выполнена: {result['error']}")
+
+    if completed_ids:
+        await db.execute(
+            update(RepeatOperations)
+            .where(RepeatOperations.id.in_(completed_ids))
+            .values(completed=True, updated_at=func.now())
+            .execution_options(synchronize_session=False)
+        )
+    return completed_ids, errors
+
+
+async def execute_timezone_bucket(db: AsyncSession, tz: str) -> tuple[int, int]:
+    """
+    Выполнить всё, что к текущему моменту наступило у пользователей пояса tz:
+    дни с отметки RepeatExecutorCheckpoint до сегодняшнего дня в этом поясе.
+    Операции берутся пачками по REPEAT_CHUNK_SIZE, каждая пачка — своя транзакция БД.
+    Отметка сдвигается на вчера, только если все пачки прошли без сбоев: сегодня ещё
+    могут появиться операции, а после сбоя следующий запуск повторит те же дни —
+    выполненные операции уже отмечены и второй раз не проводятся.
+    Операции прошлых дней проводятся их планируемой датой (полночь по часам пользователя).
+    Возвращает (проведено, с ошибками).
+    """
+    today = user_today(tz)
+    checkpoint = await db.get(RepeatExecutorCheckpoint, tz)
+    if checkpoint:
+        date_from = checkpoint.processed_through + timedelta(days=1)
+    else:
+        # Первый запуск для пояса: не проводим всю историю, только последние REPEAT_CATCHUP_DAYS дней
+        date_from = today - timedelta(days=REPEAT_CATCHUP_DAYS)
+    if date_from < today:
+        logger.info(f"Пояс {tz}: догоняем операции с {date_from}")
+
+    materialized = await materialize_rule_occurrences(db, tz, date_from, today)
+    await db.commit()
+    if materialized:
+        logger.info(f"Пояс {tz}: повторений правил к выполнению: {materialized}")
+
+    processed = failed = 0
+    clean = True
+    query = due_operations_query(tz, date_from, today).order_by(RepeatOperations.id)
+    last_id = 0
+    while True:
+        operations = (await db.execute(
+            query.where(RepeatOperations.id > last_id)
+            .limit(REPEAT_CHUNK_SIZE)
+            .with_for_update(of=RepeatOperations, skip_locked=True)
+        )).scalars().all()
+        if not operations:
+            break
+        last_id = operations[-1].id
+        try:
+            completed_ids, errors = await execute_operations_chunk(db, operations, today)
+            await db.commit()
+            chunk_processed, chunk_failed = len(completed_ids), len(errors)
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Пояс {tz}: ошибка при выполнении пачки операций {operations[0].id}..{last_id}: {e}")
+            chunk_processed, chunk_failed = 0, len(operations)
+            clean = False
+        processed += chunk_processed
+        failed += chunk_failed
+
+    if clean:
+        await db.execute(
+            insert(RepeatExecutorCheckpoint)
+            .values(timezone=tz, processed_through=today - timedelta(days=1))
+            .on_conflict_do_update(
+                index_elements=[RepeatExecutorCheckpoint.timezone],
+                set_={
+                    "processed_through": func.greatest(
+                        RepeatExecutorCheckpoint.processed_through, today - timedelta(days=1)
+                    ),
+                    "updated_at": func.now(),
+                },
             )
-            loggger_json(transaction_data)
-            # Вызываем функцию создания транзакции
-            new_transaction = await create_transaction(
-                    transaction_data=transaction_data,
-                    current_user=current_user,
-                    db=db
-                )
-            logger.info(f"Создана новая транзакция ID: {new_transaction.id}")
-    #              # Логируем найденные операции
-            new_transaction_dict = jsonable_encoder(new_transaction)
-            new_transaction_json = json.dumps(new_transaction_dict, ensure_ascii=False, indent=2)
-            logger.info(f"создаем новую транзакцию на основе текущей операции:\n{new_transaction_json}")
-            repeat_operation: RepeatOperations = db.query(RepeatOperations).filter(RepeatOperations.id == operation.id).first()
-            if not repeat_operation:
-                raise HTTPException(
-                    status_code=status.HTTP_404_NOT_FOUND,
-                    detail="Операция не найдена"
-                )
-            repeat_operation.completed = True  # Отмечаем операцию как выполненную 
-            repeat_operation.updated_at = datetime.utcnow()  # Обновляем дату обновления   
-            # db.delete(repeat_operation)
-            db.commit()
-    return True
+        )
+    await db.commit()
+    return processed, failed
+
+
+async def  repeat_operation_logic(db: AsyncSession) -> dict:
+    """
+    Выполнить операции на повтор, которые наступили к текущему моменту у каждого пользователя
+    (по его часовому поясу), включая дни, пропущенные из-за простоя.
+    Пользователи разбиваются по поясам; каждый пояс обрабатывается своими запросами
+    (execute_timezone_bucket). Строки пачки блокируются (SKIP LOCKED),
+    поэтому параллельный запуск не проведёт операцию дважды.
+    Возвращает {"processed", "failed", "duration"} — число проведённых операций,
+    операций с ошибками и время работы в секундах.
+    """
+    started = time.monotonic()
+    processed = failed = 0
+    timezones = (await db.execute(select(user_timezone_sql()).distinct())).scalars().all()
+    await db.commit()
+    for tz in timezones:
+        if not is_valid_timezone(tz):
+            logger.warning(f"Неизвестный часовой пояс {tz}, операции пропущены")
+            continue
+        try:
+            bucket_processed, bucket_failed = await execute_timezone_bucket(db, tz)
+        except Exception as e:
+            await db.rollback()
+            logger.error(f"Пояс {tz}: ошибка при выполнении операций: {e}")
+            continue
+        processed += bucket_processed
+        failed += bucket_failed
+
+    report = {"processed": processed, "failed": failed, "duration": round(time.monotonic() - started, 3)}
+    logger.info(f"Операции на повтор: выполнено {processed}, с ошибками {failed} за {report['duration']} с")
+    return report
 
 
 @router.put("/repeat_operation", summary="Повторить операцию (по дате обновления)")
 async def repeat_operation(
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
     ):
+    """Выполнить операции на сегодня; возвращает число выполненных, с ошибками и время работы (с)"""
     try:
-        result = await  repeat_operation_logic(db)
-        if not result:
-            raise HTTPException(status_code=404, detail="Операции не найдены")
-        return {"message": "Операции созданны (по дате обновления)"}
+        report = await  repeat_operation_logic(db)
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Ошибка при повторе операций: {str(e)}")
+    if not report["processed"] and not report["failed"]:
+        raise HTTPException(status_code=404, detail="Операции не найдены")
+    return {"message": "Операции созданны (по дате обновления)", **report}
 
 
 @router.delete("/{operation_id}", 
             summary="Удалить операцию на повтор",
             status_code=status.HTTP_204_NO_CONTENT)
-def delete_operation_repeat(
+async def delete_operation_repeat(
     repeat_operation_id: int,
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     logger.info(f"Удаление повторяющеся операцию по id с ID: {repeat_operation_id} для user_id: {current_user.user_id}")
     
-    repeat_operation: RepeatOperations = db.query(RepeatOperations).filter(RepeatOperations.id == repeat_operation_id).first()
+    repeat_operation: RepeatOperations = await db.get(RepeatOperations, repeat_operation_id)
     if not repeat_operation:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -405,16 +691,201 @@ def delete_operation_repeat(
             detail="У вас нет прав на удаление этой транзакции"
         )
     try:
-        db.delete(repeat_operation)
-        db.commit()
+        if repeat_operation.rule_id:
+            # Иначе удалённое повторение снова появится при развёртке правила
+            await skip_rule_date(db, repeat_operation.rule_id, repeat_operation.planned_date.astimezone(timezone.utc).date())
+        await db.delete(repeat_operation)
+        await db.commit()
     
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при удалении транзакции: {str(e)}"
         )
     return {"detail": "Операция успешно удалена"}
+
+
+async def skip_rule_date(db: AsyncSession, rule_id: int, day: date):
+    """Добавить дату в исключения правила (без commit)"""
+    await db.execute(
+        update(RepeatRules)
+        .where(RepeatRules.id == rule_id)
+        .values(exceptions=func.array_append(RepeatRules.exceptions, day), updated_at=func.now())
+    )
+
+
+@router.delete("/rule/{rule_id}/occurrence",
+            summary="Удалить одно повторение правила",
+            status_code=status.HTTP_204_NO_CONTENT)
+async def delete_rule_occurrence(
+    rule_id: int,
+    planned_date: date = Query(..., description="Дата повторения (в формате YYYY-MM-DD)", example="2025-06-09"),
+    current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
+    db: AsyncSession = Depends(get_db)
+):
+    """Пропустить повторение, у которого ещё нет строки (id = null в списке операций)"""
+    logger.info(f"Пропуск повторения {planned_date} правила {rule_id} для user_id: {current_user.user_id}")
+    rule = await db.scalar(select(RepeatRules).where(RepeatRules.id == rule_id, RepeatRules.user_id == current_user.user_id))
+    if not rule or not is_rule_date(rule, planned_date):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Операция не найдена"
+        )
+    await skip_rule_date(db, rule.id, planned_date)
+    await db.commit()
+
+
+async def get_user_rule(db: AsyncSession, rule_id: int, user_id: int) -> RepeatRules:
+    rule = await db.scalar(select(RepeatRules).where(RepeatRules.id == rule_id, RepeatRules.user_id == user_id))
+    if not rule:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Серия операций не найдена"
+        )
+    return rule
+
+
+def has_dates_before(rule: RepeatRules, day: date) -> bool:
+    """Есть ли у правила повторения раньше day"""
+    return next(rule_dates(rule, None, day - timedelta(days=1)), None) is not None
+
+
+@router.patch("/rule/{rule_id}",
+              response_model=RepeatSeriesOut,
+              summary="Изменить серию операций начиная с даты")
+async def update_repeat_series(
+    rule_id: int,
+    update_data: UpdateRepeatSeries,
+    from_date: Optional[date] = Query(None, description="С какого повторения менять (YYYY-MM-DD); без даты — всю серию", example="2025-06-09"),
+    current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Изменить «это и все следующие» повторения серии (rule_id из списка операций).
+
+    Передаются только изменяемые поля: balance, moded, name, account_id,
+    category_id, debt_id, target_id, limit_id, task_id.
+    Если до from_date у серии есть повторения, она делится: прошлые остаются у старого правила,
+    а с from_date — у нового (его id возвращается в rule_id). Невыполненные операции серии
+    с from_date меняются одним UPDATE, выполненные не меняются.
+    """
+    logger.info(f"Изменение серии {rule_id} с {from_date} для user_id: {current_user.user_id}")
+    rule = await get_user_rule(db, rule_id, current_user.user_id)
+    changes = update_data.dict(exclude_unset=True)
+    for field in ("balance", "moded", "name", "account_id"):
+        if field in changes and changes[field] is None:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Поле {field} не может быть пустым"
+            )
+    if "moded" in changes:
+        changes["moded"] = changes["moded"].value
+    if from_date and next(rule_dates(rule, from_date), None) is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="У серии нет повторений начиная с этой даты"
+        )
+    await check_operation_refs(
+        db, current_user.user_id, changes.get("moded", rule.moded),
+        account_id=changes.get("account_id"),
+        # Категорию проверяем и при смене типа операции
+        category_id=changes.get("category_id", rule.category_id) if {"category_id", "moded"} & changes.keys() else None,
+        debt_id=changes.get("debt_id"), target_id=changes.get("target_id"),
+        limit_id=changes.get("limit_id"), task_id=changes.get("task_id"),
+    )
+
+    try:
+        target_rule = rule
+        if from_date and has_dates_before(rule, from_date):
+            # Прошлые повторения не трогаем: серия делится на два правила с общей сеткой дат
+            target_rule = RepeatRules(**{
+                column.key: getattr(rule, column.key)
+                for column in RepeatRules.__table__.columns
+                if column.key not in ("id", "created_at", "updated_at")
+            })
+            target_rule.start_date = from_date
+            target_rule.exceptions = [day for day in rule.exceptions or [] if day >= from_date]
+            rule.until = from_date - timedelta(days=1)
+            db.add(target_rule)
+        for field, value in changes.items():
+            setattr(target_rule, field, value)
+        await db.flush()
+
+        # Невыполненные операции серии с from_date — одним UPDATE; выполненные только
+        # переходят к новому правилу, чтобы их даты не развернулись в нём повторно
+        pending = RepeatOperations.completed == False
+        values = {field: case((pending, value), else_=getattr(RepeatOperations, field)) for field, value in changes.items()}
+        rows = update(RepeatOperations).where(RepeatOperations.rule_id == rule.id)
+        if from_date:
+            rows = rows.where(RepeatOperations.planned_date >= planned_datetime(from_date))
+        if target_rule is rule:
+            rows = rows.where(pending)
+            values = changes
+        else:
+            values["rule_id"] = target_rule.id
+        updated = 0
+        if values:
+            result = await db.execute(
+                rows.values(**values, updated_at=func.now()).returning(RepeatOperations.completed)
+                .execution_options(synchronize_session=False)
+            )
+            updated = sum(1 for completed in result.scalars() if not completed)
+        if target_rule is not rule:
+            # Выполненные повторения с этих дат могли уже уехать в архив
+            await db.execute(
+                update(RepeatOperationsArchive)
+                .where(
+                    RepeatOperationsArchive.rule_id == rule.id,
+                    RepeatOperationsArchive.planned_date >= planned_datetime(from_date),
+                )
+                .values(rule_id=target_rule.id)
+            )
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при изменении серии: {str(e)}"
+        )
+    return {"rule_id": target_rule.id, "updated": updated}
+
+
+@router.delete("/rule/{rule_id}",
+            summary="Удалить серию операций начиная с даты",
+            status_code=status.HTTP_204_NO_CONTENT)
+async def delete_repeat_series(
+    rule_id: int,
+    from_date: Optional[date] = Query(None, description="С какого повторения удалять (YYYY-MM-DD); без даты — всю серию", example="2025-06-09"),
+    current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Удалить «это и все следующие» повторения серии: невыполненные операции с from_date
+    удаляются одним DELETE, серия заканчивается накануне from_date.
+    Если раньше from_date повторений нет, правило удаляется целиком.
+    Выполненные операции остаются в истории.
+    """
+    logger.info(f"Удаление серии {rule_id} с {from_date} для user_id: {current_user.user_id}")
+    rule = await get_user_rule(db, rule_id, current_user.user_id)
+    try:
+        rows = delete(RepeatOperations).where(RepeatOperations.rule_id == rule.id, RepeatOperations.completed == False)
+        if from_date:
+            rows = rows.where(RepeatOperations.planned_date >= planned_datetime(from_date))
+        await db.execute(rows.execution_options(synchronize_session=False))
+        if from_date and has_dates_before(rule, from_date):
+            # Серия, которая и так кончается раньше from_date, не продлевается
+            if rule.until is None or rule.until >= from_date:
+                rule.until = from_date - timedelta(days=1)
+        else:
+            await db.delete(rule)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при удалении серии: {str(e)}"
+        )
         
 # получаем тип операции дату и количество повторений
 
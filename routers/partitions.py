@@ -0,0 +1,159 @@
+from datetime import date, datetime, timezone
+from typing import List, Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+import logging
+# Настройка логгирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Обслуживание помесячных секций transactions (PARTITION BY RANGE (created_at)).
+# Границы секций — начало месяца по UTC. Строки, для которых секции ещё нет,
+# попадают в transactions_default; задача ниже заранее создаёт секции на будущие
+# месяцы и переносит в свои секции всё, что успело осесть в default.
+
+PARENT_TABLE = "transactions"
+DEFAULT_PARTITION = "transactions_default"
+# На сколько месяцев вперёд держать готовые секции
+PARTITION_MONTHS_AHEAD = 3
+
+
+def month_start(value: date) -> date:
+    return date(value.year, value.month, 1)
+
+
+def add_months(month: date, count: int) -> date:
+    index = month.year * 12 + month.month - 1 + count
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def partition_name(month: date) -> str:
+    """transactions_y2026m01 — имя секции за месяц"""
+    return f"{PARENT_TABLE}_y{month.year:04d}m{month.month:02d}"
+
+
+def partition_bounds(month: date) -> tuple[str, str]:
+    """Границы секции [начало месяца, начало следующего) в UTC, литералами для DDL"""
+    return (
+        f"{month.isoformat()} 00:00:00+00",
+        f"{add_months(month, 1).isoformat()} 00:00:00+00",
+    )
+
+
+def existing_partitions(db: Session) -> List[str]:
+    """Имена секций, подключённых к transactions"""
+    rows = db.execute(
+        text(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class parent ON parent.oid = pg_inherits.inhparent
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE parent.relname = :parent
+            """
+        ),
+        {"parent": PARENT_TABLE},
+    )
+    return [row[0] for row in rows]
+
+
+def create_month_partition(db: Session, month: date) -> str:
+    """
+    Создать и подключить секцию за месяц (без commit).
+    Таблица собирается отдельно и подключается через ATTACH PARTITION: если в default
+    уже лежат строки этого месяца, они переносятся в новую секцию до подключения —
+    CREATE TABLE ... PARTITION OF на непустом default упал бы.
+    """
+    name = partition_name(month)
+    lower, upper = partition_bounds(month)
+    db.execute(text(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+    moved = db.execute(
+        text(
+            f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION}
+                WHERE created_at >= :lower AND created_at < :upper
+                RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+            """
+        ),
+        {"lower": lower, "upper": upper},
+    ).rowcount
+    # CHECK с границами секции избавляет ATTACH от полного прохода по новой таблице
+    db.execute(
+        text(
+            f"ALTER TABLE {name} ADD CONSTRAINT {name}_bounds "
+            f"CHECK (created_at >= '{lower}' AND created_at < '{upper}')"
+        )
+    )
+    db.execute(text(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES FROM ('{lower}') TO ('{upper}')"))
+    db.execute(text(f"ALTER TABLE {name} DROP CONSTRAINT {name}_bounds"))
+    logger.info(f"Создана секция {name}, перенесено из {DEFAULT_PARTITION}: {moved} строк")
+    return name
+
+
+def ensure_transaction_partitions(db: Session, months_ahead: int = PARTITION_MONTHS_AHEAD,
+                                  today: Optional[date] = None) -> List[str]:
+    """
+    Задача планировщика: секции на текущий и months_ahead следующих месяцев,
+    плюс секции для месяцев, строки которых лежат в default (операции задним числом,
+    импорт старых выписок). Возвращает имена созданных секций.
+    """
+    today = today or datetime.now(timezone.utc).date()
+    existing = set(existing_partitions(db))
+    current = month_start(today)
+    months = {add_months(current, offset) for offset in range(months_ahead + 1)}
+    if DEFAULT_PARTITION in existing:
+        stray = db.execute(
+            text(
+                f"SELECT DISTINCT date_trunc('month', created_at AT TIME ZONE 'UTC')::date "
+                f"FROM {DEFAULT_PARTITION}"
+            )
+        ).scalars()
+        months.update(stray)
+
+    created = []
+    for month in sorted(months):
+        if partition_name(month) in existing:
+            continue
+        created.append(create_month_partition(db, month))
+    db.commit()
+    return created
+
+
+def detach_month_partition(db: Session, month: date) -> Optional[str]:
+    """
+    Отключить секцию за месяц от transactions (без commit). Строки остаются
+    в обычной таблице с тем же именем: её можно выгрузить, перенести в архив
+    или удалить DROP TABLE — без DELETE по горячей таблице и без раздувания её индексов.
+    """
+    name = partition_name(month)
+    if name not in existing_partitions(db):
+        return None
+    db.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+    logger.info(f"Секция {name} отключена от {PARENT_TABLE}")
+    return name
+
+
+def drop_empty_partitions_before(db: Session, month: date) -> List[str]:
+    """
+    Удалить пустые помесячные секции, целиком лежащие раньше month (без commit).
+    После архивации старых транзакций (routers/archive.py) от них остаются пустые таблицы.
+    """
+    dropped = []
+    for name in sorted(existing_partitions(db)):
+        try:
+            partition_month = datetime.strptime(name, f"{PARENT_TABLE}_y%Ym%m").date()
+        except ValueError:
+            continue  # transactions_default
+        if add_months(partition_month, 1) > month:
+            continue
+        if db.scalar(text(f"SELECT EXISTS (SELECT 1 FROM {name})")):
+            continue
+        db.execute(text(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}"))
+        db.execute(text(f"DROP TABLE {name}"))
+        dropped.append(name)
+    if dropped:
+        logger.info(f"Удалены пустые секции: {', '.join(dropped)}")
+    return dropped
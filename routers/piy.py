@@ -4,10 +4,13 @@ from typing import Optional
 from fastapi import APIRouter, Body, HTTPException, status, Depends, Query
 import logging
 from auth.auth import guard_role, TokenPayload
-from db import SessionLocal
-from sqlalchemy.orm import Session
+from db import get_db
+from sqlalchemy import case, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from enums import TransactionsTypeEnum
-from models import Transactions, User
+from models import Categories, Debts, Targets, Transactions, User
+from routers.archive import transactions_source
+from routers.timezones import period_bounds
 import calendar
 from typing import List, Dict
 from collections import defaultdict
@@ -24,61 +27,72 @@ router = APIRouter(
 )
 
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
-def get_piy_data(operations):
-    """
-    Функция для получения данных для пирога.
-    Возвращает словарь с данными для пирога.
-    """
-    # Здесь должна быть логика получения данных для пирога
-    # Например, можно использовать запрос к базе данных
-    # или другие источники данных
-    result = []
-    grouped = defaultdict(lambda: {"value": 0, "color": "", "name": ""})
-
-    for op in operations:  # operations — твой исходный массив
-        if op.debt:
-            key = f'debt_{op.debt.id}'
-            grouped[key]["value"] += op.sum
-            grouped[key]["color"] = "#C141CC"
-            grouped[key]["name"] = op.debt.name
-
-        elif op.target:
-            key = f'target_{op.target.id}'
-            grouped[key]["value"] += op.sum
-            grouped[key]["color"] = "#BECFDC"
-            grouped[key]["name"] = op.target.name
-
-        elif op.category:
-            key = f'category_{op.category.id}'
-            grouped[key]["value"] += op.sum
-            grouped[key]["color"] = op.category.color
-            grouped[key]["name"] = op.category.name
-        else:
-            # Если не задана ни цель, ни долг, ни категория
-            key = f'uncategorized'
-            grouped[key]["value"] += op.sum
-            grouped[key]["color"] = "#B0B0B0"  # серый цвет
-            grouped[key]["name"] = "Без категории"
+# Цвета срезов, у которых нет своего цвета
+DEBT_COLOR = "#C141CC"
+TARGET_COLOR = "#BECFDC"
+UNCATEGORIZED_COLOR = "#B0B0B0"  # серый цвет
 
-        # Преобразуем словарь в нужный формат
-    result = [{"value": v["value"], "color": v["color"], "name": v["name"]} for v in grouped.values()]
-    return result 
 
+def piy_slices_query(base_filter, source=Transactions):
+    """
+    Срезы для пирога одним GROUP BY.
+    Приоритет как раньше: долг, затем цель, затем категория, иначе «Без категории».
+    """
+    kind = case(
+        (Debts.id.isnot(None), "debt"),
+        (Targets.id.isnot(None), "target"),
+        (Categories.id.isnot(None), "category"),
+        else_="uncategorized",
+    )
+    slice_id = case(
+        (Debts.id.isnot(None), Debts.id),
+        (Targets.id.isnot(None), Targets.id),
+        (Categories.id.isnot(None), Categories.id),
+    )
+    name = case(
+        (Debts.id.isnot(None), Debts.name),
+        (Targets.id.isnot(None), Targets.name),
+        (Categories.id.isnot(None), Categories.name),
+        else_="Без категории",
+    )
+    color = case(
+        (Debts.id.isnot(None), DEBT_COLOR),
+        (Targets.id.isnot(None), TARGET_COLOR),
+        (Categories.id.isnot(None), Categories.color),
+        else_=UNCATEGORIZED_COLOR,
+    )
+    # Срез каждой строки считаем в подзапросе, а группируем по его колонкам:
+    # с серверными параметрами asyncpg PostgreSQL не сопоставил бы CASE в SELECT и GROUP BY
+    rows = (
+        select(
+            source.sum.label("value"),
+            kind.label("kind"),
+            slice_id.label("slice_id"),
+            name.label("name"),
+            color.label("color"),
+        )
+        .select_from(source)
+        .outerjoin(Debts, Debts.id == source.debt_id)
+        .outerjoin(Targets, Targets.id == source.target_id)
+        .outerjoin(Categories, Categories.id == source.category_id)
+        .where(*base_filter)
+        .subquery()
+    )
+    total = func.sum(rows.c.value)
+    return (
+        select(total.label("value"), rows.c.color, rows.c.name)
+        .group_by(rows.c.kind, rows.c.slice_id, rows.c.name, rows.c.color)
+        .order_by(total.desc())
+    )
 
 
 @router.get("/piy", 
             #  response_model=List[TransactionResponse],
              summary="Собрать данные для пирога",
              status_code=status.HTTP_200_OK)
-def get_piy(
-    db: Session = Depends(get_db),
+async def get_piy(
+    db: AsyncSession = Depends(get_db),
     date_from: Optional[date] = Query(None, description="Начальная дата фильтрации (в формате YYYY-MM-DD)", example="2025-05-01"),
     date_to: Optional[date] = Query(None, description="Конечная дата фильтрации (в формате YYYY-MM-DD)", example="2025-05-30"),
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
@@ -97,21 +111,24 @@ def get_piy(
     - account_id: id счета
     """
     logger.info(f"Получает список транзакций user_id: {current_user.user_id}")
-    user = db.query(User).filter(User.id == current_user.user_id).first()
+    user = await db.get(User, current_user.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
-     # Базовый запрос
-    query = db.query(Transactions).filter(Transactions.user_id == user.id)
-        # Применяем фильтры
-    if date_from:
-        query = query.filter(Transactions.created_at >= date_from)
-    if date_to:
-        query = query.filter(Transactions.created_at <= date_to)
+    # Даты периода — полночи в часовом поясе пользователя
+    created_from, created_to = period_bounds(date_from, date_to, user.timezone)
+    # Архив подключаем, только если период задевает архивные транзакции
+    source = await transactions_source(db, user.id, created_from, created_to)
+    # Фильтры
+    filters = [source.user_id == user.id]
+    if created_from:
+        filters.append(source.created_at >= created_from)
+    if created_to:
+        filters.append(source.created_at <= created_to)
     if moded:
-        query = query.filter(Transactions.moded == moded)
+        filters.append(source.moded == moded)
     if account_id:
-        query = query.filter(Transactions.account_id == account_id)
-        # Получаем общее количество записей (без пагинации)
-    transactions = query.all()   
-        
-    return get_piy_data(transactions)
\ No newline at end of file
+        filters.append(source.account_id == account_id)
+
+    # В Python приходят только готовые срезы, а не все транзакции периода
+    rows = (await db.execute(piy_slices_query(filters, source))).all()
+    return [{"value": row.value, "color": row.color, "name": row.name} for row in rows]
@@ -1,26 +1,17 @@
 from datetime import date, timedelta
 import logging
 from fastapi import APIRouter, Depends, HTTPException, Query, status
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 from typing import List, Optional
-from sqlalchemy.orm import joinedload
 import json
-from db import SessionLocal
+from db import get_db
 from models import Project, Tasks, User
 from auth.auth import TokenPayload, guard_role
 from schemas import ProjectCreate, ProjectOut, ProjectResponse, ProjectResponseWithTotal, ProjectTaskOut, ProjectUpdate
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy import func  # Импорт функции для агрегации
+from sqlalchemy import func, select  # Импорт функции для агрегации
 from sqlalchemy.orm import selectinload
-# Зависимость для получения сессии базы данных
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -49,8 +40,8 @@ def loggger_json(data):
     response_model=ProjectResponseWithTotal,
     status_code=status.HTTP_200_OK
 )
-def get_projects_by_user(
-    db: Session = Depends(get_db),
+async def get_projects_by_user(
+    db: AsyncSession = Depends(get_db),
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
     limit: int = Query(100, gt=0, le=1000),
     offset: int = Query(0, ge=0),
@@ -62,16 +53,16 @@ def get_projects_by_user(
     logger.info(f"[get_projects_by_user] user_id={current_user.user_id}")
     try:
         # Базовый запрос для подсчета общего количества
-        count_query = db.query(Project).options(selectinload(Project.tasks)).filter(Project.user_id == current_user.user_id)
+        count_query = select(Project).where(Project.user_id == current_user.user_id)
 
         # Основной запрос с агрегациями
-        query = db.query(
+        query = select(
             Project,
             func.count(Tasks.id).label('tasks_count'),
             func.coalesce(func.sum(Tasks.sum), 0).label('total_sum')
         ).outerjoin(
             Tasks, Tasks.project_id == Project.id
-        ).filter(
+        ).where(
             Project.user_id == current_user.user_id,
             Project.completed == completed
         ).group_by(
@@ -80,15 +71,15 @@ def get_projects_by_user(
 
         # Фильтры по дате
         if date_from:
-            query = query.filter(Project.created_at >= date_from)
-            count_query = count_query.filter(Project.created_at >= date_from)
+            query = query.where(Project.created_at >= date_from)
+            count_query = count_query.where(Project.created_at >= date_from)
         if date_to:
             next_day = date_to + timedelta(days=1)
-            query = query.filter(Project.created_at < next_day)
-            count_query = count_query.filter(Project.created_at < next_day)
+            query = query.where(Project.created_at < next_day)
+            count_query = count_query.where(Project.created_at < next_day)
 
         # Общее количество
-        total = count_query.count()
+        total = await db.scalar(select(func.count()).select_from(count_query.subquery()))
 
         # Сортировка
         if order_by.lower() == "asc":
@@ -97,7 +88,7 @@ def get_projects_by_user(
             query = query.order_by(Project.created_at.desc())
 
         # Пагинация
-        projects_data = query.offset(offset).limit(limit).all()
+        projects_data = (await db.execute(query.offset(offset).limit(limit))).all()
 
         if not projects_data:
             raise HTTPException(
@@ -135,10 +126,10 @@ def get_projects_by_user(
     summary="Создать новый проект",
     response_model=ProjectOut
 )
-def create_project(
+async def create_project(
     project_data: ProjectCreate,
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         logger.info(f"[create_project] user_id={current_user.user_id}, data={project_data}")
@@ -150,12 +141,12 @@ def create_project(
             user_id=current_user.user_id
         )
         db.add(project)
-        db.commit()
-        db.refresh(project)
+        await db.commit()
+        await db.refresh(project)
         return project
     except SQLAlchemyError as e:
         logger.error(f"[create_project] DB error: {e}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Ошибка при создании проекта"
@@ -166,11 +157,11 @@ def create_project(
     summary="Обновить проект",
     response_model=ProjectOut
 )
-def update_project(
+async def update_project(
     project_id: int,
     update_data: ProjectUpdate,
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
         Передаем только те значения, которые нужно обновить.
@@ -180,7 +171,7 @@ def update_project(
     """
     try:
         logger.info(f"[update_project] user_id={current_user.user_id}, project_id={project_id}, data={update_data}")
-        project = db.query(Project).filter_by(id=project_id, user_id=current_user.user_id).first()
+        project = await db.scalar(select(Project).filter_by(id=project_id, user_id=current_user.user_id))
         if not project:
             logger.warning(f"[update_project] Проект не найден: project_id={project_id}")
             raise HTTPException(status_code=404, detail="Проект не найден")
@@ -191,12 +182,12 @@ def update_project(
         for field, value in update_data.dict(exclude_unset=True).items():
             setattr(project, field, value)
 
-        db.commit()
-        db.refresh(project)
+        await db.commit()
+        await db.refresh(project)
         return project
     except SQLAlchemyError as e:
         logger.error(f"[update_project] DB error: {e}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Ошибка при обновлении проекта"
@@ -206,25 +197,25 @@ def update_project(
     "/{project_id}",
     summary="Удалить проект"
 )
-def delete_project(
+async def delete_project(
     project_id: int,
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         logger.info(f"[delete_project] user_id={current_user.user_id}, project_id={project_id}")
-        project = db.query(Project).filter_by(id=project_id, user_id=current_user.user_id).first()
+        project = await db.scalar(select(Project).filter_by(id=project_id, user_id=current_user.user_id))
         if not project:
             logger.warning(f"[delete_project] Проект не найден: project_id={project_id}")
             raise HTTPException(status_code=404, detail="Проект не найден")
 
-        db.delete(project)
-        db.commit()
+        await db.delete(project)
+        await db.commit()
         logger.info(f"[delete_project] Успешно удалён: project_id={project_id}")
         return {"detail": "Проект удален"}
     except SQLAlchemyError as e:
         logger.error(f"[delete_project] DB error: {e}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Ошибка при удалении проекта"
@@ -248,7 +239,11 @@ def calculate_completion_percentage(tasks):
 
 async def update_progress(project_id,user_id, db):
         logger.info(project_id)
-        project:ProjectResponse = db.query(Project).filter_by(id=project_id, user_id=user_id).options(joinedload(Project.tasks)).first()
+        project:ProjectResponse = await db.scalar(
+            select(Project)
+            .filter_by(id=project_id, user_id=user_id)
+            .options(selectinload(Project.tasks))
+        )
         if not project.tasks:
              logger.log('Нет таксов')
         else:
@@ -271,8 +266,8 @@ async def update_progress(project_id,user_id, db):
                 project.completed = True
             else:
                 project.completed = False
-            db.commit()
-            db.refresh(project)
+            await db.commit()
+            await db.refresh(project)
             return True
         
         return False
\ No newline at end of file
@@ -0,0 +1,302 @@
+import os
+from datetime import date, datetime, time, timedelta, timezone
+from decimal import Decimal
+from typing import Any, Iterable, Iterator, List, NamedTuple, Optional
+from dateutil.relativedelta import relativedelta
+from sqlalchemy import select, tuple_, union_all
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
+from enums import RepeatInterval
+from models import RepeatOperations, RepeatOperationsArchive, RepeatRules, Targets
+import logging
+# Настройка логгирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Правила повтора (RepeatRules) хранятся одной строкой на серию. Повторения
+# разворачиваются здесь, в приложении, и только за запрошенный период: n-е повторение —
+# anchor_date + n шагов (для месяцев и лет — с отсечением по концу месяца, 31.01 -> 28.02 -> 31.03).
+# Повторение, которое уже выполнено, хранится строкой repeat_operations с rule_id
+# и из развёртки исключается; пропущенные даты лежат в RepeatRules.exceptions.
+# При изменении серии «с этой даты» правило делится: у старого until сдвигается на день раньше,
+# новое получает тот же anchor_date (сетка дат и отсечение по концу месяца не меняются) и start_date.
+
+# Насколько вперёд разворачивать бессрочные правила, если конец периода не задан, сутки
+REPEAT_HORIZON_DAYS = int(os.getenv("REPEAT_HORIZON_DAYS", "366"))
+
+STEPS = {
+    RepeatInterval.DAILY: relativedelta(days=1),
+    RepeatInterval.WEEKLY: relativedelta(weeks=1),
+    RepeatInterval.MONTHLY: relativedelta(months=1),
+    RepeatInterval.YEARLY: relativedelta(years=1),
+}
+
+# Связи правила, нужные для RepeatOperationOut
+rule_response_options = (
+    selectinload(RepeatRules.category),
+    selectinload(RepeatRules.account),
+    selectinload(RepeatRules.debt),
+    selectinload(RepeatRules.target).selectinload(Targets.account),
+    selectinload(RepeatRules.limit),
+    selectinload(RepeatRules.task),
+)
+
+
+class Occurrence(NamedTuple):
+    """Ещё не выполненное повторение правила — те же поля, что у RepeatOperations, но без строки в БД"""
+    rule_id: int
+    planned_date: datetime
+    balance: Decimal
+    moded: str
+    name: str
+    user_id: int
+    account_id: int
+    category_id: Optional[int]
+    debt_id: Optional[int]
+    target_id: Optional[int]
+    limit_id: Optional[int]
+    task_id: Optional[int]
+    category: Any
+    account: Any
+    debt: Any
+    target: Any
+    limit: Any
+    task: Any
+    created_at: datetime
+    updated_at: datetime
+    id: Optional[int] = None
+    completed: bool = False
+
+
+def occurrence_date(rule: RepeatRules, index: int) -> date:
+    """Дата повторения с номером index (с нуля)"""
+    return rule.anchor_date + STEPS[RepeatInterval(rule.interval)] * index
+
+
+def planned_datetime(day: date) -> datetime:
+    """planned_date повторения — полночь UTC его календарной даты, как у строк repeat_operations"""
+    return datetime.combine(day, time.min, tzinfo=timezone.utc)
+
+
+def first_index_from(rule: RepeatRules, day: date) -> int:
+    """Номер первого повторения не раньше day — без перебора повторений с начала серии"""
+    anchor = rule.anchor_date
+    if day <= anchor:
+        return 0
+    interval = RepeatInterval(rule.interval)
+    if interval == RepeatInterval.DAILY:
+        return (day - anchor).days
+    if interval == RepeatInterval.WEEKLY:
+        return -(-(day - anchor).days // 7)
+    if interval == RepeatInterval.MONTHLY:
+        index = (day.year - anchor.year) * 12 + day.month - anchor.month - 1
+    else:
+        index = day.year - anchor.year - 1
+    # Оценка снизу: дальше не больше пары шагов
+    index = max(index, 0)
+    while occurrence_date(rule, index) < day:
+        index += 1
+    return index
+
+
+def rule_last_date(rule: RepeatRules) -> Optional[date]:
+    """Дата последнего повторения по count/until (None — бессрочное правило)"""
+    bounds = [rule.until] if rule.until else []
+    if rule.count is not None:
+        bounds.append(occurrence_date(rule, rule.count - 1))
+    return min(bounds) if bounds else None
+
+
+def rule_dates(rule: RepeatRules, date_from: Optional[date] = None, date_to: Optional[date] = None) -> Iterator[date]:
+    """
+    Даты повторений правила в [date_from, date_to] по возрастанию, без исключений.
+    Бессрочное правило без date_to разворачивается на REPEAT_HORIZON_DAYS вперёд.
+    """
+    end = rule_last_date(rule)
+    if date_to and (end is None or date_to < end):
+        end = date_to
+    if end is None:
+        end = datetime.now(timezone.utc).date() + timedelta(days=REPEAT_HORIZON_DAYS)
+    skipped = set(rule.exceptions or [])
+    if rule.start_date and (date_from is None or date_from < rule.start_date):
+        date_from = rule.start_date
+    index = first_index_from(rule, date_from) if date_from else 0
+    if rule.count is not None and index >= rule.count:
+        return
+    while True:
+        day = occurrence_date(rule, index)
+        if day > end:
+            return
+        if day not in skipped:
+            yield day
+        index += 1
+
+
+def is_rule_date(rule: RepeatRules, day: date) -> bool:
+    return next(rule_dates(rule, day, day), None) == day
+
+
+def make_occurrence(rule: RepeatRules, day: date, with_relations: bool = True) -> Occurrence:
+    return Occurrence(
+        rule_id=rule.id,
+        planned_date=planned_datetime(day),
+        balance=rule.balance,
+        moded=rule.moded,
+        name=rule.name,
+        user_id=rule.user_id,
+        account_id=rule.account_id,
+        category_id=rule.category_id,
+        debt_id=rule.debt_id,
+        target_id=rule.target_id,
+        limit_id=rule.limit_id,
+        task_id=rule.task_id,
+        category=rule.category if with_relations else None,
+        account=rule.account if with_relations else None,
+        debt=rule.debt if with_relations else None,
+        target=rule.target if with_relations else None,
+        limit=rule.limit if with_relations else None,
+        task=rule.task if with_relations else None,
+        created_at=rule.created_at,
+        updated_at=rule.updated_at,
+    )
+
+
+def as_utc(value: datetime) -> datetime:
+    """Момент без смещения считаем UTC — так же его сравнивает PostgreSQL с timestamptz"""
+    return value.astimezone(timezone.utc) if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def window_dates(date_from: Optional[datetime], date_to: Optional[datetime]) -> tuple[Optional[date], Optional[date]]:
+    """Фильтры planned_date >= date_from / <= date_to (моменты времени) — в календарные даты повторений"""
+    first = last = None
+    if date_from:
+        moment = as_utc(date_from)
+        first = moment.date()
+        if planned_datetime(first) < moment:
+            first += timedelta(days=1)
+    if date_to:
+        last = as_utc(date_to).date()
+    return first, last
+
+
+async def materialized_dates(db: AsyncSession, user_id: Optional[int], rule_ids: Iterable[int],
+                             date_from: Optional[date] = None, date_to: Optional[date] = None) -> set:
+    """(rule_id, дата) повторений, которые уже стали строками — в repeat_operations или в архиве"""
+    rule_ids = list(rule_ids)
+    if not rule_ids:
+        return set()
+    queries = []
+    for model in (RepeatOperations, RepeatOperationsArchive):
+        query = select(model.rule_id, model.planned_date).where(model.rule_id.in_(rule_ids))
+        if user_id is not None:
+            query = query.where(model.user_id == user_id)
+        if date_from:
+            query = query.where(model.planned_date >= planned_datetime(date_from))
+        if date_to:
+            query = query.where(model.planned_date < planned_datetime(date_to + timedelta(days=1)))
+        queries.append(query)
+    rows = (await db.execute(union_all(*queries))).all()
+    return {(rule_id, planned.astimezone(timezone.utc).date()) for rule_id, planned in rows}
+
+
+async def expand_rules(db: AsyncSession, rules: List[RepeatRules], user_id: int,
+                       date_from: Optional[date] = None, date_to: Optional[date] = None,
+                       with_relations: bool = True) -> List[Occurrence]:
+    """Невыполненные повторения правил пользователя за период, по возрастанию даты"""
+    if not rules:
+        return []
+    done = await materialized_dates(db, user_id, [rule.id for rule in rules], date_from, date_to)
+    occurrences = [
+        make_occurrence(rule, day, with_relations)
+        for rule in rules
+        for day in rule_dates(rule, date_from, date_to)
+        if (rule.id, day) not in done
+    ]
+    occurrences.sort(key=lambda occurrence: (occurrence.planned_date, occurrence.rule_id))
+    return occurrences
+
+
+def rules_query(user_id: int, date_from: Optional[date] = None, date_to: Optional[date] = None):
+    """Правила пользователя, у которых могут быть повторения в периоде"""
+    query = select(RepeatRules).where(RepeatRules.user_id == user_id)
+    if date_from:
+        query = query.where((RepeatRules.until.is_(None)) | (RepeatRules.until >= date_from))
+    if date_to:
+        query = query.where(RepeatRules.anchor_date <= date_to)
+    return query
+
+
+def occurrence_row(rule: RepeatRules, day: date) -> dict:
+    """Значения строки repeat_operations для повторения правила"""
+    return dict(
+        rule_id=rule.id,
+        planned_date=planned_datetime(day),
+        balance=rule.balance,
+        moded=rule.moded,
+        name=rule.name,
+        completed=False,
+        user_id=rule.user_id,
+        account_id=rule.account_id,
+        category_id=rule.category_id,
+        debt_id=rule.debt_id,
+        target_id=rule.target_id,
+        limit_id=rule.limit_id,
+        task_id=rule.task_id,
+    )
+
+
+async def materialize_occurrences(db: AsyncSession, user_id: int,
+                                  pairs: Iterable[tuple[int, date]]) -> dict:
+    """
+    Строки repeat_operations для нескольких повторений правил пользователя (без commit):
+    недостающие вставляются одним INSERT, строки читаются одним запросом с блокировкой.
+    Возвращает {(rule_id, дата): строка}; None — повторение уже выполнено и лежит в архиве.
+    Пар, которые не являются повторениями правил пользователя, в ответе нет.
+    """
+    pairs = list(dict.fromkeys(pairs))
+    if not pairs:
+        return {}
+    rules = {
+        rule.id: rule
+        for rule in (await db.execute(
+            select(RepeatRules)
+            .where(RepeatRules.user_id == user_id, RepeatRules.id.in_({rule_id for rule_id, _ in pairs}))
+        )).scalars().all()
+    }
+    valid = [(rule_id, day) for rule_id, day in pairs if rule_id in rules and is_rule_date(rules[rule_id], day)]
+    if not valid:
+        return {}
+    days = [day for _, day in valid]
+    done = await materialized_dates(db, user_id, {rule_id for rule_id, _ in valid}, min(days), max(days))
+    rows = [occurrence_row(rules[rule_id], day) for rule_id, day in valid if (rule_id, day) not in done]
+    if rows:
+        await db.execute(
+            insert(RepeatOperations)
+            .values(rows)
+            .on_conflict_do_nothing(
+                index_elements=[RepeatOperations.rule_id, RepeatOperations.planned_date],
+                index_where=RepeatOperations.rule_id.isnot(None),
+            )
+        )
+    operations = (await db.execute(
+        select(RepeatOperations)
+        .where(tuple_(RepeatOperations.rule_id, RepeatOperations.planned_date).in_(
+            [(rule_id, planned_datetime(day)) for rule_id, day in valid]
+        ))
+        .with_for_update()
+    )).scalars().all()
+    found = {(operation.rule_id, as_utc(operation.planned_date).date()): operation for operation in operations}
+    return {pair: found.get(pair) for pair in valid}
+
+
+async def account_occurrences(db: AsyncSession, user_id: int, account_id: int,
+                              date_from: Optional[datetime] = None, date_to: Optional[datetime] = None,
+                              moded: Optional[str] = None) -> List[Occurrence]:
+    """Невыполненные повторения правил счёта за период (planned_date в [date_from, date_to]) — для прогноза"""
+    first, last = window_dates(date_from, date_to)
+    query = rules_query(user_id, first, last).where(RepeatRules.account_id == account_id)
+    if moded:
+        query = query.where(RepeatRules.moded == moded)
+    rules = (await db.execute(query)).scalars().all()
+    return await expand_rules(db, rules, user_id, first, last, with_relations=False)
@@ -0,0 +1,161 @@
+from typing import Iterable, Optional
+from sqlalchemy import Select, delete, func, literal_column, null, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
+from models import TransactionDailyRollup, Transactions, TransactionsArchive, User
+from routers.archive import with_archive
+from routers.timezones import local_date_sql, user_timezone_sql
+import logging
+# Настройка логгирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Поддержка суточных агрегатов transaction_daily_rollup.
+# День — дата created_at в часовом поясе пользователя (routers/timezones.py),
+# как и в выборках по транзакциям, поэтому агрегат и «сырые» запросы режут сутки одинаково.
+# При смене пояса агрегат пользователя пересобирается (rebuild_user_rollup).
+
+# Должен совпадать с выражениями uq_transaction_daily_rollup_key (0 — литералом,
+# иначе PostgreSQL не сопоставит ON CONFLICT с индексом)
+ROLLUP_KEY = (
+    TransactionDailyRollup.user_id,
+    TransactionDailyRollup.day,
+    TransactionDailyRollup.account_id,
+    TransactionDailyRollup.moded,
+    func.coalesce(TransactionDailyRollup.category_id, literal_column("0")),
+)
+
+
+def _rollup_source(sign: int = 1, source=Transactions):
+    """
+    SELECT сумм транзакций в разрезе ключа агрегата (sign=-1 — для вычитания).
+    source — Transactions или она же вместе с архивом (routers/archive.py)
+    """
+    day = local_date_sql(source.created_at, user_timezone_sql())
+    return select(
+        source.user_id,
+        day.label("day"),
+        source.account_id,
+        source.moded,
+        source.category_id,
+        (func.sum(source.sum) * sign).label("total_sum"),
+        (func.count() * sign).label("tx_count"),
+    ).join(User, User.id == source.user_id).group_by(
+        source.user_id,
+        day,
+        source.account_id,
+        source.moded,
+        source.category_id,
+    )
+
+
+ROLLUP_COLUMNS = ["user_id", "day", "account_id", "moded", "category_id", "total_sum", "tx_count"]
+
+
+def _upsert_from(source):
+    stmt = insert(TransactionDailyRollup).from_select(ROLLUP_COLUMNS, source)
+    return stmt.on_conflict_do_update(
+        index_elements=list(ROLLUP_KEY),
+        set_={
+            "total_sum": TransactionDailyRollup.total_sum + stmt.excluded.total_sum,
+            "tx_count": TransactionDailyRollup.tx_count + stmt.excluded.tx_count,
+            "updated_at": func.now(),
+        },
+    )
+
+
+async def add_to_rollup(db: AsyncSession, transaction_ids: Iterable[int]):
+    """
+    Прибавить транзакции к агрегату. Вызывать после flush (строки уже в БД),
+    в той же транзакции, что и сама запись.
+    """
+    ids = list(transaction_ids)
+    if not ids:
+        return
+    await db.execute(_upsert_from(_rollup_source(1).where(Transactions.id.in_(ids))))
+
+
+async def add_selected_to_rollup(db: AsyncSession, id_query: Select):
+    """
+    То же, что add_to_rollup, но id транзакций задаются подзапросом —
+    для массовых вставок, когда список id держать в памяти незачем.
+    """
+    await db.execute(_upsert_from(_rollup_source(1).where(Transactions.id.in_(id_query))))
+
+
+async def remove_from_rollup(db: AsyncSession, transaction_ids: Iterable[int]):
+    """
+    Вычесть транзакции из агрегата. Вызывать до удаления/изменения строк,
+    в той же транзакции.
+    """
+    ids = list(transaction_ids)
+    if not ids:
+        return
+    await db.execute(_upsert_from(_rollup_source(-1).where(Transactions.id.in_(ids))))
+    # Пустые дни не храним
+    affected_users = select(Transactions.user_id).where(Transactions.id.in_(ids)).distinct()
+    await db.execute(
+        delete(TransactionDailyRollup).where(
+            TransactionDailyRollup.tx_count <= 0,
+            TransactionDailyRollup.user_id.in_(affected_users),
+        )
+    )
+
+
+async def move_category_to_uncategorized(db: AsyncSession, category_id: int):
+    """
+    Перенести в агрегате суммы категории в «без категории» — при её удалении
+    (category_id у транзакций, в том числе архивных, обнуляет внешний ключ).
+    Работает по строкам агрегата, а не по транзакциям: их может быть много и часть — в архиве.
+    """
+    moved = select(
+        TransactionDailyRollup.user_id,
+        TransactionDailyRollup.day,
+        TransactionDailyRollup.account_id,
+        TransactionDailyRollup.moded,
+        null().label("category_id"),
+        TransactionDailyRollup.total_sum,
+        TransactionDailyRollup.tx_count,
+    ).where(TransactionDailyRollup.category_id == category_id)
+    await db.execute(_upsert_from(moved))
+    await db.execute(delete(TransactionDailyRollup).where(TransactionDailyRollup.category_id == category_id))
+
+
+async def rebuild_user_rollup(db: AsyncSession, user_id: int):
+    """
+    Пересобрать агрегат одного пользователя (без commit) — после смены часового пояса
+    сутки режутся иначе, и прибавлять к старым строкам нельзя.
+    """
+    transactions = with_archive(Transactions, TransactionsArchive)
+    await db.execute(delete(TransactionDailyRollup).where(TransactionDailyRollup.user_id == user_id))
+    await db.execute(
+        insert(TransactionDailyRollup).from_select(
+            ROLLUP_COLUMNS, _rollup_source(1, transactions).where(transactions.user_id == user_id)
+        )
+    )
+
+
+def rebuild_rollup(db: Session, user_id: Optional[int] = None) -> int:
+    """
+    Пересобрать агрегат из таблицы транзакций вместе с архивом
+    (целиком или для одного пользователя). Возвращает количество строк агрегата.
+    """
+    transactions = with_archive(Transactions, TransactionsArchive)
+    clear = delete(TransactionDailyRollup)
+    source = _rollup_source(1, transactions)
+    if user_id is not None:
+        clear = clear.where(TransactionDailyRollup.user_id == user_id)
+        source = source.where(transactions.user_id == user_id)
+    db.execute(clear)
+    # После очистки конфликтов ключа нет — обычный INSERT ... SELECT
+    db.execute(
+        insert(TransactionDailyRollup).from_select(ROLLUP_COLUMNS, source)
+    )
+    count_query = select(func.count()).select_from(TransactionDailyRollup)
+    if user_id is not None:
+        count_query = count_query.where(TransactionDailyRollup.user_id == user_id)
+    rows = db.scalar(count_query)
+    db.commit()
+    logger.info(f"Агрегат transaction_daily_rollup пересобран: {rows} строк")
+    return rows
@@ -1,6 +1,6 @@
 
 from fastapi import APIRouter, HTTPException, status, Depends, Query, Response
-from db import SessionLocal
+from db import get_db
 
 
 # Goals
@@ -12,13 +12,6 @@ import logging
 # Настройка логгирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-# Зависимость для получения сессии базы данных
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 # Создаём роутер для пользователей
 router = APIRouter(
     prefix="/rules",
@@ -0,0 +1,395 @@
+import csv
+import hashlib
+import io
+import re
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+from typing import BinaryIO, Iterable, Iterator, List, NamedTuple, Optional
+from sqlalchemy import (
+    Column, DateTime, Integer, MetaData, Numeric, String, Table,
+    case, exists, func, literal, select,
+)
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+from enums import StatementFormatEnum, TransactionsTypeEnum
+from models import Accounts, Categories, Transactions, TransactionsArchive
+import logging
+# Настройка логгирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Импорт банковских выписок (CSV/OFX).
+# Файл проходит цепочку генераторов: строки -> разбор -> категория и хеш -> пачки,
+# пачки уходят в PostgreSQL через COPY во временную таблицу, дедупликация и вставка
+# в transactions — одним INSERT ... SELECT. В памяти держится только текущая пачка.
+
+# Строк в одной пачке COPY
+COPY_CHUNK_SIZE = 5000
+# Сколько ошибок разбора возвращать в ответе (остальные только считаются)
+MAX_REPORTED_ERRORS = 20
+# Numeric(10, 2) у transactions.sum: больше не поместится, и COPY упал бы целиком
+MAX_AMOUNT = Decimal("99999999.99")
+
+# Заголовки CSV (в нижнем регистре) -> поле строки выписки
+CSV_COLUMN_ALIASES = {
+    "date": ("date", "дата", "дата операции", "transaction date", "booking date"),
+    "amount": ("amount", "sum", "сумма", "сумма операции"),
+    "description": ("description", "описание", "memo", "payee", "назначение платежа"),
+    "category": ("category", "категория"),
+    "type": ("type", "moded", "тип"),
+}
+# Даты CSV: 2024-01-05[ 12:00[:00]] и 05.01.2024 / 05/01/2024 [12:00[:00]].
+# Регулярные выражения вместо перебора форматов strptime — разбор даты был самой дорогой частью импорта
+CSV_ISO_DATE = re.compile(r"(\d{4})-(\d{1,2})-(\d{1,2})(?:[ T](\d{1,2}):(\d{2})(?::(\d{2}))?)?")
+CSV_DMY_DATE = re.compile(r"(\d{1,2})[./](\d{1,2})[./](\d{4})(?:[ T](\d{1,2}):(\d{2})(?::(\d{2}))?)?")
+AMOUNT = re.compile(r"[+-]?[\d.,]*\d[\d.,]*")
+OFX_TAG = re.compile(r"<(/?)([A-Za-z0-9.]+)>([^<]*)")
+OFX_DATE = re.compile(r"(\d{8})(\d{6})?(?:\.\d+)?(?:\[([+-]?\d+(?:\.\d+)?)(?::[^\]]*)?\])?")
+
+
+# Временные таблицы живут до конца транзакции (ON COMMIT DROP)
+_import_metadata = MetaData()
+import_staging = Table(
+    "transactions_import",
+    _import_metadata,
+    Column("line", Integer),
+    Column("sum", Numeric(10, 2)),
+    Column("moded", String(255)),
+    Column("category_id", Integer),
+    Column("created_at", DateTime(timezone=True)),
+    Column("import_hash", String(64)),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DROP",
+)
+STAGING_COLUMNS = [column.name for column in import_staging.columns]
+
+imported_rows = Table(
+    "transactions_imported",
+    _import_metadata,
+    Column("id", Integer),
+    Column("delta", Numeric(14, 2)),
+    prefixes=["TEMPORARY"],
+    postgresql_on_commit="DROP",
+)
+
+
+class StatementRow(NamedTuple):
+    line: int  # номер строки CSV / операции в OFX — для сообщений об ошибках
+    created_at: datetime
+    amount: Decimal  # со знаком: расход отрицательный
+    description: str
+    category: Optional[str] = None
+    external_id: Optional[str] = None  # FITID из OFX
+
+
+class ImportStats:
+    """Счётчики импорта, их пополняют генераторы по мере чтения файла"""
+
+    def __init__(self):
+        self.total_rows = 0
+        self.invalid = 0
+        self.errors: List[str] = []
+
+    def add_error(self, line: int, message: str):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(f"Строка {line}: {message}")
+
+
+def parse_amount(value: str) -> Decimal:
+    # «1 234,56», «-1234.56», «1 234,56 ₽», «$-5»: пробелы и валюта по краям отбрасываются
+    cleaned = re.sub(r"^[^\d+\-.,]+|[^\d.,]+$", "", re.sub(r"\s", "", value))
+    if not AMOUNT.fullmatch(cleaned):
+        raise ValueError(f"некорректная сумма «{value}»")
+    cleaned = cleaned.replace(",", ".")
+    if cleaned.count(".") > 1:
+        integer, _, fraction = cleaned.rpartition(".")
+        cleaned = integer.replace(".", "") + "." + fraction
+    try:
+        return Decimal(cleaned)
+    except InvalidOperation:
+        raise ValueError(f"некорректная сумма «{value}»")
+
+
+def parse_csv_date(value: str) -> datetime:
+    value = value.strip()
+    match = CSV_ISO_DATE.fullmatch(value)
+    if match:
+        year, month, day, hour, minute, second = match.groups()
+    else:
+        match = CSV_DMY_DATE.fullmatch(value)
+        if not match:
+            raise ValueError(f"некорректная дата «{value}»")
+        day, month, year, hour, minute, second = match.groups()
+    # datetime() сам отбросит несуществующие даты (31.02 и т.п.) через ValueError
+    try:
+        return datetime(int(year), int(month), int(day), int(hour or 0), int(minute or 0), int(second or 0))
+    except ValueError:
+        raise ValueError(f"некорректная дата «{value}»")
+
+
+def parse_ofx_date(value: str) -> datetime:
+    match = OFX_DATE.match(value.strip())
+    if not match:
+        raise ValueError(f"некорректная дата «{value}»")
+    day, time_part, offset = match.groups()
+    parsed = datetime.strptime(day + (time_part or "000000"), "%Y%m%d%H%M%S")
+    if offset is not None:
+        parsed = parsed.replace(tzinfo=timezone(timedelta(hours=float(offset))))
+    return parsed
+
+
+def read_lines(file: BinaryIO, encoding: str) -> Iterator[str]:
+    """Построчное чтение загруженного файла без загрузки его в память целиком"""
+    text = io.TextIOWrapper(file, encoding=encoding, errors="replace", newline="")
+    try:
+        yield from text
+    finally:
+        # Не даём обёртке закрыть файл UploadFile (если его ещё не закрыл FastAPI)
+        if not file.closed:
+            text.detach()
+
+
+def parse_csv_rows(lines: Iterable[str], stats: ImportStats) -> Iterator[StatementRow]:
+    lines = iter(lines)
+    header_line = next(lines, "")
+    # Выгрузки русских банков — через «;», остальные — через «,»
+    delimiter = ";" if header_line.count(";") > header_line.count(",") else ","
+    header = [name.strip().lower() for name in next(csv.reader([header_line], delimiter=delimiter), [])]
+    positions = {}
+    for field, aliases in CSV_COLUMN_ALIASES.items():
+        for index, name in enumerate(header):
+            if name in aliases:
+                positions[field] = index
+                break
+    if "date" not in positions or "amount" not in positions:
+        raise ValueError("В заголовке CSV нужны колонки date и amount")
+
+    def cell(record, field):
+        index = positions.get(field)
+        return record[index].strip() if index is not None and index < len(record) else ""
+
+    for number, record in enumerate(csv.reader(lines, delimiter=delimiter), start=2):
+        if not any(value.strip() for value in record):
+            continue
+        stats.total_rows += 1
+        try:
+            amount = parse_amount(cell(record, "amount"))
+            moded = cell(record, "type").lower()
+            # Колонка типа задаёт знак, если суммы в выписке без минуса
+            if moded == TransactionsTypeEnum.expense:
+                amount = -abs(amount)
+            elif moded == TransactionsTypeEnum.income:
+                amount = abs(amount)
+            yield StatementRow(
+                line=number,
+                created_at=parse_csv_date(cell(record, "date")),
+                amount=amount,
+                description=cell(record, "description"),
+                category=cell(record, "category") or None,
+            )
+        except ValueError as e:
+            stats.add_error(number, str(e))
+
+
+def parse_ofx_rows(lines: Iterable[str], stats: ImportStats) -> Iterator[StatementRow]:
+    """Операции <STMTTRN> из OFX (SGML 1.x и XML 2.x), теги читаются потоком"""
+    current = None
+    number = 0
+    for line in lines:
+        for closing, tag, value in OFX_TAG.findall(line):
+            tag = tag.upper()
+            if tag == "STMTTRN":
+                if not closing:
+                    number += 1
+                    current = {}
+                    continue
+                if current is None:
+                    continue
+                stats.total_rows += 1
+                try:
+                    if "DTPOSTED" not in current or "TRNAMT" not in current:
+                        raise ValueError("нет DTPOSTED или TRNAMT")
+                    yield StatementRow(
+                        line=number,
+                        created_at=parse_ofx_date(current["DTPOSTED"]),
+                        amount=parse_amount(current["TRNAMT"]),
+                        description=current.get("NAME") or current.get("MEMO", ""),
+                        external_id=current.get("FITID") or None,
+                    )
+                except ValueError as e:
+                    stats.add_error(number, str(e))
+                current = None
+            elif current is not None and not closing:
+                current[tag] = value.strip()
+
+
+def row_key(account_id: int, row: StatementRow) -> str:
+    """Содержимое строки, по которому она узнаётся при повторном импорте"""
+    if row.external_id:
+        return f"{account_id}|fitid|{row.external_id}"
+    return f"{account_id}|{row.created_at.isoformat()}|{row.amount}|{row.description}"
+
+
+def import_hash(account_id: int, row: StatementRow, occurrence: int = 1) -> str:
+    """
+    Хеш содержимого строки выписки. Для OFX — по FITID банка, для CSV — по дате,
+    сумме, описанию и номеру строки среди одинаковых в файле (occurrence): две одинаковые
+    покупки за день — разные операции, а повторный импорт того же файла даёт те же хеши.
+    У первой из одинаковых строк номера в ключе нет — хеши файлов, загруженных раньше, не меняются.
+    """
+    key = row_key(account_id, row)
+    if not row.external_id and occurrence > 1:
+        key = f"{key}|{occurrence}"
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+def to_staging_records(
+    rows: Iterable[StatementRow], account_id: int, categories: dict, stats: ImportStats
+) -> Iterator[tuple]:
+    """Строка выписки -> запись временной таблицы: тип, категория по имени, хеш"""
+    # Сколько раз в файле уже встретилась строка с тем же ключом
+    occurrences = Counter()
+    for row in rows:
+        if row.amount == 0:
+            stats.add_error(row.line, "нулевая сумма")
+            continue
+        if abs(row.amount) > MAX_AMOUNT:
+            stats.add_error(row.line, "слишком большая сумма")
+            continue
+        moded = TransactionsTypeEnum.income if row.amount > 0 else TransactionsTypeEnum.expense
+        category = categories.get((row.category or "").lower())
+        # Категорию берём, только если её тип совпадает с типом операции
+        category_id = category.id if category and category.moded == moded else None
+        key = row_key(account_id, row)
+        occurrences[key] += 1
+        yield (
+            row.line,
+            abs(row.amount),
+            moded.value,
+            category_id,
+            row.created_at,
+            import_hash(account_id, row, occurrences[key]),
+        )
+
+
+def statement_records(
+    file: BinaryIO,
+    file_format: StatementFormatEnum,
+    encoding: str,
+    account_id: int,
+    categories: dict,
+    stats: ImportStats,
+) -> Iterator[tuple]:
+    lines = read_lines(file, encoding)
+    if file_format == StatementFormatEnum.ofx:
+        rows = parse_ofx_rows(lines, stats)
+    else:
+        rows = parse_csv_rows(lines, stats)
+    return to_staging_records(rows, account_id, categories, stats)
+
+
+async def user_categories_by_name(db: AsyncSession, user_id: int) -> dict:
+    """Категории пользователя и общие (user_id IS NULL) по имени в нижнем регистре"""
+    result = await db.scalars(
+        select(Categories)
+        .where((Categories.user_id == user_id) | (Categories.user_id.is_(None)))
+        # Свои категории перекрывают общие с тем же именем
+        .order_by(Categories.user_id.is_(None).desc())
+    )
+    return {category.name.lower(): category for category in result.all()}
+
+
+async def copy_to_staging(db: AsyncSession, records: Iterator[tuple]) -> int:
+    """COPY записей во временную таблицу пачками по COPY_CHUNK_SIZE; возвращает их число"""
+    connection = await db.connection()
+    await connection.run_sync(import_staging.create)
+    await connection.run_sync(imported_rows.create)
+    raw = await connection.get_raw_connection()
+    driver_connection = raw.driver_connection
+    copied = 0
+    while True:
+        # Чтение и разбор файла — синхронные, выносим их из event loop
+        chunk = await run_in_threadpool(lambda: list(islice(records, COPY_CHUNK_SIZE)))
+        if not chunk:
+            return copied
+        await driver_connection.copy_records_to_table(
+            import_staging.name, records=chunk, columns=STAGING_COLUMNS
+        )
+        copied += len(chunk)
+
+
+async def insert_from_staging(db: AsyncSession, user_id: int, account: Accounts) -> tuple[int, Decimal]:
+    """
+    Перенести из временной таблицы в transactions строки, которых ещё нет
+    (по import_hash, в том числе в архиве). balance — баланс счёта после операции, если провести
+    импортированные операции по порядку дат поверх текущего баланса.
+    Id вставленных строк остаются в transactions_imported.
+    Возвращает (число вставленных, суммарное изменение баланса счёта).
+    """
+    staged = import_staging.c
+    unique_rows = (
+        select(import_staging)
+        .distinct(staged.import_hash)
+        .where(
+            ~exists().where(
+                Transactions.user_id == user_id,
+                Transactions.import_hash == staged.import_hash,
+            ),
+            # Уже заархивированные строки старой выписки тоже дубли
+            ~exists().where(
+                TransactionsArchive.user_id == user_id,
+                TransactionsArchive.import_hash == staged.import_hash,
+            ),
+        )
+        .order_by(staged.import_hash, staged.line)
+        .subquery()
+    )
+    row = unique_rows.c
+    delta = case((row.moded == TransactionsTypeEnum.income.value, row.sum), else_=-row.sum)
+    source = select(
+        row.sum,
+        row.moded,
+        row.category_id,
+        row.created_at,
+        row.import_hash,
+        literal(user_id),
+        literal(account.id),
+        literal(account.currency, Transactions.currency.type),
+        literal(False),
+        literal(account.balance, Transactions.balance.type)
+        + func.sum(delta).over(order_by=(row.created_at, row.line)),
+    )
+    inserted = (
+        insert(Transactions)
+        .from_select(
+            ["sum", "moded", "category_id", "created_at", "import_hash",
+             "user_id", "account_id", "currency", "repeat_operation", "balance"],
+            source,
+        )
+        # Параллельный импорт того же файла: дубли отсекает уникальный индекс
+        .on_conflict_do_nothing(
+            index_elements=[Transactions.user_id, Transactions.import_hash, Transactions.created_at],
+            index_where=Transactions.import_hash.isnot(None),
+        )
+        .returning(Transactions.id, Transactions.moded, Transactions.sum)
+        .cte("inserted")
+    )
+    inserted_delta = case(
+        (inserted.c.moded == TransactionsTypeEnum.income.value, inserted.c.sum), else_=-inserted.c.sum
+    )
+    await db.execute(
+        imported_rows.insert().from_select(["id", "delta"], select(inserted.c.id, inserted_delta))
+    )
+    count, total_delta = (await db.execute(
+        select(func.count(), func.coalesce(func.sum(imported_rows.c.delta), 0))
+    )).one()
+    return count, total_delta
+
+
+def imported_ids():
+    """Подзапрос id транзакций, вставленных текущим импортом"""
+    return select(imported_rows.c.id)
@@ -1,7 +1,9 @@
 from fastapi import APIRouter, HTTPException, status, Depends, Query, Response
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from typing import List
-from db import SessionLocal
+from db import get_db
 from models import Targets
 from auth.auth import guard_role, TokenPayload
 from datetime import datetime
@@ -18,26 +20,24 @@ router = APIRouter(
     tags=["targets"],
 )
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
 @router.get("/", summary="Получить все цели", response_model=List[TargetsOut])
-def get_targets(
+async def get_targets(
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    targets = db.query(Targets).filter(Targets.user_id == current_user.user_id).all()
+    targets = (await db.execute(
+        select(Targets)
+        .where(Targets.user_id == current_user.user_id)
+        .options(selectinload(Targets.account))
+    )).scalars().all()
     return targets
 
 @router.post("/", summary="Создать цель", response_model=TargetsOut, status_code=status.HTTP_201_CREATED)
-def create_target(
+async def create_target(
     target: CreateTarget,
     current_user: TokenPayload = Depends(guard_role(["admin", "user"],  limit_key="goals")),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     try:
         new_target = Targets(
@@ -52,22 +52,23 @@ def create_target(
         )
         
         db.add(new_target)
-        db.commit()
-        db.refresh(new_target)
+        await db.commit()
+        await db.refresh(new_target)
+        await db.refresh(new_target, ["account"])
         return new_target
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(str(e))
         raise HTTPException(status_code=500, detail=f"Ошибка при создании цели:{e}")
 
 @router.put("/", summary="Обновить цель", response_model=TargetsOut)
-def update_target(
+async def update_target(
     target_id: int,
     update_data: TargetUpdate,
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    target = db.query(Targets).filter(Targets.id == target_id).first()
+    target = await db.get(Targets, target_id, options=[selectinload(Targets.account)])
     if not target:
         raise HTTPException(status_code=404, detail="Цель не найдена")
     if target.user_id != current_user.user_id:
@@ -77,22 +78,22 @@ def update_target(
         setattr(target, field, value)
     target.updated_at = datetime.utcnow()
 
-    db.commit()
-    db.refresh(target)
+    await db.commit()
+    await db.refresh(target)
     return target
 
 @router.delete("/", summary="Удалить цель", status_code=status.HTTP_204_NO_CONTENT)
-def delete_target(
+async def delete_target(
     target_id: int,
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    target = db.query(Targets).filter(Targets.id == target_id).first()
+    target = await db.get(Targets, target_id)
     if not target:
         raise HTTPException(status_code=404, detail="Цель не найдена")
     if target.user_id != current_user.user_id:
         raise HTTPException(status_code=403, detail="Недостаточно прав для удаления этой цели")
 
-    db.delete(target)
-    db.commit()
+    await db.delete(target)
+    await db.commit()
     return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -2,27 +2,20 @@ from datetime import datetime
 import logging
 from fastapi import APIRouter, Depends, HTTPException, status
 from fastapi.encoders import jsonable_encoder
-from sqlalchemy.orm import Session
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.exc import SQLAlchemyError
 from typing import List
-from routers.transactions import create_transaction, delete_transaction
+from routers.transactions import apply_transaction_update, create_transaction, delete_transaction, transaction_response_options
 from routers.project import update_progress
 import json
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
 from sqlalchemy.orm import contains_eager
-from db import SessionLocal
+from db import get_db
 from models import Project, Tasks, Transactions
 from auth.auth import TokenPayload, guard_role
 from schemas import CreateTransaction, TaskCreate, TaskUpdate, TaskOut, TaskUpdateOut
 
-# Зависимость для получения сессии базы данных
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -42,11 +35,17 @@ def loggger_json(data):
     except TypeError as e:
         logger.error(f"Ошибка при преобразовании данных в JSON: {e}")
 
-def get_task_by_user_id(task_id, db):
+# Связи, которые нужны для сериализации TaskOut
+task_response_options = (
+    selectinload(Tasks.account),
+    selectinload(Tasks.transaction).options(*transaction_response_options),
+)
+
+async def get_task_by_user_id(task_id, db):
     """
     Получение лимитов по user_id
     """
-    return db.query(Tasks).filter(Tasks.id == task_id).first()
+    return await db.get(Tasks, task_id)
 
 
 @router.get(
@@ -55,14 +54,16 @@ def get_task_by_user_id(task_id, db):
     response_model=List[TaskOut],
     status_code=status.HTTP_200_OK
 )
-def get_tasks_by_project(
+async def get_tasks_by_project(
     project_id: int,
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     logger.info(f"[get_tasks_by_project] user_id={current_user.user_id}, project_id={project_id}")
     try:
-        tasks = db.query(Tasks).options(joinedload(Tasks.transaction)).filter(Tasks.project_id == project_id).all()
+        tasks = (await db.execute(
+            select(Tasks).options(*task_response_options).where(Tasks.project_id == project_id)
+        )).scalars().all()
         if not tasks:
             raise HTTPException(status_code=404, detail="Задачи не найдены")
         return tasks
@@ -80,9 +81,9 @@ logger = logging.getLogger(__name__)
 
 @router.get('/current',
             summary="Актуальные задачи (незавершенные, начиная от текущей даты)")
-def current_tasks(
+async def current_tasks(
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     limit: int = 10,
     include_completed: bool = False
 ):
@@ -91,11 +92,11 @@ def current_tasks(
         current_date = datetime.now()
 
         # Загружаем задачи вместе с проектами (avoid N+1 problem)
-        tasks = db.query(Tasks).join(Project).filter(
+        tasks = (await db.execute(select(Tasks).join(Project).where(
             Project.user_id == user_id,
             Tasks.date_end >= current_date,
             Tasks.completed == include_completed
-        ).options(joinedload(Tasks.project)).order_by(Tasks.date_end.asc()).limit(limit).all()
+        ).options(joinedload(Tasks.project)).order_by(Tasks.date_end.asc()).limit(limit))).scalars().all()
 
         # Формируем ответ с добавлением цвета проекта
         response = []
@@ -119,20 +120,20 @@ def current_tasks(
 async def create_task(
     task_data: TaskCreate,
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         logger.info(f"[create_task] user_id={current_user.user_id}, data={task_data}")
         print(task_data)
         task = Tasks(**task_data.dict())
         db.add(task)
-        db.commit()
-        db.refresh(task)
+        await db.commit()
+        await db.refresh(task)
         await update_progress(task_data.project_id, current_user.user_id, db)
         return task_data
     except SQLAlchemyError as e:
         logger.error(f"[create_task] DB error: {e}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail="Ошибка при создании задачи")
 
 
@@ -142,7 +143,7 @@ async def create_task(
     
     - При установке completed=true:
       * Если переданы sum, moded и account_id - создает новую транзакцию
-      * Если уже есть транзакция - сначала удаляет старую
+      * Если уже есть транзакция - изменяет её на месте (балансы корректируются на разницу)
       * Возвращает статус создания транзакции
     
     - При установке completed=false:
@@ -156,15 +157,15 @@ async def update_task(
     task_id: int,
     update_data: TaskUpdate,
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         logger.info(f"[update_task] user_id={current_user.user_id}, task_id={task_id}, data={update_data}")
         
-        task = db.query(Tasks).options(joinedload(Tasks.transaction)).join(Project).filter(
+        task = await db.scalar(select(Tasks).options(joinedload(Tasks.transaction)).join(Project).where(
             Tasks.id == task_id,
             Project.user_id == current_user.user_id
-        ).first()
+        ))
 
         if not task:
             logger.warning(f"[update_task] Задача не найдена: task_id={task_id}")
@@ -193,20 +194,22 @@ async def update_task(
                 )
 
                 if task.transaction:
-                    logger.info('Транзакция существует, удаляем')
-                    await delete_transaction(
-                        transaction_id=task.transaction.id,
+                    # Меняем существующую транзакцию на разницу, а не удаляем и создаём заново;
+                    # фиксируется вместе с задачей одним commit ниже
+                    logger.info('Транзакция существует, обновляем')
+                    new_transaction = await apply_transaction_update(db, task.transaction, {
+                        "sum": sum_value,
+                        "moded": moded_value,
+                        "account_id": account_id,
+                    })
+                    transaction_status = "Транзакция обновлена"
+                else:
+                    new_transaction = await create_transaction(
+                        transaction_data=transaction_data,
                         current_user=current_user,
                         db=db
                     )
-                    transaction_status = "Старая транзакция удалена, "
-
-                new_transaction = await create_transaction(
-                    transaction_data=transaction_data,
-                    current_user=current_user,
-                    db=db
-                )
-                transaction_status += "Новая транзакция создана"
+                    transaction_status = "Новая транзакция создана"
             else:
                 transaction_status = "Не хватает данных для транзакции"
                 logger.info('Задача выполнена, но не хватает данных для транзакции')
@@ -224,9 +227,15 @@ async def update_task(
         for field, value in update_data.dict(exclude_unset=True).items():
             setattr(task, field, value)
         
-        db.commit()
-        db.refresh(task)
+        await db.commit()
         await update_progress(task.project_id, current_user.user_id, db)
+        # Перечитываем задачу вместе со связями для ответа
+        db.expire(task, ["transaction"])
+        task = await db.scalar(
+            select(Tasks)
+            .where(Tasks.id == task_id)
+            .options(*task_response_options)
+        )
 
         return {
             "task": task,
@@ -235,7 +244,7 @@ async def update_task(
 
     except SQLAlchemyError as e:
         logger.error(f"[update_task] DB error: {e}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail=f"Ошибка при обновлении задачи: {str(e)}")
 
 @router.delete(
@@ -245,14 +254,14 @@ async def update_task(
 async def delete_task(
     task_id: int,
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     try:
         logger.info(f"[delete_task] user_id={current_user.user_id}, task_id={task_id}")
-        task = db.query(Tasks).options(joinedload(Tasks.transaction)).join(Project).filter(
+        task = await db.scalar(select(Tasks).options(joinedload(Tasks.transaction)).join(Project).where(
                 Tasks.id == task_id,
                 Project.user_id == current_user.user_id
-            ).first()
+            ))
         if not task:
             raise HTTPException(status_code=404, detail="Задача не найдена")
         loggger_json(task)
@@ -265,13 +274,13 @@ async def delete_task(
                 )
                 if delete_transaction_res:
                     logger.info('Удалили транзакцию')
-        db.delete(task)
-        db.commit()
+        await db.delete(task)
+        await db.commit()
         await update_progress(task.project_id, current_user.user_id, db)
         
         logger.info(f"[delete_task] Успешно удалена: task_id={task_id}")
         return {"detail": "Задача удалена"}
     except SQLAlchemyError as e:
         logger.error(f"[delete_task] DB error: {e}")
-        db.rollback()
+        await db.rollback()
         raise HTTPException(status_code=500, detail="Ошибка при удалении задачи")
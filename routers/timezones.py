@@ -0,0 +1,81 @@
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from sqlalchemy import func, literal_column
+from models import User
+import logging
+# Настройка логгирования
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Сутки пользователя. created_at хранится как timestamptz, а «день» операции —
+# календарная дата в часовом поясе пользователя (User.timezone, IANA-имя вроде
+# «Europe/Moscow»; пустой или неизвестный пояс — UTC).
+# Границы периода переводятся в моменты времени на стороне приложения, поэтому
+# фильтры по created_at остаются диапазонами по индексу и отсекают лишние секции.
+
+DEFAULT_TIMEZONE = "UTC"
+
+
+def is_valid_timezone(name: str) -> bool:
+    try:
+        ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return False
+    return True
+
+
+def user_zone(name: Optional[str]) -> ZoneInfo:
+    """ZoneInfo пояса пользователя; при пустом или неизвестном имени — UTC"""
+    if name and is_valid_timezone(name):
+        return ZoneInfo(name)
+    return ZoneInfo(DEFAULT_TIMEZONE)
+
+
+def user_today(name: Optional[str], now: Optional[datetime] = None) -> date:
+    """Сегодняшняя дата у пользователя"""
+    now = now or datetime.now(timezone.utc)
+    return now.astimezone(user_zone(name)).date()
+
+
+def day_start(day: date, name: Optional[str]) -> datetime:
+    """Начало суток day в поясе пользователя (aware datetime) — граница для created_at"""
+    return datetime.combine(day, time.min, tzinfo=user_zone(name))
+
+
+def day_end(day: date, name: Optional[str]) -> datetime:
+    """Начало следующих суток — исключающая верхняя граница"""
+    return day_start(day + timedelta(days=1), name)
+
+
+def period_bounds(date_from: Optional[date], date_to: Optional[date],
+                  name: Optional[str]) -> tuple[Optional[datetime], Optional[datetime]]:
+    """Фильтры date_from / date_to (даты из запроса) — полночи этих дат в поясе пользователя"""
+    return (
+        day_start(date_from, name) if date_from else None,
+        day_start(date_to, name) if date_to else None,
+    )
+
+
+def as_user_time(value: Optional[datetime], name: Optional[str]) -> Optional[datetime]:
+    """Дата операции без смещения (date_operation) — время по часам пользователя"""
+    if value is None or value.tzinfo is not None:
+        return value
+    return value.replace(tzinfo=user_zone(name))
+
+
+def local_date(value: datetime, name: Optional[str]) -> date:
+    """Дата момента времени в поясе пользователя"""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(user_zone(name)).date()
+
+
+def user_timezone_sql():
+    """Пояс пользователя в SQL; 'UTC' — литералом, чтобы выражение в SELECT и GROUP BY совпадало"""
+    return func.coalesce(User.timezone, literal_column(f"'{DEFAULT_TIMEZONE}'"))
+
+
+def local_date_sql(created_at, tz):
+    """Дата created_at в поясе tz (SQL-выражение или имя пояса)"""
+    return func.date(func.timezone(tz, created_at))
@@ -1,16 +1,31 @@
 from datetime import date, datetime
 from typing import List, Optional
-from fastapi import APIRouter, HTTPException, status, Depends, Query
+from fastapi import APIRouter, HTTPException, status, Depends, File, Query, UploadFile
 from fastapi.encoders import jsonable_encoder
-from models import Debts, User, Categories, Accounts, Transactions, Limits, Targets  # Добавляем импорт модели Transaction
-from db import SessionLocal
-from sqlalchemy.orm import Session
-from schemas import TransactionResponse, CreateTransaction, TransactionsTypeEnum, TransactionsWithStatsResponse
+from fastapi.responses import StreamingResponse
+from models import Debts, User, Categories, Accounts, Transactions, Limits, OperationsRepeat, Targets, Tasks, TransactionDailyRollup  # Добавляем импорт модели Transaction
+from db import AsyncSessionLocal, get_db
+from routers.archive import transactions_source
+from routers.rollup import add_selected_to_rollup, add_to_rollup, remove_from_rollup
+from routers.timezones import as_user_time, local_date, local_date_sql, period_bounds, user_zone
+from routers.statement_import import (
+    ImportStats, copy_to_staging, imported_ids, insert_from_staging, statement_records, user_categories_by_name,
+)
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload, with_expression
+from sqlalchemy.orm.attributes import set_committed_value
+from schemas import TransactionResponse, CreateTransaction, UpdateTransaction, TransactionsTypeEnum, TransactionsWithStatsResponse, TransactionBatchResponse, TransactionImportResponse
+from enums import ExportFormatEnum, StatementFormatEnum
 from auth.auth import  guard_role, TokenPayload
 from collections import defaultdict
+from decimal import Decimal
+import base64
+import csv
+import io
 import logging
 import json
-from sqlalchemy import func, desc  # Добавляем этот импорт в начале файла
+import time
+from sqlalchemy import and_, case, delete, func, desc, select, tuple_, update  # Добавляем этот импорт в начале файла
 # Настройка логгирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -20,13 +35,20 @@ router = APIRouter(
     tags=["transactions"],  # Группировка в Swagger UI
 )
 
-# Зависимость для получения сессии базы данных
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Связи, которые нужны для сериализации TransactionResponse.
+# В асинхронной сессии ленивой подгрузки нет, поэтому грузим их заранее.
+def transaction_load_options(source=Transactions):
+    """Связи для TransactionResponse; source — Transactions или её алиас (например, вместе с архивом)"""
+    return (
+        selectinload(source.category),
+        selectinload(source.limit),
+        selectinload(source.target).selectinload(Targets.account),
+        selectinload(source.debt),
+        selectinload(source.task),
+    )
+
+
+transaction_response_options = transaction_load_options()
 
 def loggger_json(data):
     """
@@ -39,6 +61,215 @@ def loggger_json(data):
     except TypeError as e:
         logger.error(f"Ошибка при преобразовании данных в JSON: {e}")
 
+async def prefetch_transaction_refs(db: AsyncSession, user_id: int, transaction_data: CreateTransaction):
+    """
+    Пользователь, счёт, категория, долг, цель и лимит категории — одним SELECT.
+    Отсутствующие связи приходят как None; если нет пользователя — вернёт None.
+    """
+    query = (
+        select(User, Accounts, Categories, Debts, Targets, Limits)
+        .select_from(User)
+        .outerjoin(Accounts, Accounts.id == transaction_data.account_id)
+        .outerjoin(Categories, Categories.id == transaction_data.category_id)
+        .outerjoin(Debts, and_(Debts.id == transaction_data.debt_id, Debts.user_id == user_id))
+        .outerjoin(Targets, and_(Targets.id == transaction_data.target_id, Targets.user_id == user_id))
+        .outerjoin(Limits, and_(Limits.category_id == Categories.id, Limits.user_id == user_id))
+        .where(User.id == user_id)
+        .limit(1)
+    )
+    return (await db.execute(query)).first()
+
+
+def balance_delta(moded, amount):
+    """Изменение баланса счёта: доход прибавляет, расход вычитает"""
+    if moded == TransactionsTypeEnum.income:
+        return amount
+    if moded == TransactionsTypeEnum.expense:
+        return -amount
+    return 0
+
+
+async def change_account_balance(db: AsyncSession, account: Accounts, delta):
+    """balance = balance + delta одной командой; возвращает новый баланс"""
+    balance = await db.scalar(
+        update(Accounts)
+        .where(Accounts.id == account.id)
+        .values(balance=Accounts.balance + delta)
+        .returning(Accounts.balance)
+        .execution_options(synchronize_session=False)
+    )
+    # Объект в сессии приводим к значению из БД без лишнего SELECT
+    set_committed_value(account, "balance", balance)
+    return balance
+
+
+async def pay_debt(db: AsyncSession, debt: Debts, amount) -> Decimal:
+    """
+    Погашение долга: баланс не ниже нуля, при полном погашении — completed.
+    Возвращает, сколько реально погашено (не больше остатка долга) — это сумма для отмены
+    """
+    # Остаток до погашения берём из той же строки под блокировкой: RETURNING видит только новые значения
+    current = (
+        select(Debts.id, Debts.balance.label("balance_before"))
+        .where(Debts.id == debt.id, Debts.balance > 0)
+        .with_for_update()
+        .subquery()
+    )
+    remaining = current.c.balance_before - amount
+    row = (await db.execute(
+        update(Debts)
+        .where(Debts.id == current.c.id)
+        .values(
+            balance=case((remaining > 0, remaining), else_=0),
+            completed=case((remaining <= 0, True), else_=Debts.completed),
+        )
+        .returning(Debts.balance, Debts.completed, current.c.balance_before)
+        .execution_options(synchronize_session=False)
+    )).first()
+    if not row:
+        return Decimal(0)
+    set_committed_value(debt, "balance", row.balance)
+    set_committed_value(debt, "completed", row.completed)
+    logger.info(f"Корректируем баланс долга: {row.balance}")
+    if row.completed:
+        logger.info("Долг полностью погашен, отмечаем как завершенный")
+    return row.balance_before - row.balance
+
+
+async def add_limit_spent(db: AsyncSession, limit: Limits, amount):
+    row = (await db.execute(
+        update(Limits)
+        .where(Limits.id == limit.id)
+        .values(current_spent=Limits.current_spent + amount)
+        .returning(Limits.current_spent, Limits.balance)
+        .execution_options(synchronize_session=False)
+    )).first()
+    set_committed_value(limit, "current_spent", row.current_spent)
+    if row.current_spent > row.balance:
+        logger.info(f"Лимит превышен: {row.current_spent} > {row.balance}")
+
+
+async def refund_debt(db: AsyncSession, debt: Debts, amount):
+    """Отмена погашения долга (изменение/удаление транзакции): amount — сколько транзакция реально погасила"""
+    new_balance = Debts.balance + amount
+    row = (await db.execute(
+        update(Debts)
+        .where(Debts.id == debt.id)
+        .values(balance=new_balance, completed=new_balance <= 0)
+        .returning(Debts.balance, Debts.completed)
+        .execution_options(synchronize_session=False)
+    )).first()
+    set_committed_value(debt, "balance", row.balance)
+    set_committed_value(debt, "completed", row.completed)
+    logger.info(f"Возвращаем сумму в долг: {row.balance}")
+
+
+async def add_target_balance(db: AsyncSession, target: Targets, amount):
+    new_balance = Targets.balance + amount
+    if amount >= 0:
+        completed = case((new_balance >= Targets.balance_target, True), else_=Targets.completed)
+    else:
+        # Сумму забрали из цели — если она стала меньше нужной, цель снова не достигнута
+        completed = case((new_balance >= Targets.balance_target, Targets.completed), else_=False)
+    row = (await db.execute(
+        update(Targets)
+        .where(Targets.id == target.id)
+        .values(
+            balance=new_balance,
+            completed=completed,
+        )
+        .returning(Targets.balance, Targets.completed)
+        .execution_options(synchronize_session=False)
+    )).first()
+    set_committed_value(target, "balance", row.balance)
+    set_committed_value(target, "completed", row.completed)
+    if row.completed:
+        logger.info("Цель достигнута, отмечаем как завершенную")
+
+
+def transaction_effects(moded=None, amount=0, account_id=None, limit_id=None, target_id=None, debt_id=None) -> dict:
+    """
+    Что транзакция меняет в балансах (так же, как create_transaction):
+    {"accounts"|"debts"|"limits"|"targets": {id: сумма}}. Без аргументов — «ничего».
+    """
+    effects = {"accounts": {}, "debts": {}, "limits": {}, "targets": {}}
+    if account_id:
+        effects["accounts"][account_id] = balance_delta(moded, amount)
+    if debt_id and moded == TransactionsTypeEnum.income:
+        effects["debts"][debt_id] = amount
+    if limit_id:
+        effects["limits"][limit_id] = amount
+    if target_id:
+        effects["targets"][target_id] = amount
+    return effects
+
+
+def stored_transaction_effects(transaction: Transactions) -> dict:
+    effects = transaction_effects(
+        transaction.moded, transaction.sum, transaction.account_id,
+        transaction.limit_id, transaction.target_id,
+    )
+    # Погашение долга обрезается на нуле: отменять нужно то, что реально погашено
+    if transaction.debt_id and transaction.debt_paid:
+        effects["debts"][transaction.debt_id] = transaction.debt_paid
+    return effects
+
+
+def effects_difference(old: dict, new: dict) -> dict:
+    """
+    Разница new - old по каждому счёту/лимиту/цели, нулевые изменения отброшены.
+    Долги не складываются — погашение обрезается на нуле, поэтому для долга
+    это пара (вернуть погашенное old, погасить заново new)
+    """
+    difference = {}
+    for kind in old:
+        if kind == "debts":
+            difference[kind] = {
+                debt_id: (old[kind].get(debt_id, 0), new[kind].get(debt_id, 0))
+                for debt_id in old[kind].keys() | new[kind].keys()
+            }
+            continue
+        deltas = defaultdict(Decimal)
+        for row_id, amount in new[kind].items():
+            deltas[row_id] += amount
+        for row_id, amount in old[kind].items():
+            deltas[row_id] -= amount
+        difference[kind] = {row_id: amount for row_id, amount in deltas.items() if amount}
+    return difference
+
+
+async def apply_balance_effects(db: AsyncSession, effects: dict) -> tuple[dict, dict]:
+    """
+    Применить изменения балансов атомарными UPDATE в порядке create_transaction:
+    счета, долги, лимиты, цели — каждые по id.
+    Возвращает (новые балансы счетов, {debt_id: сколько погашено заново}).
+    """
+    balances = {}
+    debt_paid = {}
+    for account_id in sorted(effects["accounts"]):
+        account = await db.get(Accounts, account_id)
+        if account:
+            balances[account_id] = await change_account_balance(db, account, effects["accounts"][account_id])
+    for debt_id in sorted(effects["debts"]):
+        debt = await db.get(Debts, debt_id)
+        refund, payment = effects["debts"][debt_id]
+        if not debt:
+            continue
+        if refund > 0:
+            await refund_debt(db, debt, refund)
+        if payment > 0:
+            debt_paid[debt_id] = await pay_debt(db, debt, payment)
+    for limit_id in sorted(effects["limits"]):
+        limit = await db.get(Limits, limit_id)
+        if limit:
+            await add_limit_spent(db, limit, effects["limits"][limit_id])
+    for target_id in sorted(effects["targets"]):
+        target = await db.get(Targets, target_id)
+        if target:
+            await add_target_balance(db, target, effects["targets"][target_id])
+    return balances, debt_paid
+
+
 @router.post(
     "/",
     # status_code=status.HTTP_201_CREATED,
@@ -49,7 +280,7 @@ def loggger_json(data):
 async def create_transaction(
     transaction_data: CreateTransaction,
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """
     Это модель транзакции, содержащая следующие поля: 
@@ -64,34 +295,25 @@ async def create_transaction(
     - transaction_data - Дата выполнения транзакции (может быть null)
     """
     logger.info(f"Создание транзакции для user_id: {current_user.user_id}")
-    # Проверяем существование пользователя
-    user:User = db.query(User).filter(User.id == current_user.user_id).first()
-    if not user:
+    # Все связанные строки — одним запросом
+    refs = await prefetch_transaction_refs(db, current_user.user_id, transaction_data)
+    if not refs:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Указанный пользователь не найден"
         )
-        
-    # Ищем категорию по ID, если указана
-    category = None
-    if transaction_data.category_id:
-        category:Categories = db.query(Categories).filter(Categories.id == transaction_data.category_id).first()
-        if not category:
-                logger.info(f"Указанной категория не найдена!")  
+    user, account, category, debt, target, limit = refs
+
+    if transaction_data.category_id and not category:
+        logger.info(f"Указанной категория не найдена!")  
 
-    account:Accounts = db.query(Accounts).filter(Accounts.id == transaction_data.account_id).first()
     if not account:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Указанной счет не найден"
         )
-    if transaction_data.debt_id:
-        debt:Debts = db.query(Debts).filter(
-            Debts.id == transaction_data.debt_id,
-            Debts.user_id == current_user.user_id
-        ).first()
-        if not debt:
-            raise HTTPException(404, "Долг не найден")
+    if transaction_data.debt_id and not debt:
+        raise HTTPException(404, "Долг не найден")
     
     if category and category.moded != transaction_data.moded:
         raise HTTPException(
@@ -103,55 +325,29 @@ async def create_transaction(
 
     try:
         logger.info(f"Создание транзакции")
-        if transaction_data.moded == TransactionsTypeEnum.expense:
-            account.balance -= transaction_data.sum
-        elif transaction_data.moded == TransactionsTypeEnum.income:
-            account.balance += transaction_data.sum
-        logger.info(f"Корректируем баланс счета: {account.balance}")  
+        # Балансы меняем атомарными UPDATE ... RETURNING, а не чтением-записью в Python:
+        # параллельные транзакции по одному счёту не затирают друг друга
+        balance = await change_account_balance(
+            db, account, balance_delta(transaction_data.moded, transaction_data.sum)
+        )
+        logger.info(f"Корректируем баланс счета: {balance}")  
         
-        if transaction_data.debt_id is not None:
-            debt = db.query(Debts).filter(Debts.id == transaction_data.debt_id).first()
-            if debt:
-                if transaction_data.moded == TransactionsTypeEnum.income:
-                    # Корректируем баланс долга только для доходных операций
-                    if debt.balance > 0:
-                        debt.balance = max(0, debt.balance - transaction_data.sum)
-                        logger.info(f"Корректируем баланс долга: {debt.balance}")
-
-                        # Если долг погашен полностью
-                        if debt.balance <= 0:
-                            debt.completed = True
-                            logger.info("Долг полностью погашен, отмечаем как завершенный")
-                            
-    #     logger.info(f"Корректируем лимит: {category.id}") 
-    
-    
-        # ищем лимит где совпадает категория id и юзер id
-        limit = None
-        if category:
-            limit = db.query(Limits).filter(
-                Limits.category_id == category.id,
-                Limits.user_id == current_user.user_id
-            ).first()
-            if limit:
-                logger.info(f"Лимит найден: {limit.id}")
-                limit.current_spent += transaction_data.sum
-                # db.refresh(limit)
-                if limit.current_spent > limit.balance:
-                    logger.info(f"Лимит превышен: {limit.current_spent} > {limit.balance}")
+        if debt and transaction_data.moded == TransactionsTypeEnum.income:
+            # Корректируем баланс долга только для доходных операций
+            debt_paid = await pay_debt(db, debt, transaction_data.sum)
         else:
-            logger.info(f"Категория не найдена, пропускаем корректировку лимита")
-         # ищем цель где совпадает цель id и юзер id
-        target = db.query(Targets).filter(
-            Targets.id == transaction_data.target_id,
-            Targets.user_id == current_user.user_id
-        ).first()
+            debt_paid = None
+
+        # лимит, где совпадает категория id и юзер id
+        if limit:
+            logger.info(f"Лимит найден: {limit.id}")
+            await add_limit_spent(db, limit, transaction_data.sum)
+        else:
+            logger.info(f"Лимит не найден, пропускаем корректировку лимита")
+        # цель, где совпадает цель id и юзер id
         if target: 
-             logger.info(f"Цель найдена: {target.id}")
-             target.balance += transaction_data.sum
-             if target.balance >= target.balance_target:
-                 target.completed = True
-                 logger.info("Цель достигнута, отмечаем как завершенную")
+            logger.info(f"Цель найдена: {target.id}")
+            await add_target_balance(db, target, transaction_data.sum)
         else:
             logger.info(f"Цель не найдена, пропускаем корректировку цели")   
          # # Создаем объект транзакции
@@ -165,16 +361,20 @@ async def create_transaction(
             limit_id=limit.id if limit else None,  # Может быть None
             target_id=target.id if target else None,  # Может быть None
             debt_id=transaction_data.debt_id if transaction_data.debt_id else None,  # Может быть None
+            debt_paid=debt_paid,
             currency = account.currency,  # Используем валюту счета
-            balance = account.balance,
+            balance = balance,
             task_id = transaction_data.task_id if transaction_data.task_id else None,
-            created_at = transaction_data.date_operation if transaction_data.date_operation else None 
+            created_at = as_user_time(transaction_data.date_operation, user.timezone)
         )  
         loggger_json(new_transaction)
         db.add(new_transaction)
-        db.commit()
+        await db.flush()
+        # Суточный агрегат обновляем в той же транзакции
+        await add_to_rollup(db, [new_transaction.id])
+        await db.commit()
         # Обновляем объект чтобы получить сгенерированные поля
-        db.refresh(new_transaction)
+        await db.refresh(new_transaction)
         # загружаем транзакцию с категорией
         if category:
             new_transaction.category = category  # присваиваем уже загруженную категорию
@@ -184,7 +384,7 @@ async def create_transaction(
         return new_transaction
     except Exception as e:
         # В случае ошибки откатываем транзакцию
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при создании транзакции: {str(e)}"
@@ -192,16 +392,386 @@ async def create_transaction(
 
     
 
+# Максимум элементов в одном пакетном запросе
+BATCH_MAX_ITEMS = 500
+
+
+async def _rows_by_id(db: AsyncSession, query) -> dict:
+    return {row.id: row for row in (await db.scalars(query)).all()}
+
+
+async def prefetch_batch_refs(db: AsyncSession, user_id: int, items: List[CreateTransaction]) -> dict:
+    """
+    Связанные строки для пачки транзакций — по одному запросу на таблицу
+    (WHERE id IN (...)), независимо от размера пачки.
+    """
+    def ids(field):
+        return {getattr(item, field) for item in items if getattr(item, field)}
+
+    account_ids, category_ids = ids("account_id"), ids("category_id")
+    debt_ids, target_ids, task_ids = ids("debt_id"), ids("target_id"), ids("task_id")
+    refs = {"accounts": {}, "categories": {}, "debts": {}, "targets": {}, "tasks": {}, "limits": {}}
+    if account_ids:
+        refs["accounts"] = await _rows_by_id(db, select(Accounts).where(Accounts.id.in_(account_ids)))
+    if category_ids:
+        refs["categories"] = await _rows_by_id(db, select(Categories).where(Categories.id.in_(category_ids)))
+        # Лимит категории: как и в create_transaction — первый по категории и пользователю
+        limits = await db.scalars(
+            select(Limits)
+            .where(Limits.user_id == user_id, Limits.category_id.in_(category_ids))
+            .order_by(Limits.id)
+        )
+        for limit in limits.all():
+            refs["limits"].setdefault(limit.category_id, limit)
+    if debt_ids:
+        refs["debts"] = await _rows_by_id(
+            db, select(Debts).where(Debts.id.in_(debt_ids), Debts.user_id == user_id)
+        )
+    if target_ids:
+        refs["targets"] = await _rows_by_id(
+            db,
+            select(Targets)
+            .where(Targets.id.in_(target_ids), Targets.user_id == user_id)
+            .options(selectinload(Targets.account)),
+        )
+    if task_ids:
+        refs["tasks"] = await _rows_by_id(db, select(Tasks).where(Tasks.id.in_(task_ids)))
+    return refs
+
+
+def check_batch_item(item: CreateTransaction, refs: dict):
+    """Те же проверки, что и в create_transaction; возвращает (код, текст) ошибки или None"""
+    if not item.account_id or item.account_id not in refs["accounts"]:
+        return status.HTTP_404_NOT_FOUND, "Указанной счет не найден"
+    if item.debt_id and item.debt_id not in refs["debts"]:
+        return status.HTTP_404_NOT_FOUND, "Долг не найден"
+    category = refs["categories"].get(item.category_id)
+    if item.category_id and not category:
+        return status.HTTP_404_NOT_FOUND, "Указанная категория не найдена"
+    if category and category.moded != item.moded:
+        return status.HTTP_400_BAD_REQUEST, "Тип транзакции не соответствует типу транзаукции категории"
+    if item.task_id and item.task_id not in refs["tasks"]:
+        return status.HTTP_404_NOT_FOUND, "Задача не найдена"
+    return None
+
+
+async def apply_transactions_batch(db: AsyncSession, user_id: int, items: List[CreateTransaction]) -> list:
+    """
+    Создать пачку транзакций пользователя. Без commit — его делает вызывающий.
+
+    Элементы с ошибками пропускаются и попадают в результат с кодом ошибки.
+    Для остальных изменения балансов суммируются и применяются одним UPDATE
+    на каждый счёт/долг/лимит/цель, строки вставляются одним flush.
+    Снимок balance у транзакций — баланс счёта после неё при проведении
+    пачки по порядку элементов.
+    """
+    refs = await prefetch_batch_refs(db, user_id, items)
+    user_timezone = await db.scalar(select(User.timezone).where(User.id == user_id))
+    results = []
+    accepted = []
+    for index, item in enumerate(items):
+        error = check_batch_item(item, refs)
+        if error:
+            results.append({"index": index, "status_code": error[0], "error": error[1]})
+        else:
+            accepted.append((index, item))
+    if not accepted:
+        return results
+
+    account_deltas = defaultdict(Decimal)
+    debt_payments = defaultdict(Decimal)
+    limit_spent = defaultdict(Decimal)
+    target_additions = defaultdict(Decimal)
+    for _, item in accepted:
+        account_deltas[item.account_id] += balance_delta(item.moded, item.sum)
+        if item.debt_id and item.moded == TransactionsTypeEnum.income:
+            debt_payments[item.debt_id] += item.sum
+        limit = refs["limits"].get(item.category_id)
+        if limit:
+            limit_spent[limit.id] += item.sum
+        if item.target_id in refs["targets"]:
+            target_additions[item.target_id] += item.sum
+
+    # Порядок блокировок как в create_transaction: счета, долги, лимиты, цели — каждые по id
+    running_balance = {}
+    for account_id in sorted(account_deltas):
+        balance = await change_account_balance(db, refs["accounts"][account_id], account_deltas[account_id])
+        # Баланс до пачки — от него считаем снимки по каждой транзакции
+        running_balance[account_id] = balance - account_deltas[account_id]
+    # Сколько погашено по каждому долгу — делим между транзакциями пачки по порядку
+    debt_paid = {}
+    for debt_id in sorted(debt_payments):
+        debt_paid[debt_id] = await pay_debt(db, refs["debts"][debt_id], debt_payments[debt_id])
+    limits_by_id = {limit.id: limit for limit in refs["limits"].values()}
+    for limit_id in sorted(limit_spent):
+        await add_limit_spent(db, limits_by_id[limit_id], limit_spent[limit_id])
+    for target_id in sorted(target_additions):
+        await add_target_balance(db, refs["targets"][target_id], target_additions[target_id])
+
+    created = []
+    for index, item in accepted:
+        account = refs["accounts"][item.account_id]
+        running_balance[item.account_id] += balance_delta(item.moded, item.sum)
+        limit = refs["limits"].get(item.category_id)
+        target = refs["targets"].get(item.target_id)
+        paid = None
+        if item.debt_id and item.moded == TransactionsTypeEnum.income:
+            paid = min(item.sum, debt_paid[item.debt_id])
+            debt_paid[item.debt_id] -= paid
+        values = dict(
+            sum=item.sum,
+            moded=item.moded,
+            repeat_operation=item.repeat_operation,
+            user_id=user_id,
+            category_id=item.category_id or None,
+            account_id=item.account_id,
+            limit_id=limit.id if limit else None,
+            target_id=target.id if target else None,
+            debt_id=item.debt_id or None,
+            debt_paid=paid,
+            currency=account.currency,
+            balance=running_balance[item.account_id],
+            task_id=item.task_id or None,
+        )
+        if item.date_operation:
+            values["created_at"] = as_user_time(item.date_operation, user_timezone)
+        created.append((index, item, Transactions(**values)))
+
+    db.add_all([transaction for _, _, transaction in created])
+    # Один flush — одна многострочная вставка с RETURNING
+    await db.flush()
+    await add_to_rollup(db, [transaction.id for _, _, transaction in created])
+
+    for index, item, transaction in created:
+        # Связи для ответа — из уже загруженных строк, без повторных запросов
+        set_committed_value(transaction, "category", refs["categories"].get(item.category_id))
+        set_committed_value(transaction, "limit", refs["limits"].get(item.category_id))
+        set_committed_value(transaction, "target", refs["targets"].get(item.target_id))
+        set_committed_value(transaction, "debt", refs["debts"].get(item.debt_id))
+        set_committed_value(transaction, "task", refs["tasks"].get(item.task_id))
+        results.append({"index": index, "status_code": status.HTTP_201_CREATED, "transaction": transaction})
+    results.sort(key=lambda result: result["index"])
+    return results
+
+
+@router.post(
+    "/batch",
+    response_model=TransactionBatchResponse,
+    summary="Создать несколько транзакций одним запросом",
+)
+async def create_transactions_batch(
+    items: List[CreateTransaction],
+    current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Принимает массив транзакций в формате POST /transactions/ и проводит их одной транзакцией БД.
+
+    Элементы с ошибками (нет счёта, долга, категории, задачи; тип не совпадает
+    с категорией) не создаются — для них в results возвращается status_code и error,
+    остальные создаются. results идут в порядке входного массива (index).
+    """
+    logger.info(f"Пакетное создание {len(items)} транзакций для user_id: {current_user.user_id}")
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Не больше {BATCH_MAX_ITEMS} транзакций за запрос"
+        )
+    user = await db.get(User, current_user.user_id)
+    if not user:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Указанный пользователь не найден"
+        )
+    try:
+        results = await apply_transactions_batch(db, current_user.user_id, items)
+        await db.commit()
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при создании транзакций: {str(e)}"
+        )
+    created = sum(1 for result in results if result["status_code"] == status.HTTP_201_CREATED)
+    logger.info(f"Создано транзакций: {created}, с ошибками: {len(results) - created}")
+    return {"created": created, "failed": len(results) - created, "results": results}
+
+
+@router.post(
+    "/import",
+    response_model=TransactionImportResponse,
+    summary="Импорт банковской выписки (CSV/OFX)",
+)
+async def import_transactions(
+    account_id: int = Query(..., description="id счета, на который загружается выписка", example=1),
+    file: UploadFile = File(..., description="Выписка в формате CSV или OFX"),
+    file_format: Optional[StatementFormatEnum] = Query(None, description="csv/ofx, по умолчанию — по расширению файла"),
+    encoding: str = Query("utf-8-sig", description="Кодировка файла (например, cp1251 для выгрузок русских банков)"),
+    current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Загружает историю операций из выписки на счёт пользователя.
+
+    - CSV: первая строка — заголовок, обязательны колонки date и amount
+      (также понимаются description, category, type и русские названия).
+      Расход — отрицательная сумма или type=expense. Одинаковые строки одного файла
+      (дата, сумма, описание) — разные операции и загружаются все.
+    - OFX: операции <STMTTRN>, дубли определяются по FITID.
+
+    Файл обрабатывается потоком, строки загружаются в БД через COPY.
+    Уже загруженные ранее строки пропускаются (duplicates). Баланс счёта
+    и суточные агрегаты пересчитываются один раз в конце.
+    """
+    logger.info(f"Импорт выписки {file.filename} на счет {account_id} для user_id: {current_user.user_id}")
+    started = time.perf_counter()
+    if file_format is None:
+        extension = (file.filename or "").rsplit(".", 1)[-1].lower()
+        file_format = StatementFormatEnum.ofx if extension in ("ofx", "qfx") else StatementFormatEnum.csv
+
+    # Счёт блокируем до конца импорта: баланс меняется один раз в конце
+    account = await db.scalar(
+        select(Accounts)
+        .where(Accounts.id == account_id, Accounts.user_id == current_user.user_id)
+        .with_for_update()
+    )
+    if not account:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Указанной счет не найден"
+        )
+    stats = ImportStats()
+    categories = await user_categories_by_name(db, current_user.user_id)
+    records = statement_records(file.file, file_format, encoding, account.id, categories, stats)
+    try:
+        await copy_to_staging(db, records)
+        imported, total_delta = await insert_from_staging(db, current_user.user_id, account)
+        balance = await change_account_balance(db, account, total_delta)
+        await add_selected_to_rollup(db, imported_ids())
+        await db.commit()
+    except ValueError as e:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при импорте выписки: {str(e)}"
+        )
+
+    elapsed = time.perf_counter() - started
+    logger.info(
+        f"Импорт выписки: строк {stats.total_rows}, добавлено {imported}, "
+        f"ошибок {stats.invalid}, {elapsed:.2f} с"
+    )
+    return {
+        "total_rows": stats.total_rows,
+        "imported": imported,
+        "duplicates": stats.total_rows - stats.invalid - imported,
+        "invalid": stats.invalid,
+        "errors": stats.errors,
+        "account_balance": balance,
+        "elapsed_seconds": round(elapsed, 3),
+        "rows_per_second": round(stats.total_rows / elapsed, 1) if elapsed > 0 else 0.0,
+    }
+
+
+def daily_sums_rollup_query(user_id: int, date_from=None, date_to=None, moded=None, account_id=None):
+    """Суммы по дням из transaction_daily_rollup с теми же фильтрами, что и у списка транзакций"""
+    query = select(
+        TransactionDailyRollup.day.label("date"),
+        func.sum(TransactionDailyRollup.total_sum).label("daily_sum"),
+    ).where(TransactionDailyRollup.user_id == user_id)
+    if date_from:
+        query = query.where(TransactionDailyRollup.day >= date_from)
+    if date_to:
+        # Список фильтрует created_at <= date_to, т.е. до полуночи date_to
+        query = query.where(TransactionDailyRollup.day < date_to)
+    if moded:
+        query = query.where(TransactionDailyRollup.moded == moded)
+    if account_id:
+        query = query.where(TransactionDailyRollup.account_id == account_id)
+    return query.group_by(TransactionDailyRollup.day)
+
+
+def apply_transaction_filters(query, date_from=None, date_to=None, moded=None, account_id=None,
+                              limit_id=None, target_id=None, debt_id=None, source=Transactions):
+    """Фильтры списка транзакций — общие для /all и /export (source — см. transactions_source)"""
+    if date_from:
+        query = query.where(source.created_at >= date_from)
+    if date_to:
+        query = query.where(source.created_at <= date_to)
+    if moded:
+        query = query.where(source.moded == moded)
+    if account_id:
+        query = query.where(source.account_id == account_id)
+    if limit_id:
+        query = query.where(source.limit_id == limit_id)
+    if target_id:
+        query = query.where(source.target_id == target_id)
+    if debt_id:
+        query = query.where(source.debt_id == debt_id)
+    return query
+
+
+def running_balance_subquery(user_id: int, account_id=None, date_from=None, source=Transactions):
+    """
+    Баланс счёта после каждой транзакции, считается при чтении:
+    текущий Accounts.balance минус сумма всех более поздних (по created_at, id) операций счёта.
+    Окно идёт от новых операций к старым, поэтому более ранние строки, чем date_from, ему не нужны.
+    Окно считается по всей истории счёта после date_from (индекс
+    ix_transactions_user_id_account_id_created_at_id отдаёт её уже упорядоченной), а не только по странице.
+    """
+    delta = case(
+        (source.moded == TransactionsTypeEnum.income, source.sum),
+        (source.moded == TransactionsTypeEnum.expense, -source.sum),
+        else_=0,
+    )
+    # Сумма изменений от самой новой операции до текущей включительно
+    newer_and_current = func.sum(delta).over(
+        partition_by=source.account_id,
+        order_by=(source.created_at.desc(), source.id.desc()),
+    )
+    query = (
+        select(source.id, (Accounts.balance - newer_and_current + delta).label("running_balance"))
+        .join(Accounts, Accounts.id == source.account_id)
+        .where(source.user_id == user_id)
+    )
+    if account_id:
+        query = query.where(source.account_id == account_id)
+    if date_from:
+        query = query.where(source.created_at >= date_from)
+    return query.subquery("running")
+
+
+def encode_cursor(transaction: Transactions) -> str:
+    """Непрозрачный курсор из (created_at, id) последней записи страницы"""
+    raw = json.dumps({"c": transaction.created_at.isoformat(), "i": transaction.id})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        data = json.loads(raw)
+        return datetime.fromisoformat(data["c"]), int(data["i"])
+    except (ValueError, KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Некорректный cursor")
+
+
 @router.get("/all", 
             response_model=TransactionsWithStatsResponse, 
             summary="Получить транзакции с пагинацией")
 async def get_all_transactions(
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     limit: int = Query(100, gt=0, le=1000, description="Лимит количества записей (1-1000)"),
     date_from: Optional[date] = Query(None, description="Начальная дата фильтрации (в формате YYYY-MM-DD)", example="2025-05-01"),
     date_to: Optional[date] = Query(None, description="Конечная дата фильтрации (в формате YYYY-MM-DD)", example="2025-05-30"),
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    offset: int = Query(0, ge=0, description="Смещение (количество записей для пропуска)"),
+    offset: int = Query(0, ge=0, description="Смещение (количество записей для пропуска), игнорируется при cursor"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы (next_cursor из прошлого ответа)"),
+    include_total: bool = Query(True, description="Считать ли точное количество записей (total)"),
+    running_balance: bool = Query(False, description="Добавить running_balance — баланс счета после каждой операции"),
     order_by: str = Query("desc", description="Порядок сортировки по дате (asc/desc)"),
     moded: TransactionsTypeEnum = Query(None, description="Тип операции income/expense", example="income"),
     account_id: int = Query(None, description="id счета", example=1),
@@ -216,6 +786,10 @@ async def get_all_transactions(
     Параметры:
     - limit: количество возвращаемых записей (по умолчанию 100)
     - offset: смещение (по умолчанию 0)
+    - cursor: курсор следующей страницы; на глубоких страницах вместо offset
+    - include_total: считать ли total (false — для бесконечной ленты)
+    - running_balance: посчитать баланс счета после каждой операции по текущему балансу счета
+      (в отличие от сохранённого balance, верен и после удаления/добавления операций задним числом)
     - order_by: порядок сортировки ('asc' или 'desc')
     - date_from: фильтрация по дате (начало периода)
     - date_to: фильтрация по дате (конец периода)
@@ -226,64 +800,88 @@ async def get_all_transactions(
     - debt_id: id долга
     
     Возвращает:
-    - total: общее количество записей
-    - daily_sums: суммы по дням за весь период
+    - total: общее количество записей (None при include_total=false)
+    - daily_sums: суммы по дням за весь период (только на первой странице, без cursor)
     - transactions: сами записи (с пагинацией)
+    - has_more / next_cursor: есть ли следующая страница и курсор для неё
     """
     logger.info(f"Получает список транзакций user_id: {current_user.user_id}")
     # Проверка пользователя
-    user = db.query(User).filter(User.id == current_user.user_id).first()
+    user = await db.get(User, current_user.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
 
-    # Базовый запрос
-    query = db.query(Transactions).filter(Transactions.user_id == user.id)
-
-    # Применяем фильтры
-    if date_from:
-        query = query.filter(Transactions.created_at >= date_from)
-    if date_to:
-        query = query.filter(Transactions.created_at <= date_to)
-    if moded:
-        query = query.filter(Transactions.moded == moded)
-    if account_id:
-        query = query.filter(Transactions.account_id == account_id)
-    if limit_id:
-        query = query.filter(Transactions.limit_id == limit_id)
-    if target_id:
-        query = query.filter(Transactions.target_id == target_id)
-    if debt_id:
-        query = query.filter(Transactions.debt_id == debt_id)
+    # Даты периода — полночи в часовом поясе пользователя
+    created_from, created_to = period_bounds(date_from, date_to, user.timezone)
+    # Архив подключаем, только если период задевает архивные транзакции пользователя
+    source = await transactions_source(db, user.id, created_from, created_to)
+    # Базовый запрос с фильтрами
+    query = apply_transaction_filters(
+        select(source).where(source.user_id == user.id),
+        created_from, created_to, moded, account_id, limit_id, target_id, debt_id, source,
+    )
     # Получаем общее количество записей (без пагинации)
-    total = query.count()
+    total = None
+    if include_total:
+        total = await db.scalar(select(func.count()).select_from(query.subquery()))
 
-    # # Получаем суммы по дням (все записи)
-    daily_sums_query = query.with_entities(
-        func.date(Transactions.created_at).label("date"),
-        func.sum(Transactions.sum).label("daily_sum")
-    ).group_by("date")
-   
+    # # Получаем суммы по дням (все записи) — они одинаковы для всех страниц,
+    # поэтому при листании курсором не пересчитываем
+    daily_sums_list = []
+    if cursor is None:
+        if limit_id or target_id or debt_id:
+            # Этих измерений в агрегате нет — считаем по самим транзакциям
+            daily_sums_query = query.with_only_columns(
+                local_date_sql(source.created_at, user_zone(user.timezone).key).label("date"),
+                func.sum(source.sum).label("daily_sum")
+            ).group_by("date")
+        else:
+            daily_sums_query = daily_sums_rollup_query(user.id, date_from, date_to, moded, account_id)
+       
+        if order_by == "asc":
+            daily_sums_query = daily_sums_query.order_by("date")
+        else:
+            daily_sums_query = daily_sums_query.order_by(desc("date"))
+
+        daily_sums = {
+            str(row.date): float(row.daily_sum) 
+            for row in (await db.execute(daily_sums_query)).all()
+        }
+        sorted_dates = sorted(daily_sums.items(), reverse=(order_by == "desc"))
+        daily_sums_list = [
+            {"date": date.fromisoformat(date_str), "sum": sum_amount}
+            for date_str, sum_amount in sorted_dates
+        ]
+    if running_balance:
+        running = running_balance_subquery(user.id, account_id, created_from, source)
+        query = query.join(running, running.c.id == source.id).options(
+            with_expression(source.running_balance, running.c.running_balance)
+        )
+
+    # Получаем сами транзакции (с пагинацией).
+    # id добавлен в сортировку, чтобы порядок был однозначным и курсор не терял записи
     if order_by == "asc":
-        daily_sums_query = daily_sums_query.order_by("date")
+        query = query.order_by(source.created_at.asc(), source.id.asc())
     else:
-        daily_sums_query = daily_sums_query.order_by(desc("date"))
+        query = query.order_by(source.created_at.desc(), source.id.desc())
 
-    daily_sums = {
-        str(row.date): float(row.daily_sum) 
-        for row in daily_sums_query.all()
-    }
-    sorted_dates = sorted(daily_sums.items(), reverse=(order_by == "desc"))
-    daily_sums_list = [
-        {"date": date.fromisoformat(date_str), "sum": sum_amount}
-        for date_str, sum_amount in sorted_dates
-    ]
-    # Получаем сами транзакции (с пагинацией)
-    if order_by == "asc":
-        query = query.order_by(Transactions.created_at.asc())
+    if cursor is not None:
+        # Keyset: продолжаем строго после последней записи прошлой страницы
+        cursor_created_at, cursor_id = decode_cursor(cursor)
+        position = tuple_(source.created_at, source.id)
+        if order_by == "asc":
+            query = query.where(position > (cursor_created_at, cursor_id))
+        else:
+            query = query.where(position < (cursor_created_at, cursor_id))
     else:
-        query = query.order_by(Transactions.created_at.desc())
+        query = query.offset(offset)
 
-    transactions = query.offset(offset).limit(limit).all()
+    query = query.options(*transaction_load_options(source))
+    # Берём на одну запись больше, чтобы узнать, есть ли следующая страница
+    transactions = (await db.execute(query.limit(limit + 1))).scalars().all()
+    has_more = len(transactions) > limit
+    transactions = transactions[:limit]
+    next_cursor = encode_cursor(transactions[-1]) if has_more else None
     # graph_data = [
     #     {"date": "16 Apr 2022", "value": 200},
     #     {"date": "16 Apr 2022", "value": 1500},
@@ -295,7 +893,7 @@ async def get_all_transactions(
     graph_data_dict = defaultdict(float)
 
     for item in transactions:
-        date_obj = item.created_at.date()  # только дата без времени
+        date_obj = local_date(item.created_at, user.timezone)  # только дата без времени, по поясу пользователя
         graph_data_dict[date_obj] += float(item.sum)
 
     # Сортируем по дате (datetime.date), потом форматируем в строку
@@ -308,7 +906,9 @@ async def get_all_transactions(
         "total": total,
         "daily_sums": daily_sums_list,
         "transactions": transactions,
-        "graph_data":graph_data
+        "graph_data":graph_data,
+        "has_more": has_more,
+        "next_cursor": next_cursor,
     }
 
 
@@ -316,21 +916,269 @@ async def get_all_transactions(
 
 
 
+# Строк на одну выборку из серверного курсора (и на один кусок ответа)
+EXPORT_BATCH_SIZE = 1000
+
+def export_query(user_id: int, order_by: str, running_balance: bool = False, source=Transactions, **filters):
+    """Плоские колонки для выгрузки: без ORM-объектов, счёт и категория — по имени"""
+    query = apply_transaction_filters(
+        select(
+            source.id,
+            source.created_at,
+            source.moded,
+            source.sum,
+            source.currency,
+            source.balance,
+            Accounts.name.label("account"),
+            Categories.name.label("category"),
+            source.limit_id,
+            source.target_id,
+            source.debt_id,
+            source.task_id,
+        )
+        .join(Accounts, Accounts.id == source.account_id)
+        .outerjoin(Categories, Categories.id == source.category_id)
+        .where(source.user_id == user_id),
+        source=source,
+        **filters,
+    )
+    if running_balance:
+        running = running_balance_subquery(user_id, filters.get("account_id"), filters.get("date_from"), source)
+        query = query.join(running, running.c.id == source.id).add_columns(running.c.running_balance)
+    if order_by == "desc":
+        return query.order_by(source.created_at.desc(), source.id.desc())
+    return query.order_by(source.created_at.asc(), source.id.asc())
+
+
+def export_values(row) -> list:
+    values = list(row)
+    values[1] = row.created_at.isoformat() if row.created_at else None
+    values[4] = row.currency.value if row.currency else None
+    return values
+
+
+async def stream_export(query, file_format: ExportFormatEnum):
+    """
+    Отдаёт выгрузку кусками по EXPORT_BATCH_SIZE строк из серверного курсора,
+    весь результат в памяти не держится.
+    """
+    # Сессия из get_db закрывается до того, как начнётся отдача тела ответа,
+    # поэтому для курсора открываем свою
+    async with AsyncSessionLocal() as db:
+        result = await db.stream(query.execution_options(yield_per=EXPORT_BATCH_SIZE))
+        columns = list(result.keys())
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        if file_format == ExportFormatEnum.csv:
+            writer.writerow(columns)
+        exported = 0
+        async for rows in result.partitions():
+            if file_format == ExportFormatEnum.csv:
+                writer.writerows(export_values(row) for row in rows)
+            else:
+                for row in rows:
+                    buffer.write(json.dumps(dict(zip(columns, export_values(row))), ensure_ascii=False, default=str))
+                    buffer.write("\n")
+            exported += len(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        if buffer.tell():
+            yield buffer.getvalue()
+        logger.info(f"Выгрузка транзакций завершена: {exported} строк")
+
+
+@router.get("/export", summary="Выгрузка транзакций (CSV/NDJSON)")
+async def export_transactions(
+    db: AsyncSession = Depends(get_db),
+    file_format: ExportFormatEnum = Query(ExportFormatEnum.csv, description="Формат выгрузки csv/ndjson"),
+    date_from: Optional[date] = Query(None, description="Начальная дата фильтрации (в формате YYYY-MM-DD)", example="2025-05-01"),
+    date_to: Optional[date] = Query(None, description="Конечная дата фильтрации (в формате YYYY-MM-DD)", example="2025-05-30"),
+    current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
+    order_by: str = Query("asc", description="Порядок сортировки по дате (asc/desc)"),
+    running_balance: bool = Query(False, description="Добавить колонку running_balance — баланс счета после операции"),
+    moded: TransactionsTypeEnum = Query(None, description="Тип операции income/expense", example="income"),
+    account_id: int = Query(None, description="id счета", example=1),
+    limit_id: int = Query(None, description="id лимита", example=0),
+    target_id: int = Query(None, description="id цели", example=0),
+    debt_id: int = Query(None, description="id долга", example=1)
+):
+    """
+    Выгружает транзакции пользователя файлом с теми же фильтрами, что и /transactions/all,
+    но без пагинации: строки отдаются потоком по мере чтения из БД.
+
+    Колонки: id, created_at, moded, sum, currency, balance, account (имя счета),
+    category (имя категории), limit_id, target_id, debt_id, task_id
+    и при running_balance=true — running_balance.
+    """
+    logger.info(f"Выгрузка транзакций ({file_format.value}) для user_id: {current_user.user_id}")
+    user = await db.get(User, current_user.user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+
+    created_from, created_to = period_bounds(date_from, date_to, user.timezone)
+    source = await transactions_source(db, user.id, created_from, created_to)
+    query = export_query(
+        user.id, order_by, running_balance, source,
+        date_from=created_from, date_to=created_to, moded=moded, account_id=account_id,
+        limit_id=limit_id, target_id=target_id, debt_id=debt_id,
+    )
+    media_type = "text/csv" if file_format == ExportFormatEnum.csv else "application/x-ndjson"
+    return StreamingResponse(
+        stream_export(query, file_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="transactions.{file_format.value}"'},
+    )
+
+
+async def apply_transaction_update(db: AsyncSession, transaction: Transactions, changes: dict) -> Transactions:
+    """
+    Изменить транзакцию. Балансы счетов, долга, лимита и цели меняются
+    только на разницу между прежним и новым состоянием транзакции.
+    changes — поля UpdateTransaction (только переданные). Без commit.
+    """
+    user_id = transaction.user_id
+    moded = changes.get("moded", transaction.moded)
+    amount = changes.get("sum", transaction.sum)
+    account_id = changes.get("account_id", transaction.account_id)
+    category_id = changes.get("category_id", transaction.category_id)
+    target_id = changes.get("target_id", transaction.target_id)
+    limit_id = transaction.limit_id
+
+    account = await db.scalar(
+        select(Accounts).where(Accounts.id == account_id, Accounts.user_id == user_id)
+    )
+    if not account:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Указанной счет не найден"
+        )
+    if category_id:
+        category = await db.get(Categories, category_id)
+        if not category:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Указанная категория не найдена")
+        if category.moded != moded:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Тип транзакции не соответствует типу транзаукции категории"
+            )
+    if category_id != transaction.category_id:
+        # Лимит привязан к категории: при её смене сумма переходит в лимит новой категории
+        limit_id = None
+        if category_id:
+            limit_id = await db.scalar(
+                select(Limits.id)
+                .where(Limits.category_id == category_id, Limits.user_id == user_id)
+                .order_by(Limits.id)
+                .limit(1)
+            )
+    if target_id and target_id != transaction.target_id:
+        target = await db.scalar(select(Targets).where(Targets.id == target_id, Targets.user_id == user_id))
+        if not target:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Цель не найдена")
+
+    old_effects = stored_transaction_effects(transaction)
+    new_effects = transaction_effects(moded, amount, account_id, limit_id, target_id, transaction.debt_id)
+    debt_changed = moded != transaction.moded or amount != transaction.sum
+    if not debt_changed:
+        # Погашение долга не меняется — не пересчитываем его заново
+        old_effects["debts"] = new_effects["debts"] = {}
+    # Старое состояние вычитаем из агрегата до изменения строки, новое прибавляем после
+    await remove_from_rollup(db, [transaction.id])
+    balances, debt_paid = await apply_balance_effects(db, effects_difference(old_effects, new_effects))
+    if debt_changed and transaction.debt_id:
+        transaction.debt_paid = debt_paid.get(transaction.debt_id)
+
+    if account_id == transaction.account_id:
+        # Снимок баланса сдвигается на ту же разницу, что и баланс счёта
+        transaction.balance += balance_delta(moded, amount) - balance_delta(transaction.moded, transaction.sum)
+    else:
+        transaction.balance = balances.get(account_id, account.balance)
+        transaction.currency = account.currency
+    transaction.moded = moded
+    transaction.sum = amount
+    transaction.account_id = account_id
+    transaction.category_id = category_id
+    transaction.limit_id = limit_id
+    transaction.target_id = target_id
+    if changes.get("date_operation"):
+        user_timezone = await db.scalar(select(User.timezone).where(User.id == user_id))
+        transaction.created_at = as_user_time(changes["date_operation"], user_timezone)
+    await db.flush()
+    await add_to_rollup(db, [transaction.id])
+    return transaction
+
+
+@router.patch(
+    "/{transaction_id}",
+    response_model=TransactionResponse,
+    summary="Изменить транзакцию",
+)
+async def update_transaction(
+    transaction_id: int,
+    update_data: UpdateTransaction,
+    current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
+    db: AsyncSession = Depends(get_db)
+):
+    """
+    Меняет сумму, тип, счёт, категорию, цель или дату транзакции.
+    Передаются только изменяемые поля. Балансы корректируются на разницу
+    со старыми значениями одной транзакцией БД — без удаления и повторного создания.
+    """
+    logger.info(f"Изменение транзакции {transaction_id} для user_id: {current_user.user_id}")
+    transaction = await db.get(Transactions, transaction_id)
+    if not transaction:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Транзакция не найдена"
+        )
+    if transaction.user_id != current_user.user_id:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="У вас нет прав на изменение этой транзакции"
+        )
+    changes = update_data.dict(exclude_unset=True)
+    for field in ("sum", "moded", "account_id"):
+        if field in changes and changes[field] is None:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Поле {field} не может быть пустым")
+
+    try:
+        await apply_transaction_update(db, transaction, changes)
+        await db.commit()
+    except HTTPException:
+        await db.rollback()
+        raise
+    except Exception as e:
+        await db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Ошибка при изменении транзакции: {str(e)}"
+        )
+    logger.info(f"Транзакция {transaction_id} изменена")
+    # Связи могли смениться — перечитываем их для ответа
+    db.expire(transaction)
+    return await db.scalar(
+        select(Transactions)
+        .where(Transactions.id == transaction_id)
+        .options(*transaction_response_options)
+    )
+
+
 @router.delete(
     "/{transaction_id}",
     status_code=status.HTTP_204_NO_CONTENT,
     summary="Удалить транзакцию и откорректировать баланс",
-    description="Удаляет транзакцию и восстанавливает баланс счета, на котором была проведена операция."
+    description="Удаляет транзакцию и откатывает её влияние на баланс счета, долга, лимита и цели."
 )
 async def delete_transaction(
     transaction_id: int,
     current_user: TokenPayload = Depends(guard_role(["admin", "user"])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     logger.info(f"Удаление транзакции с ID: {transaction_id} для user_id: {current_user.user_id}")
     
     # Получаем транзакцию из базы
-    transaction: Transactions = db.query(Transactions).filter(Transactions.id == transaction_id).first()
+    transaction: Transactions = await db.get(Transactions, transaction_id)
     if not transaction:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
@@ -344,27 +1192,20 @@ async def delete_transaction(
             detail="У вас нет прав на удаление этой транзакции"
         )
     
-    # Получаем счет, на котором была проведена операция
-    account: Accounts = db.query(Accounts).filter(Accounts.id == transaction.account_id).first()
-    if not account:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Счет не найден"
-        )
-    
-    # Корректируем баланс счета в зависимости от типа транзакции
-    if transaction.moded == TransactionsTypeEnum.expense:
-        account.balance += transaction.sum  # Если расход, добавляем сумму обратно
-    elif transaction.moded == TransactionsTypeEnum.income:
-        account.balance -= transaction.sum  # Если доход, вычитаем сумму обратно
-    
     # Удаляем транзакцию из базы
     try:
-        db.delete(transaction)
-        db.commit()
+        await remove_from_rollup(db, [transaction.id])
+        # Откатываем всё, что транзакция изменила при создании: счёт, долг, лимит, цель
+        await apply_balance_effects(
+            db, effects_difference(stored_transaction_effects(transaction), transaction_effects())
+        )
+        # Внешнего ключа с ON DELETE CASCADE у operations_repeat больше нет (transactions секционирована)
+        await db.execute(delete(OperationsRepeat).where(OperationsRepeat.transaction_id == transaction.id))
+        await db.delete(transaction)
+        await db.commit()
         logger.info(f"Транзакция {transaction_id} удалена и баланс счета откорректирован.")
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Ошибка при удалении транзакции: {str(e)}"
@@ -6,19 +6,22 @@ from fastapi.encoders import jsonable_encoder
 from jose import JWTError
 from enums import CategoriTypeEnum, LanguageTypeEnum
 from models import Transactions, User, Accounts
-from db import SessionLocal
+from db import get_db
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from datetime import date, datetime, timedelta
 from typing import Optional
 from routers.limite_pyment import create_limits, delete_limit, update_limits
+from routers.rollup import rebuild_user_rollup
+from routers.timezones import day_start, is_valid_timezone, user_today
 from schemas import RefreshTokenRequest, TransactionResponse, CategoriesResponse, UserFinance, UserResponse, UserCreate  # В зависимости от структуры проекта
-from auth.auth import ALGORITHM, REFRESH_SECRET_KEY, TokenPair, login, guard_role, TokenPayload, refresh_token
+from auth.auth import ALGORITHM, REFRESH_SECRET_KEY, TokenPair, login, guard_role, TokenPayload, refresh_token, invalidate_user_auth
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import contains_eager, joinedload
 from sqlalchemy import and_
 from passlib.hash import pbkdf2_sha256
-from sqlalchemy import and_, cast, Date
+from sqlalchemy import and_, case, cast, Date, func, select
 # from guard.guard import get_current_user, TokenPayload
 import logging
 # Настройка логгирования
@@ -46,16 +49,9 @@ class UserOut(BaseModel):
     premium_type: Optional[str] = None
     email: Optional[str] = None
     tg_name: Optional[str] = None
+    timezone: Optional[str] = None
     class Config:
         from_attributes = True  # Важно для поддержки SQLAlchemy моделей
-# Зависимость для получения сессии базы данных
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
-
 def loggger_json(data):
     """
     Функция для логирования данных в формате JSON.
@@ -83,7 +79,7 @@ def loggger_json(data):
 
 async def get_all_users(
     password: str = Query('AswGHT123', description="Пароль администратора", example="AswGHT123"),
-    db: Session = Depends(get_db)):
+    db: AsyncSession = Depends(get_db)):
     """
     Доступен только для администратора.
     Получить список всех пользователей из базы данных.
@@ -97,10 +93,10 @@ async def get_all_users(
                 status_code=status.HTTP_403_FORBIDDEN,
                 detail="Неверный пароль администратора"
             )
-        users = db.query(User).all()
+        users = (await db.execute(select(User))).scalars().all()
         # Для каждого пользователя загружаем транзакции
         for user in users:
-            db.refresh(user)  # Обновляем объект
+            await db.refresh(user)  # Обновляем объект
             # user.user_categories  # Загружаем транзакции (если используется lazy loading)
             # user.transactions  # Загружаем транзакции (если используется lazy loading)
         return users
@@ -117,42 +113,45 @@ async def get_all_users(
     status_code=status.HTTP_200_OK,
     summary="Получаем финансы пользователя",
 ) 
-def get_finance(
+async def get_finance(
     account_id: int = Query(None, description="ID счета", example=1),
     current_user: TokenPayload = Depends(guard_role(["user", "admin"])),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     if not account_id:
         raise HTTPException(status_code=400, detail="account_id не указан")
 
-    today = date.today()
+    user = await db.get(User, current_user.user_id)
+
+    if not user:
+        raise HTTPException(status_code=404, detail="Пользователь не найден")
+
+    # Текущий месяц — по часовому поясу пользователя
+    today = user_today(user.timezone)
     start_of_month = date(today.year, today.month, 1)
     if today.month == 12:
         next_month_start = date(today.year + 1, 1, 1)
     else:
         next_month_start = date(today.year, today.month + 1, 1)
 
-    user = (
-        db.query(User)
-        .options(joinedload(User.transactions))
-        .filter(User.id == current_user.user_id)
-        .first()
-    )
-
-    if not user:
-        raise HTTPException(status_code=404, detail="Пользователь не найден")
-
-    account = db.query(Accounts).filter(Accounts.id == account_id).first()
+    account = await db.get(Accounts, account_id)
     if not account:
         raise HTTPException(status_code=404, detail="Счёт не найден")
 
-    filtered_by_account = [
-        t for t in user.transactions
-        if t.account_id == account_id and start_of_month <= t.created_at.date() < next_month_start
-    ]
-
-    income_sum = sum(t.sum for t in filtered_by_account if t.moded == 'income')
-    expense_sum = sum(t.sum for t in filtered_by_account if t.moded == 'expense')
+    # Доходы и расходы по счёту за месяц одним запросом (индекс user_id + account_id + created_at)
+    totals = (await db.execute(
+        select(
+            func.coalesce(func.sum(case((Transactions.moded == 'income', Transactions.sum), else_=0)), 0).label("income"),
+            func.coalesce(func.sum(case((Transactions.moded == 'expense', Transactions.sum), else_=0)), 0).label("expense"),
+        ).where(
+            Transactions.user_id == user.id,
+            Transactions.account_id == account_id,
+            Transactions.created_at >= day_start(start_of_month, user.timezone),
+            Transactions.created_at < day_start(next_month_start, user.timezone),
+        )
+    )).one()
+    income_sum = totals.income
+    expense_sum = totals.expense
 
     return {
         "balance": account.balance,
@@ -165,33 +164,42 @@ def get_finance(
 @router.put("/update",
             response_model=UserOut,
             summary="Обновить данные пользователя (user, admin)",
-            description="Обновляет данные пользователя, такие как email, язык и имя в Telegram. Доступно для ролей 'user' и 'admin'."
+            description="Обновляет данные пользователя, такие как email, язык, имя в Telegram и часовой пояс. Доступно для ролей 'user' и 'admin'."
             )
-def update_user(
+async def update_user(
     current_user: TokenPayload = Depends(guard_role(["user", "admin"])),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
     email: Optional[str] = Query(None, description="Email пользователя", example="pol.vory@yndex.ru"),
     language: Optional[LanguageTypeEnum] = Query(None, description="Язык пользователя", example=LanguageTypeEnum.ru),
     tg_name: Optional[str] = Query(None, description="Имя пользователя в Telegram", example="@pol_vory"),
+    timezone: Optional[str] = Query(None, description="Часовой пояс пользователя (IANA)", example="Europe/Moscow"),
 ):
+    if timezone and not is_valid_timezone(timezone):
+        raise HTTPException(status_code=400, detail=f"Неизвестный часовой пояс «{timezone}»")
     try:
         user_id = current_user.user_id
         if not user_id:
             raise HTTPException(status_code=400, detail="Пользователь не найден")
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.get(User, user_id)
         if email:
             user.email = email
         if language:    
             user.language = language
         if tg_name:
             user.tg_name = tg_name
+        if timezone and timezone != user.timezone:
+            user.timezone = timezone
+            await db.flush()
+            # Сутки операций теперь режутся по новому поясу
+            await rebuild_user_rollup(db, user_id)
         user.updated_at = datetime.utcnow()  # Обновляем время изменения
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        invalidate_user_auth(user_id)  # язык закэширован в guard_role
+        await db.refresh(user)
         return user
 
     except Exception as e:
-        db.rollback() 
+        await db.rollback() 
         logger.error(f"Ошибка при обновлении пользователя: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -199,7 +207,7 @@ def update_user(
         )                  
 
 @router.post("/add/paymentById", summary="Ручка добавления оплаты подписки по ID")
-def add_payment_by_id(
+async def add_payment_by_id(
     user_id: int = Query(..., description="ID пользователя", example=1),
     payment_profile_id: str = Query(None, description="ID в payment", example=1),
     payment_customer_user_id: str = Query(None, description="ID в payment (Незнаю зачем возможно стоит убрать)", example=1),
@@ -208,7 +216,7 @@ def add_payment_by_id(
     payment_expires_at: datetime = Query(None, description="Дата конца подписки", example='2025-07-19T10:00:00Z'),
     premium_type:str = Query(None, description="Тип подписки", example='Pro'),
     password: str = Query('AswGHT123', description="Пароль администратора", example="AswGHT123"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     
 
@@ -220,7 +228,7 @@ def add_payment_by_id(
             detail="Неверный пароль администратора"
         )
     # Находим юзера
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     user.payment_customer_user_id = payment_customer_user_id
@@ -231,18 +239,19 @@ def add_payment_by_id(
     user.premium_type = premium_type
     user.premium = True if payment_is_active else False
     
-    update_limits(db, user_id, premium_type="Pro")  # Создаем лимиты для нового пользователя
+    await db.run_sync(update_limits, user_id, premium_type="Pro")  # Создаем лимиты для нового пользователя
     
     # Обновляем пользователя в базе данных
     try:
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        invalidate_user_auth(user.id)
+        await db.refresh(user)
         return {
             "message": "Подписка пользователя успешно обновлена",
             "user": UserOut.model_validate(user)
         }
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Ошибка при обновлении пользователя: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -251,10 +260,10 @@ def add_payment_by_id(
     
 
 @router.delete("/delete/paymentById", summary="Удалить подписку пользователя по ID")
-def delete_payment_by_id(
+async def delete_payment_by_id(
     user_id: int = Query(..., description="ID пользователя", example=1),
     password: str = Query('AswGHT123', description="Пароль администратора", example="AswGHT123"),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     is_valid = pbkdf2_sha256.verify(password, HASH_PASWORD) 
     if not is_valid:
@@ -264,7 +273,7 @@ def delete_payment_by_id(
         )
         
     # Находим юзера
-    user = db.query(User).options(joinedload(User.feature_limits)).filter(User.id == user_id).first()
+    user = await db.scalar(select(User).options(joinedload(User.feature_limits)).where(User.id == user_id))
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
@@ -280,11 +289,12 @@ def delete_payment_by_id(
     # Сбрасываем лимиты (если они существуют)
     limits_deleted = False
     if user.feature_limits:
-        limits_deleted = delete_limit(db, user.feature_limits.id)
+        limits_deleted = await db.run_sync(delete_limit, user.feature_limits.id)
     
     try:
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        invalidate_user_auth(user.id)
+        await db.refresh(user)
         return {
             "success": True,
             "message": "Подписка пользователя успешно удалена. Все платежные данные сброшены.",
@@ -296,7 +306,7 @@ def delete_payment_by_id(
             "user": UserOut.model_validate(user)
         }
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Ошибка при обновлении пользователя: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -314,7 +324,7 @@ def delete_payment_by_id(
 @router.post('/add/payment',
              summary="Ручка добавления оплаты подписки"
 )
-def add_payment(
+async def add_payment(
     payment_profile_id: str = Query(None, description="ID в payment", example=1),
     payment_customer_user_id: str = Query(None, description="ID в payment (Незнаю зачем возможно стоит убрать)", example=1),
     payment_is_active: bool = Query(None, description="Активна ли в payment", example=True),
@@ -322,12 +332,12 @@ def add_payment(
     payment_expires_at: datetime = Query(None, description="Дата конца подписки", example='2025-07-19T10:00:00Z'),
     premium_type:str = Query(None, description="Тип подписки", example='Pro'),
     current_user: TokenPayload = Depends(guard_role(["user", "admin"])),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     
     user_id = current_user.user_id
     # Находим юзера
-    user = db.query(User).filter(User.id == user_id).first()
+    user = await db.get(User, user_id)
     if not user:
         raise HTTPException(status_code=404, detail="Пользователь не найден")
     
@@ -339,18 +349,19 @@ def add_payment(
     user.premium_type = premium_type
     user.premium = True if payment_is_active else False
     
-    update_limits(db, user_id, premium_type="Pro")  # Создаем лимиты для нового пользователя
+    await db.run_sync(update_limits, user_id, premium_type="Pro")  # Создаем лимиты для нового пользователя
     
     # Обновляем пользователя в базе данных
     try:
-        db.commit()
-        db.refresh(user)
+        await db.commit()
+        invalidate_user_auth(user.id)
+        await db.refresh(user)
         return {
             "message": "Подписка пользователя успешно обновлена",
             "user": UserOut.model_validate(user)
         }
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Ошибка при обновлении пользователя: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -362,9 +373,9 @@ def add_payment(
     "/init/apple/{apple_id}",
     summary="Создать нового пользователя если его нет и возвратить пользователя если он есть",
 )
-def init_user(apple_id: str, db: Session = Depends(get_db)) -> Dict:
+async def init_user(apple_id: str, db: AsyncSession = Depends(get_db)) -> Dict:
     # Проверка на существующего пользователя
-    existing_user = db.query(User).filter(User.apple_id == apple_id).first()
+    existing_user = await db.scalar(select(User).where(User.apple_id == apple_id))
     if existing_user:
         logger.info("Возвращаем пользователя")
         payload = TokenPayload(
@@ -388,10 +399,10 @@ def init_user(apple_id: str, db: Session = Depends(get_db)) -> Dict:
     )
     try:
         db.add(new_user)
-        db.commit()
-        db.refresh(new_user)
+        await db.commit()
+        await db.refresh(new_user)
         # db.flush()  # чтобы получить new_user.id
-        create_limits(db, new_user.id, premium_type="basic")  # Создаем лимиты для нового пользователя
+        await db.run_sync(create_limits, new_user.id, premium_type="basic")  # Создаем лимиты для нового пользователя
         
         payload = TokenPayload(
             user_id=new_user.id,
@@ -407,7 +418,7 @@ def init_user(apple_id: str, db: Session = Depends(get_db)) -> Dict:
         }
 
     except Exception as e:
-        db.rollback()
+        await db.rollback()
         logger.error(f"Ошибка при создании пользователя: {e}")
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -416,8 +427,7 @@ def init_user(apple_id: str, db: Session = Depends(get_db)) -> Dict:
                 
                 
 
-@router.put("/remove_payment", summary="Сбросить подписку у пользователей с истёкшей датой")
-def remove_payment(db: Session = Depends(get_db)):
+def remove_payment_logic(db: Session):
     today = date.today()  # Сегодняшняя дата (без времени)
     print("Запушен сброс продписки")
     # Находим пользователей, у которых:
@@ -440,6 +450,7 @@ def remove_payment(db: Session = Depends(get_db)):
             if user.feature_limits:
                 limits_deleted = delete_limit(db, user.feature_limits.id)
             db.commit()
+            invalidate_user_auth(user.id)
             db.refresh(user)
             print({
                 "success": True,
@@ -454,12 +465,18 @@ def remove_payment(db: Session = Depends(get_db)):
     else:
         print("Пользователи не найдены")
     return expired_subscriptions
+
+
+@router.put("/remove_payment", summary="Сбросить подписку у пользователей с истёкшей датой")
+async def remove_payment(db: AsyncSession = Depends(get_db)):
+    # Логика общая с планировщиком, поэтому выполняем её в синхронной обёртке сессии
+    return await db.run_sync(remove_payment_logic)
     
     
 
     
 @router.post("/refresh", response_model=TokenPair, summary="Обновить токены пользователя")
-def user_refresh_token(request: RefreshTokenRequest, db: Session = Depends(get_db)):
+async def user_refresh_token(request: RefreshTokenRequest, db: AsyncSession = Depends(get_db)):
     return refresh_token(request, db)
 
 
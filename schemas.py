@@ -177,6 +177,15 @@ class CreateTransaction(BaseModel):
     class Config:
         orm_mode = True
     
+class UpdateTransaction(BaseModel):
+    # Передаются только изменяемые поля; category_id/target_id = null — отвязать
+    sum: Optional[Decimal] = Field(None, example=1000)
+    moded: Optional[TransactionsTypeEnum] = Field(None, example="expense")
+    account_id: Optional[int] = Field(None, example=1)
+    category_id: Optional[int] = Field(None, example=1)
+    target_id: Optional[int] = Field(None, example=None)
+    date_operation: Optional[datetime] = Field(None, example="2023-12-31T23:59:59")
+
 class TransactionResponse(BaseModel):
     id: int
     sum: Decimal  
@@ -188,6 +197,7 @@ class TransactionResponse(BaseModel):
     target: Optional[TargetsOut]
     debt: Optional[DebtsTransactionOut]
     task: Optional[TaskTransactioOut]
+    running_balance: Optional[Decimal] = None  # баланс счёта после операции (при running_balance=true)
     
     created_at: datetime
     updated_at: datetime
@@ -205,10 +215,52 @@ class DailySumsResponse(BaseModel):
 
 # Класс для общего ответа
 class TransactionsWithStatsResponse(BaseModel):
-    total: Decimal  
+    total: Optional[Decimal] = None  # None, если точный подсчёт не запрошен (include_total=false)
     daily_sums: List[DailySumResponse]  # Теперь массив вместо объекта
     transactions: List[TransactionResponse]
     graph_data:List[DailySumsResponse]
+    has_more: bool = False  # есть ли следующая страница
+    next_cursor: Optional[str] = None  # курсор для следующей страницы
+
+# Результат одного элемента пакетного создания транзакций
+class TransactionBatchItemResult(BaseModel):
+    index: int  # позиция элемента во входном массиве
+    status_code: int  # 201 — создана, иначе код ошибки, как у одиночного создания
+    transaction: Optional[TransactionResponse] = None
+    error: Optional[str] = None
+
+class TransactionBatchResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[TransactionBatchItemResult]
+
+# Итог импорта выписки
+class TransactionImportResponse(BaseModel):
+    total_rows: int  # операций в файле
+    imported: int  # добавлено новых транзакций
+    duplicates: int  # уже были загружены раньше или повторяются в файле
+    invalid: int  # не удалось разобрать
+    errors: List[str]  # первые ошибки разбора с номерами строк
+    account_balance: Decimal  # баланс счёта после импорта
+    elapsed_seconds: float
+    rows_per_second: float
+
+
+# Ряд аналитики: значения по корзинам в том же порядке, что и buckets
+class AnalyticsSeries(BaseModel):
+    key: Optional[str] = None  # id категории/счёта или тип операции; None — без группировки / без категории
+    name: str
+    color: Optional[str] = None
+    values: List[float]
+    total: float
+
+
+class AnalyticsSeriesResponse(BaseModel):
+    bucket: str
+    date_from: date
+    date_to: date
+    buckets: List[date]  # начала корзин (день, понедельник недели, 1-е число месяца/года)
+    series: List[AnalyticsSeries]
     
 class TransactionsCategoriesEnum(str, Enum):
     # Поступления (receipts)
@@ -426,7 +478,8 @@ class ProjectResponseWithTotal(BaseModel):
         total:int
 
 class RepeatOperationOut(BaseModel):
-    id:int
+    id: Optional[int] = None  # None — повторение правила, которое ещё не выполнено
+    rule_id: Optional[int] = None  # Правило повтора, к которому относится операция
     balance: Decimal
     moded: Optional[str] = None  # Тип операции, может быть None
     completed: Optional[bool] = False  # Статус выполнения операции
@@ -454,8 +507,47 @@ class CreateRepeatOperation(BaseModel):
     limit_id: Optional[int] = Field(None, description="ID лимита")
     task_id: Optional[int] = Field(None, description="ID задачи")
     interval: RepeatInterval = Field(..., example="day",  description="Интервал повторения day, week, month, year")
-    count: int = Field(default=5, description="Количество повторений операции")
+    count: Optional[int] = Field(default=5, gt=0, description="Количество повторений операции (null — без ограничения)")
+    until: Optional[date] = Field(None, example="2026-06-09", description="Дата, после которой повторений нет")
     
+class UpdateRepeatSeries(BaseModel):
+    # Передаются только изменяемые поля; category_id/debt_id/target_id/limit_id/task_id = null — отвязать
+    balance: Optional[Decimal] = Field(None, example=1000)
+    moded: Optional[TransactionsTypeEnum] = Field(None, example="income")
+    name: Optional[str] = Field(None, example="Зарплата")
+    account_id: Optional[int] = Field(None, example=1)
+    category_id: Optional[int] = Field(None, example=1)
+    debt_id: Optional[int] = Field(None, example=None)
+    target_id: Optional[int] = Field(None, example=None)
+    limit_id: Optional[int] = Field(None, example=None)
+    task_id: Optional[int] = Field(None, example=None)
+
+class RepeatSeriesOut(BaseModel):
+    rule_id: int  # Правило, к которому относятся повторения начиная с from_date
+    updated: int  # Сколько невыполненных операций изменено
+
+# Повторение правила, у которого ещё нет id
+class RepeatOccurrenceRef(BaseModel):
+    rule_id: int = Field(..., example=1)
+    planned_date: date = Field(..., example="2025-06-09")
+
+class CompleteRepeatOperations(BaseModel):
+    ids: List[int] = Field(default_factory=list, example=[1, 2, 3])
+    occurrences: List[RepeatOccurrenceRef] = Field(default_factory=list)
+
+# Результат одного элемента пакетного выполнения операций на повтор
+class RepeatCompleteItemResult(BaseModel):
+    id: Optional[int] = None  # id операции (для повторения правила — созданной строки)
+    rule_id: Optional[int] = None
+    planned_date: Optional[date] = None
+    status_code: int  # 200 — выполнена, иначе код ошибки, как у одиночного выполнения
+    error: Optional[str] = None
+
+class RepeatCompleteBatchResponse(BaseModel):
+    completed: int
+    failed: int
+    results: List[RepeatCompleteItemResult]
+
 class RepeatOperationListOut(BaseModel):
     total: int
     reapits: List[RepeatOperationOut]  # Список операций повторения
\ No newline at end of file
@@ -0,0 +1,32 @@
+"""
+Перенос старых транзакций и выполненных операций на повторе в архивные таблицы.
+Горизонты и размер пачки — ARCHIVE_TRANSACTIONS_AFTER_DAYS, ARCHIVE_REPEAT_OPERATIONS_AFTER_DAYS,
+ARCHIVE_BATCH_SIZE (см. routers/archive.py).
+
+Запуск (из корня проекта):
+    python scripts/archive_old_rows.py
+"""
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from db import SessionLocal
+from routers.archive import archive_old_rows
+
+
+def main():
+    db = SessionLocal()
+    try:
+        result = archive_old_rows(db)
+        print(
+            f"✅ В архив перенесено: транзакций {result['transactions']}, "
+            f"операций на повторе {result['repeat_operations']}; "
+            f"удалено пустых секций {len(result['dropped_partitions'])}"
+        )
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
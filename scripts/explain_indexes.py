@@ -0,0 +1,163 @@
+"""
+EXPLAIN ANALYZE для запросов горячих ручек — до и после индексов
+из миграций f2e16eeb84ff_add_indexes_for_hot_queries, 845e5adaaa38_add_transactions_account_month_index
+и 5d0e8a41c7b2_add_id_to_transactions_account_index.
+
+Запуск (из корня проекта, после `alembic upgrade head`):
+    DATABASE_URL=postgresql://... python scripts/explain_indexes.py [--user-id 1]
+
+«До» снимается внутри транзакции: индексы удаляются, план строится,
+затем транзакция откатывается. DROP INDEX держит эксклюзивную блокировку
+таблицы до отката — запускать на копии/стенде, не на проде.
+"""
+import argparse
+import os
+import sys
+from datetime import datetime, timedelta
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from sqlalchemy import case, func, select, text
+
+from db import engine
+from models import Limits, Project, RepeatOperations, Tasks, Transactions, User
+
+NEW_INDEXES = [
+    'ix_transactions_user_id_created_at',
+    'ix_repeat_operations_user_id_completed_planned_date',
+    'ix_repeat_operations_account_id_planned_date',
+    'ix_repeat_operations_planned_date_pending',
+    'ix_limits_user_id_category_id',
+    'ix_project_user_id_created_at',
+    'ix_tasks_project_id_completed_date_end',
+    'ix_tasks_date_end',
+    'ix_users_payment_expires_at_active',
+    'ix_transactions_user_id_account_id_created_at_id',
+]
+
+
+def pick_sample(conn, user_id=None):
+    """Пользователь с наибольшим числом транзакций и его самые «тяжёлые» счёт/проект/категория лимита"""
+    if user_id is None:
+        user_id = conn.scalar(
+            select(Transactions.user_id)
+            .group_by(Transactions.user_id)
+            .order_by(func.count().desc())
+            .limit(1)
+        )
+    account_id = conn.scalar(
+        select(RepeatOperations.account_id)
+        .where(RepeatOperations.user_id == user_id)
+        .group_by(RepeatOperations.account_id)
+        .order_by(func.count().desc())
+        .limit(1)
+    )
+    project_id = conn.scalar(select(Project.id).where(Project.user_id == user_id).limit(1))
+    category_id = conn.scalar(select(Limits.category_id).where(Limits.user_id == user_id).limit(1))
+    return user_id, account_id, project_id, category_id
+
+
+def build_queries(user_id, account_id, project_id, category_id):
+    now = datetime.now()
+    start_of_day = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    return {
+        "GET /transactions/all": (
+            select(Transactions)
+            .where(Transactions.user_id == user_id)
+            .order_by(Transactions.created_at.desc())
+            .limit(20)
+        ),
+        "GET /users/finance": (
+            select(
+                func.sum(case((Transactions.moded == 'income', Transactions.sum), else_=0)),
+                func.sum(case((Transactions.moded == 'expense', Transactions.sum), else_=0)),
+            ).where(
+                Transactions.user_id == user_id,
+                Transactions.account_id == account_id,
+                Transactions.created_at >= start_of_day.replace(day=1),
+                Transactions.created_at < now,
+            )
+        ),
+        "GET /operationsrepeat/": (
+            select(RepeatOperations)
+            .where(RepeatOperations.user_id == user_id, RepeatOperations.completed == False)
+            .order_by(RepeatOperations.planned_date.asc())
+            .limit(20)
+        ),
+        "GET /balance_forecast/generate": (
+            select(RepeatOperations)
+            .where(
+                RepeatOperations.account_id == account_id,
+                RepeatOperations.user_id == user_id,
+                RepeatOperations.planned_date >= now,
+                RepeatOperations.planned_date <= now + timedelta(days=90),
+            )
+        ),
+        "scheduler: repeat_operation": (
+            select(RepeatOperations)
+            .where(
+                RepeatOperations.planned_date >= start_of_day,
+                RepeatOperations.planned_date < start_of_day + timedelta(days=1),
+                RepeatOperations.completed == False,
+            )
+        ),
+        "POST /transactions/create (limit)": (
+            select(Limits).where(Limits.category_id == category_id, Limits.user_id == user_id)
+        ),
+        "GET /tasks/current": (
+            select(Tasks)
+            .join(Project)
+            .where(Project.user_id == user_id, Tasks.date_end >= now, Tasks.completed == False)
+            .order_by(Tasks.date_end.asc())
+            .limit(10)
+        ),
+        "GET /tasks/by-project": select(Tasks).where(Tasks.project_id == project_id),
+        "scheduler: remove_payment": (
+            select(User).where(User.payment_expires_at <= now, User.payment_is_active == True)
+        ),
+    }
+
+
+def explain(conn, stmt):
+    compiled = stmt.compile(dialect=conn.dialect)
+    rows = conn.exec_driver_sql(
+        "EXPLAIN (ANALYZE, BUFFERS) " + compiled.string, compiled.params
+    ).all()
+    return "\n".join(row[0] for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", type=int, default=None, help="ID пользователя для параметров запросов")
+    args = parser.parse_args()
+
+    with engine.connect() as conn:
+        sample = pick_sample(conn, args.user_id)
+        print(f"user_id={sample[0]} account_id={sample[1]} project_id={sample[2]} category_id={sample[3]}")
+        queries = build_queries(*sample)
+
+        conn.rollback()
+
+        # Без новых индексов: удаляем их в транзакции и откатываем её
+        before = {}
+        try:
+            for name in NEW_INDEXES:
+                conn.execute(text(f"DROP INDEX IF EXISTS {name}"))
+            for title, stmt in queries.items():
+                before[title] = explain(conn, stmt)
+        finally:
+            conn.rollback()
+
+        # С индексами
+        for title, stmt in queries.items():
+            print("=" * 80)
+            print(title)
+            print("-" * 35 + " до " + "-" * 35)
+            print(before[title])
+            print("-" * 34 + " после " + "-" * 33)
+            print(explain(conn, stmt))
+        conn.rollback()
+
+
+if __name__ == "__main__":
+    main()
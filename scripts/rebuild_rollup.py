@@ -0,0 +1,32 @@
+"""
+Пересборка transaction_daily_rollup из таблицы транзакций.
+
+Запуск (из корня проекта):
+    python scripts/rebuild_rollup.py              # все пользователи
+    python scripts/rebuild_rollup.py --user-id 1  # один пользователь
+"""
+import argparse
+import os
+import sys
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from db import SessionLocal
+from routers.rollup import rebuild_rollup
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user-id", type=int, default=None, help="Пересобрать только для этого пользователя")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        rows = rebuild_rollup(db, args.user_id)
+        print(f"✅ transaction_daily_rollup пересобран: {rows} строк")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
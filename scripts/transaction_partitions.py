@@ -0,0 +1,41 @@
+"""
+Помесячные секции таблицы transactions.
+
+Запуск (из корня проекта):
+    python scripts/transaction_partitions.py                   # создать секции на ближайшие месяцы
+    python scripts/transaction_partitions.py --ahead 12        # ... на год вперёд
+    python scripts/transaction_partitions.py --detach 2023-05  # отключить секцию за май 2023
+"""
+import argparse
+import os
+import sys
+from datetime import datetime
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from db import SessionLocal
+from routers.partitions import PARTITION_MONTHS_AHEAD, detach_month_partition, ensure_transaction_partitions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ahead", type=int, default=PARTITION_MONTHS_AHEAD, help="На сколько месяцев вперёд создать секции")
+    parser.add_argument("--detach", default=None, help="Месяц ГГГГ-ММ, секцию которого отключить от transactions")
+    args = parser.parse_args()
+
+    db = SessionLocal()
+    try:
+        if args.detach:
+            month = datetime.strptime(args.detach, "%Y-%m").date()
+            name = detach_month_partition(db, month)
+            db.commit()
+            print(f"✅ Секция {name} отключена" if name else "Секции за этот месяц нет")
+            return
+        created = ensure_transaction_partitions(db, args.ahead)
+        print(f"✅ Создано секций: {len(created)} {', '.join(created)}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+"""Один запрос к API — одно соединение из пула: guard_role и эндпоинт делят сессию get_db"""
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from auth.auth import user_auth_cache
+from db import async_engine
+
+pytestmark = pytest.mark.anyio
+
+
+@contextmanager
+def count_checkouts():
+    """Выдачи соединений из пула async_engine за время блока"""
+    checkouts = []
+
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        checkouts.append(connection_record)
+
+    pool = async_engine.sync_engine.pool
+    event.listen(pool, "checkout", on_checkout)
+    try:
+        yield checkouts
+    finally:
+        event.remove(pool, "checkout", on_checkout)
+
+
+@pytest.mark.parametrize("cached_user", [False, True], ids=["cache-miss", "cache-hit"])
+async def test_authenticated_request_checks_out_one_connection(client, current_user, cached_user):
+    if cached_user:
+        user_auth_cache.set(current_user.user_id, current_user)
+
+    with count_checkouts() as checkouts:
+        response = await client.get("/api/transactions/all", params={"limit": 10})
+
+    assert response.status_code == 200
+    assert len(checkouts) == 1
@@ -0,0 +1,59 @@
+"""Разбор выписки и хеши строк — без базы"""
+from decimal import Decimal
+
+from routers.statement_import import ImportStats, import_hash, parse_csv_rows, to_staging_records
+
+ACCOUNT_ID = 1
+
+# Выгрузка без времени: два одинаковых кофе за день — две разные покупки
+STATEMENT = [
+    "Дата;Сумма;Описание",
+    "05.01.2024;-250,00;Кофе",
+    "05.01.2024;-250,00;Кофе",
+    "05.01.2024;-1 200,00;Продукты",
+    "06.01.2024;-250,00;Кофе",
+]
+
+
+def staging_records(lines):
+    stats = ImportStats()
+    records = list(to_staging_records(parse_csv_rows(lines, stats), ACCOUNT_ID, {}, stats))
+    return records, stats
+
+
+def test_parse_csv_rows_keeps_identical_rows():
+    stats = ImportStats()
+    rows = list(parse_csv_rows(STATEMENT, stats))
+
+    assert stats.total_rows == 4
+    assert stats.invalid == 0
+    assert [(row.line, row.amount, row.description) for row in rows] == [
+        (2, Decimal("-250.00"), "Кофе"),
+        (3, Decimal("-250.00"), "Кофе"),
+        (4, Decimal("-1200.00"), "Продукты"),
+        (5, Decimal("-250.00"), "Кофе"),
+    ]
+
+
+def test_identical_rows_in_one_file_get_distinct_hashes():
+    records, _ = staging_records(STATEMENT)
+    hashes = [record[-1] for record in records]
+
+    assert len(set(hashes)) == len(records) == 4
+
+
+def test_import_hash_is_stable_across_reimports():
+    first, _ = staging_records(STATEMENT)
+    second, _ = staging_records(STATEMENT)
+
+    assert [record[-1] for record in first] == [record[-1] for record in second]
+
+
+def test_first_occurrence_keeps_the_plain_content_hash():
+    # Файлы, загруженные до нумерации одинаковых строк, при повторном импорте остаются дублями
+    stats = ImportStats()
+    row = next(parse_csv_rows(STATEMENT, stats))
+    records, _ = staging_records(STATEMENT)
+
+    assert records[0][-1] == import_hash(ACCOUNT_ID, row)
+    assert records[1][-1] == import_hash(ACCOUNT_ID, row, 2)
@@ -0,0 +1,67 @@
+"""Параллельные create_transaction по одному счёту, долгу и цели: ни одно изменение баланса не теряется"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import func, select
+
+from enums import TransactionsTypeEnum
+from models import Accounts, Debts, Targets, Transactions
+from routers.transactions import create_transaction
+from schemas import CreateTransaction
+
+pytestmark = pytest.mark.anyio
+
+# Запросов каждого вида; вместе больше, чем соединений в пуле (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+PARALLEL = 20
+
+
+@pytest.fixture
+def refs(sync_db, current_user):
+    account = Accounts(name="Карта", currency="RUB", balance=1000, user_id=current_user.user_id)
+    sync_db.add(account)
+    sync_db.flush()
+    debt = Debts(
+        name="Долг", who_gave="Иван", date_take="2025-01-01", comments="", balance=150,
+        account_id=account.id, user_id=current_user.user_id,
+    )
+    target = Targets(
+        name="Отпуск", balance_target=10000, balance=0, date_end=datetime.now(timezone.utc) + timedelta(days=30),
+        account_id=account.id, user_id=current_user.user_id,
+    )
+    sync_db.add_all([debt, target])
+    sync_db.commit()
+    return account.id, debt.id, target.id
+
+
+async def create_in_own_session(session_factory, current_user, transaction_data: CreateTransaction):
+    async with session_factory() as db:
+        return await create_transaction(transaction_data=transaction_data, current_user=current_user, db=db)
+
+
+async def test_parallel_create_transaction_keeps_every_balance_change(async_db, sync_db, current_user, refs):
+    account_id, debt_id, target_id = refs
+    income = CreateTransaction(
+        sum=10, moded=TransactionsTypeEnum.income, account_id=account_id, debt_id=debt_id, target_id=target_id
+    )
+    expense = CreateTransaction(sum=3, moded=TransactionsTypeEnum.expense, account_id=account_id, target_id=target_id)
+
+    created = await asyncio.gather(*[
+        create_in_own_session(async_db, current_user, transaction_data)
+        for _ in range(PARALLEL)
+        for transaction_data in (income, expense)
+    ])
+
+    assert len({transaction.id for transaction in created}) == 2 * PARALLEL
+    sync_db.expire_all()
+    account = sync_db.get(Accounts, account_id)
+    debt = sync_db.get(Debts, debt_id)
+    target = sync_db.get(Targets, target_id)
+    assert account.balance == Decimal(1000 + 10 * PARALLEL - 3 * PARALLEL)
+    assert target.balance == Decimal(13 * PARALLEL)
+    # Долг 150 гасится доходами по 10: остаток не уходит в минус, лишнее не засчитывается
+    assert debt.balance == 0
+    assert debt.completed is True
+    assert sync_db.scalar(select(func.sum(Transactions.debt_paid))) == Decimal(150)
+    assert sync_db.scalar(select(func.count()).select_from(Transactions)) == 2 * PARALLEL
@@ -0,0 +1,72 @@
+"""Число запросов GET /transactions/all не зависит от размера страницы (нет N+1 по связям)"""
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import event
+
+from db import async_engine
+from enums import TransactionsTypeEnum
+from models import Accounts, Categories, Debts, Limits, Targets, Transactions
+
+pytestmark = pytest.mark.anyio
+
+TRANSACTIONS = 30
+
+
+@contextmanager
+def capture_statements():
+    """SQL-запросы, выполненные через async_engine за время блока"""
+    statements = []
+
+    def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    engine = async_engine.sync_engine
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture
+def transactions(sync_db, current_user):
+    """У каждой транзакции свои категория с лимитом, цель на своём счёте и долг"""
+    user_id = current_user.user_id
+    for i in range(TRANSACTIONS):
+        account = Accounts(name=f"Счёт {i}", currency="RUB", balance=1000, user_id=user_id)
+        category = Categories(name=f"Категория {i}", color="#fff", type="user",
+                              moded=TransactionsTypeEnum.expense.value, user_id=user_id)
+        sync_db.add_all([account, category])
+        sync_db.flush()
+        limit = Limits(balance=500, date_update="month", category_id=category.id, user_id=user_id)
+        target = Targets(name=f"Цель {i}", balance_target=1000, date_end=datetime(2030, 1, 1, tzinfo=timezone.utc),
+                         account_id=account.id, user_id=user_id)
+        debt = Debts(name=f"Долг {i}", who_gave="Иван", date_take="2025-01-01", comments="", svg="", balance=100,
+                     account_id=account.id, user_id=user_id)
+        sync_db.add_all([limit, target, debt])
+        sync_db.flush()
+        sync_db.add(Transactions(
+            sum=10, currency="RUB", moded=TransactionsTypeEnum.expense.value, balance=990, user_id=user_id,
+            account_id=account.id, category_id=category.id, limit_id=limit.id, target_id=target.id, debt_id=debt.id,
+            created_at=datetime.now(timezone.utc) - timedelta(minutes=i),
+        ))
+    sync_db.commit()
+
+
+async def test_get_all_transactions_query_count_does_not_grow_with_page_size(client, transactions):
+    # Первый запрос кладёт пользователя в кэш guard_role — дальше его строку не читаем
+    assert (await client.get("/api/transactions/all", params={"limit": 1})).status_code == 200
+
+    counts = {}
+    for page_size in (1, 5, TRANSACTIONS):
+        with capture_statements() as statements:
+            response = await client.get("/api/transactions/all", params={"limit": page_size})
+        assert response.status_code == 200
+        assert len(response.json()["transactions"]) == page_size
+        counts[page_size] = len(statements)
+        # Категории и счета грузятся без пользователя (раньше Categories.user и Accounts.user были lazy="joined")
+        assert not any("JOIN users" in statement for statement in statements)
+
+    assert len(set(counts.values())) == 1, counts